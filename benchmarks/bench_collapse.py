@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_collapse.py
+~~~~~~~~~~~~~~~~~
+
+Compares ipset.cidr.collapse with ipaddress.collapse_addresses on a
+synthetic feed of overlapping and adjacent prefixes. No kernel needed.
+"""
+import argparse
+import ipaddress
+import random
+import time
+from ipset import cidr
+
+
+def feed(count, seed):
+    rng = random.Random(seed)
+    keys = []
+    for _ in range(count):
+        prefix = rng.randint(16, 32)
+        addr = rng.getrandbits(32) & ~((1 << (32 - prefix)) - 1)
+        keys.append((addr.to_bytes(4, 'big'), prefix))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    keys = feed(args.count, args.seed)
+
+    start = time.perf_counter()
+    cover = cidr.collapse(keys, 32)
+    fast = time.perf_counter() - start
+
+    nets = [ipaddress.ip_network((int.from_bytes(a, 'big'), p))
+            for a, p in keys]
+    start = time.perf_counter()
+    expected = list(ipaddress.collapse_addresses(nets))
+    slow = time.perf_counter() - start
+
+    assert len(expected) == len(cover)
+    print('prefixes {} -> {}'.format(len(keys), len(cover)))
+    print('ipset.cidr    {:8.3f}s'.format(fast))
+    print('ipaddress     {:8.3f}s'.format(slow))
+
+
+if __name__ == '__main__':
+    main()
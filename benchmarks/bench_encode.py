@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_encode.py
+~~~~~~~~~~~~~~~
+
+Measures element encoding throughput on its own, without any kernel calls.
+
+The legacy path is what IPSet.add used to do for every hash:ip element:
+ipaddress.ip_network, str(), inet_pton and two fresh cffi allocations.
+"""
+import argparse
+import ipaddress
+import time
+from ipset.encode import AddressEncoder
+from ipset.libipset.ipset import ffi, lib
+
+
+def legacy(item):
+    ip_net = ipaddress.ip_network(item)
+    ip = ffi.new("union nf_inet_addr *")
+    if isinstance(ip_net, ipaddress.IPv4Network):
+        af = lib.AF_INET
+    else:
+        af = lib.AF_INET6
+    rc = lib.inet_pton(af, str(ip_net.network_address).encode(), ip)
+    assert rc == 1
+    return ip, ffi.new("uint8_t *", ip_net.prefixlen)
+
+
+def measure(encode, items):
+    start = time.perf_counter()
+    for item in items:
+        encode(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=200000)
+    args = parser.parse_args()
+
+    ints = [0x0a000000 + i for i in range(args.count)]
+    inputs = (
+        ('str', [str(ipaddress.IPv4Address(i)) for i in ints]),
+        ('str/cidr', ['{}/32'.format(ipaddress.IPv4Address(i))
+                      for i in ints]),
+        ('int', ints),
+        ('bytes', [i.to_bytes(4, 'big') for i in ints]),
+        ('ipaddress', [ipaddress.IPv4Address(i) for i in ints]),
+    )
+
+    encoder = AddressEncoder('inet')
+    print('{:<10} {:>14} {:>14}'.format('input', 'legacy el/s', 'fast el/s'))
+    for label, items in inputs:
+        old = measure(legacy, items) if label != 'bytes' else float('nan')
+        new = measure(encoder.encode, items)
+        print('{:<10} {:>14.0f} {:>14.0f}'.format(label, old, new))
+
+
+if __name__ == '__main__':
+    main()
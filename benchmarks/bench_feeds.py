@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_feeds.py
+~~~~~~~~~~~~~~
+
+Measures feed parsing throughput against the number of worker processes.
+
+Writes a synthetic feed of addresses, networks, comments and malformed
+lines, then normalizes it with ipset.feeds for each worker count and
+reports lines per second. With --load, the records are also loaded into
+an in-memory set to include the single writer. No kernel needed.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from ipset.backends.memory import MemoryBackend
+from ipset.feeds import load_feeds, normalize
+from ipset.wrapper import IPSet
+
+
+def write_feed(path, count, seed):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('# synthetic blocklist\n')
+        for i in range(count):
+            r = rng.random()
+            if r < 0.01:
+                f.write('not-an-address-{i}\n'.format(i=i))
+            elif r < 0.1:
+                f.write('{a}.{b}.{c}.0/24 ; listed\n'.format(
+                    a=rng.randint(1, 223), b=rng.randrange(256),
+                    c=rng.randrange(256)))
+            else:
+                f.write('{a}.{b}.{c}.{d}\n'.format(
+                    a=rng.randint(1, 223), b=rng.randrange(256),
+                    c=rng.randrange(256), d=rng.randrange(256)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=2000000)
+    parser.add_argument('--workers', default='0,1,2,4,8',
+                        help='comma separated worker counts')
+    parser.add_argument('--shard-size', type=int, default=4 << 20)
+    parser.add_argument('--load', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        write_feed(path, args.count, args.seed)
+        print('{n} lines, {m:.1f} MiB, {c} CPUs'.format(
+            n=args.count + 1, m=os.path.getsize(path) / 2.0 ** 20,
+            c=os.cpu_count()))
+        for workers in [int(w) for w in args.workers.split(',')]:
+            start = time.perf_counter()
+            if args.load:
+                ipset = IPSet(set_name='bench_feeds', set_type='hash:net',
+                              backend=MemoryBackend(),
+                              expected_size=args.count)
+                records = load_feeds(ipset, [path], workers=workers,
+                                     shard_size=args.shard_size).records
+            else:
+                records = sum(len(shard.records) // 5 for shard in
+                              normalize([path], workers=workers,
+                                        shard_size=args.shard_size))
+            elapsed = time.perf_counter() - start
+            print('workers {w:>2}  {r:>9} records  {t:>7.2f} s  '
+                  '{s:>10.0f} lines/s'.format(w=workers, r=records,
+                                              t=elapsed,
+                                              s=(args.count + 1) / elapsed))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
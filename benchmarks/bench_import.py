@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_import.py
+~~~~~~~~~~~~~~~
+
+Measures the cold start of a short-lived process: the time to import
+ipset.wrapper, the latency of the first call (creating a set and testing
+an element, which sets up the first session) and of a warm call after it.
+
+Every run is a fresh interpreter, so nothing is cached between runs but
+the operating system's page cache. The libipset backend needs root and
+the ip_set kernel module; the in-memory backend shows the Python side
+alone. With -X, each child also reports ``python -X importtime`` for the
+slowest imports of the first run.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from ipset.wrapper import IPSet
+imported = time.perf_counter()
+backend = None
+if sys.argv[1] == 'memory':
+    from ipset.backends.memory import MemoryBackend
+    backend = MemoryBackend()
+myset = IPSet(set_name='bench_import', backend=backend)
+try:
+    first = time.perf_counter()
+    myset.test('10.0.0.1')
+    tested = time.perf_counter()
+    myset.test('10.0.0.2')
+    warm = time.perf_counter()
+finally:
+    myset.destroy()
+print(json.dumps({'import': imported - start, 'first_call': tested - imported,
+                  'first_test': tested - first, 'warm_call': warm - tested}))
+'''
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1,
+                       int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_child(backend):
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', CHILD, backend])
+    sample = json.loads(out.decode())
+    sample['process'] = time.perf_counter() - start
+    return sample
+
+
+def import_profile(limit):
+    """Return the slowest imports of ipset.wrapper, by cumulative time."""
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                          'import ipset.wrapper'],
+                         stderr=subprocess.PIPE, check=True).stderr.decode()
+    rows = []
+    for line in err.splitlines()[1:]:
+        _, self_us, cumulative, name = [f.strip() for f in
+                                        line.replace(':', '|', 1).split('|')]
+        rows.append((int(cumulative), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--backend', choices=('libipset', 'memory'),
+                        default='libipset')
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    parser.add_argument('-X', '--importtime', type=int, default=0,
+                        metavar='N', help='show the N slowest imports')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    samples = [run_child(args.backend) for _ in range(args.runs)]
+    results = {}
+    for key in ('import', 'first_call', 'first_test', 'warm_call', 'process'):
+        values = [sample[key] for sample in samples]
+        results[key] = {'p50': percentile(values, 50),
+                        'p99': percentile(values, 99),
+                        'min': min(values)}
+
+    if args.json:
+        json.dump({'backend': args.backend, 'runs': args.runs,
+                   'results': results}, sys.stdout, indent=2)
+        print()
+    else:
+        for key, stats in results.items():
+            print('{:<12} p50 {:>9.3f} ms   p99 {:>9.3f} ms   min {:>9.3f} ms'
+                  .format(key, stats['p50'] * 1e3, stats['p99'] * 1e3,
+                          stats['min'] * 1e3))
+
+    if args.importtime:
+        print()
+        for cumulative, self_us, name in import_profile(args.importtime):
+            print('{:>9.3f} ms {:>9.3f} ms  {}'.format(cumulative / 1e3,
+                                                     self_us / 1e3, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_session_pool.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Measures add/test throughput with and without session pooling.
+
+Needs root and the ip_set kernel module. A pool with max_size=0 keeps no
+idle sessions, which reproduces the old init/fini-per-call behaviour.
+"""
+import argparse
+import time
+from ipset.pool import SessionPool
+from ipset.wrapper import IPSet
+
+
+def run(pool, count):
+    myset = IPSet(set_name="bench_pool", set_type="hash:ip",
+                  set_family="inet", ignore_existing=True, pool=pool)
+    try:
+        start = time.perf_counter()
+        for i in range(count):
+            myset.add('10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255,
+                                           i & 255))
+        added = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(count):
+            myset.test('10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255,
+                                            i & 255))
+        tested = time.perf_counter() - start
+    finally:
+        myset.destroy()
+        pool.close()
+
+    return count / added, count / tested
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=10000)
+    args = parser.parse_args()
+
+    for label, pool in (('unpooled', SessionPool(max_size=0)),
+                        ('pooled', SessionPool())):
+        add_rate, test_rate = run(pool, args.count)
+        print('{:<10} add {:>10.0f} ops/s   test {:>10.0f} ops/s'
+              .format(label, add_rate, test_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_snapshot.py
+~~~~~~~~~~~~~~~~~
+
+Compares reloading a set from a plain-text dump (one "add" line per
+element, parsed and loaded in batches with add_many) with IPSet.restore
+from a binary snapshot. All sets are created with expected_size set to
+the element count, so neither side pays for hash resizes.
+
+Needs root and the ip_set kernel module.
+"""
+import argparse
+import os
+import tempfile
+import time
+from ipset.wrapper import IPSet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    source = IPSet(set_name='bench_snap', set_type='hash:ip',
+                   ignore_existing=True, expected_size=args.count)
+    workdir = tempfile.mkdtemp()
+    text_path = os.path.join(workdir, 'dump.txt')
+    snap_path = os.path.join(workdir, 'dump.snap')
+    try:
+        source.add_many(0x0a000000 + i for i in range(args.count))
+
+        with open(text_path, 'w') as f:
+            for elem in source.iter_elements():
+                f.write('add bench_text {}\n'.format(elem))
+        start = time.perf_counter()
+        count = source.snapshot(snap_path)
+        saved = time.perf_counter() - start
+        snap_size = os.path.getsize(snap_path)
+
+        text = IPSet(set_name='bench_text', set_type='hash:ip',
+                     ignore_existing=True, expected_size=count)
+        start = time.perf_counter()
+        with open(text_path) as f:
+            text.add_many(line.split()[2] for line in f)
+        text_time = time.perf_counter() - start
+        text.destroy()
+
+        start = time.perf_counter()
+        restored = IPSet.restore(snap_path, set_name='bench_bin',
+                                 expected_size=count)
+        binary_time = time.perf_counter() - start
+        restored.destroy()
+    finally:
+        source.destroy()
+        for path in (text_path, snap_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        os.rmdir(workdir)
+
+    print('elements          {}'.format(count))
+    print('snapshot size     {} bytes'.format(snap_size))
+    print('snapshot save     {:8.3f}s'.format(saved))
+    print('text restore      {:8.3f}s'.format(text_time))
+    print('binary restore    {:8.3f}s'.format(binary_time))
+
+
+if __name__ == '__main__':
+    main()
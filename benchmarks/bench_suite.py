@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+bench_suite.py
+~~~~~~~~~~~~~~
+
+Measures throughput and p50/p99 latency of add, remove, test, list_get,
+swap and destroy for hash:ip, hash:net and IPv6 hash:ip sets of several
+sizes, and writes the results as JSON.
+
+Runs against libipset or the direct netlink engine (both need root and
+the ip_set kernel module), or the in-memory backend. With --baseline,
+results are compared with an earlier run and the script exits non-zero
+if the p50 of any operation regressed by more than --threshold.
+
+Sets are created with expected_size set to their size, so the kernel
+sizes them up front instead of resizing during the load.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from ipset.wrapper import IPSet
+
+CASES = {
+    'hash:ip': ('hash:ip', 'inet'),
+    'hash:net': ('hash:net', 'inet'),
+    'hash:ip6': ('hash:ip', 'inet6'),
+}
+
+
+def elements(case, start, count):
+    """Return ``count`` distinct elements of a case, from index start."""
+    if case == 'hash:net':
+        return [(0x10000000 + (i << 8), 24)
+                for i in range(start, start + count)]
+    if case == 'hash:ip6':
+        return [(0x20010db8 << 96) + i for i in range(start, start + count)]
+    return [0x0a000000 + i for i in range(start, start + count)]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1,
+                       int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(case, size, op, samples):
+    total = sum(samples)
+    return {
+        'case': case,
+        'size': size,
+        'op': op,
+        'calls': len(samples),
+        'total': total,
+        'ops_per_sec': len(samples) / total if total else None,
+        'mean': total / len(samples),
+        'p50': percentile(samples, 50),
+        'p99': percentile(samples, 99),
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def make_set(name, case, size, backend):
+    set_type, family = CASES[case]
+    ipset = IPSet(set_name=name, set_type=set_type, set_family=family,
+                  backend=backend, expected_size=size)
+    if size:
+        ipset.add_many(elements(case, 0, size))
+    return ipset
+
+
+def run_case(case, size, args, backend):
+    results = []
+    ipset = make_set('bench_suite', case, size, backend)
+    try:
+        calls = min(args.calls, size)
+
+        new = elements(case, size, calls)
+        results.append(summarize(case, size, 'add',
+                                 [timed(ipset.add, item) for item in new]))
+        results.append(summarize(case, size, 'remove',
+                                 [timed(ipset.remove, item) for item in new]))
+
+        present = elements(case, 0, size)
+        picks = [random.choice(present) for _ in range(calls)]
+        del present
+        results.append(summarize(case, size, 'test',
+                                 [timed(ipset.test, item) for item in picks]))
+
+        results.append(summarize(case, size, 'list_get',
+                                 [timed(ipset.list_get)
+                                  for _ in range(args.repeat)]))
+
+        other = make_set('bench_suite_swap', case, size, backend)
+        try:
+            results.append(summarize(case, size, 'swap',
+                                     [timed(IPSet.swap, ipset, other)
+                                      for _ in range(args.repeat)]))
+        finally:
+            other.destroy()
+    finally:
+        ipset.destroy()
+
+    # Destroying is measured on freshly populated sets of the same size.
+    samples = []
+    for _ in range(args.repeat):
+        samples.append(timed(make_set('bench_suite', case, size,
+                                      backend).destroy))
+    results.append(summarize(case, size, 'destroy', samples))
+    return results
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the p50 change per operation and return the regressions."""
+    before = dict(((r['case'], r['size'], r['op']), r)
+                  for r in baseline['results'])
+    regressions = []
+    for r in results:
+        old = before.get((r['case'], r['size'], r['op']))
+        if old is None:
+            continue
+        change = r['p50'] / old['p50'] - 1 if old['p50'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(r)
+            flag = '  REGRESSION'
+        print('{c:9} {s:>8} {o:9} p50 {b:10.2f}us -> {a:10.2f}us {p:+7.1%}{f}'
+              .format(c=r['case'], s=r['size'], o=r['op'],
+                      b=old['p50'] * 1e6, a=r['p50'] * 1e6, p=change, f=flag),
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--backend', choices=('libipset', 'netlink', 'memory'),
+                        default='memory')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated seconds per call (memory backend)')
+    parser.add_argument('--sizes', default='1000,100000,1000000',
+                        help='comma separated set sizes')
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help='comma separated subset of ' + ', '.join(CASES))
+    parser.add_argument('--calls', type=int, default=1000,
+                        help='timed add/remove/test calls per set')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed list_get/swap/destroy calls per set')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write JSON here, not stdout')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative p50 increase')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.backend == 'memory':
+        from ipset.backends.memory import MemoryBackend
+        backend = MemoryBackend(latency=args.latency)
+    else:
+        from ipset.backends import default_backend
+        backend = default_backend(args.backend)
+
+    results = []
+    for case in args.cases.split(','):
+        if case not in CASES:
+            parser.error('unknown case {c!r}'.format(c=case))
+        for size in (int(s) for s in args.sizes.split(',')):
+            results.extend(run_case(case, size, args, backend))
+
+    report = {
+        'meta': {
+            'backend': args.backend,
+            'latency': args.latency,
+            'revision': revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+stress_list.py
+~~~~~~~~~~~~~~
+
+Lists several sets concurrently from a thread pool and checks that every
+listing holds exactly its own set's elements, i.e. that output captured
+for one session never leaks into another.
+
+Needs root and the ip_set kernel module.
+"""
+import argparse
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+from ipset.pool import SessionPool
+from ipset.wrapper import IPSet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--sets', type=int, default=8)
+    parser.add_argument('--size', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    pool = SessionPool(max_size=args.sets)
+    sets = {}
+    for i in range(args.sets):
+        myset = IPSet(set_name='stress{}'.format(i), set_type='hash:ip',
+                      ignore_existing=True, pool=pool)
+        base = int(ipaddress.IPv4Address('10.{}.0.0'.format(i)))
+        expected = set(str(ipaddress.IPv4Address(base + n))
+                       for n in range(args.size))
+        myset.add_many(expected)
+        sets[myset] = expected
+
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.sets) as executor:
+            for _ in range(args.rounds):
+                jobs = dict((executor.submit(s.list_get), s) for s in sets)
+                for job, myset in jobs.items():
+                    if set(job.result()) != sets[myset]:
+                        failures += 1
+    finally:
+        for myset in sets:
+            myset.destroy()
+        pool.close()
+
+    print('{} listings, {} mismatched'.format(args.sets * args.rounds,
+                                              failures))
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
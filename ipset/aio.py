@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+aio.py
+~~~~~~
+
+An asyncio front end for IPSet.
+
+Commands are queued to dedicated worker threads, so the event loop never
+blocks on netlink. The workers reuse long-lived sessions from the set's
+pool, and adds that pile up in the queue are sent as one batched commit.
+
+With several workers, commands still take effect in the order they were
+submitted: a write (add, remove, swap) waits for every command before it,
+and a read (test, list) only for the writes before it, so reads run side
+by side.
+"""
+import asyncio
+import functools
+import queue
+import threading
+from .wrapper import IPSet, IPSetError, DEFAULT_BATCH_SIZE
+
+_STOP = object()
+
+# Commands that change the set; the others only read it.
+_WRITES = ('add', 'remove', 'swap')
+
+
+class _Job(object):
+
+    __slots__ = ('op', 'args', 'future', 'loop', 'seq', 'after')
+
+    def __init__(self, op, args, future, loop, seq, after):
+        self.op = op
+        self.args = args
+        self.future = future
+        self.loop = loop
+        # The job runs once every job numbered up to after is done.
+        self.seq = seq
+        self.after = after
+
+    def resolve(self, result=None, error=None):
+        self.loop.call_soon_threadsafe(self._set, result, error)
+
+    def _set(self, result, error):
+        if self.future.cancelled():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class AsyncIPSet(object):
+
+    def __init__(self, ipset, workers=1, max_batch=DEFAULT_BATCH_SIZE):
+        if workers < 1:
+            raise ValueError('workers must be positive')
+
+        self._ipset = ipset
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._order = threading.Condition()
+        self._submitted = 0
+        self._last_write = -1
+        # Every job numbered below _done_below is done.
+        self._done_below = 0
+        self._done = set()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      name='ipset-{n}-{i}'.format(
+                                          n=ipset.name, i=i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    @classmethod
+    async def create(cls, *args, workers=1, max_batch=DEFAULT_BATCH_SIZE,
+                     **kwargs):
+        loop = asyncio.get_running_loop()
+        ipset = await loop.run_in_executor(
+            None, functools.partial(IPSet, *args, **kwargs))
+        return cls(ipset, workers=workers, max_batch=max_batch)
+
+    @property
+    def ipset(self):
+        return self._ipset
+
+    @property
+    def name(self):
+        return self._ipset.name
+
+    def _submit(self, op, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._order:
+            seq = self._submitted
+            self._submitted += 1
+            if op in _WRITES:
+                after = seq - 1
+                self._last_write = seq
+            else:
+                after = self._last_write
+            self._queue.put(_Job(op, args, future, loop, seq, after))
+        return future
+
+    def add(self, item):
+        return self._submit('add', item)
+
+    def remove(self, item):
+        return self._submit('remove', item)
+
+    def test(self, item):
+        return self._submit('test', item)
+
+    def list(self):
+        return self._submit('list_get')
+
+    def swap(self, other):
+        if isinstance(other, AsyncIPSet):
+            other = other.ipset
+        return self._submit('swap', other)
+
+    def _work(self):
+        carry = None
+        while True:
+            job = carry if carry is not None else self._queue.get()
+            carry = None
+            if job is _STOP:
+                return
+
+            if job.op != 'add':
+                self._run(job)
+                continue
+
+            batch = [job]
+            while len(batch) < self._max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                # A job another worker holds may come in between.
+                if job is _STOP or job.op != batch[0].op or \
+                        job.seq != batch[-1].seq + 1:
+                    carry = job
+                    break
+                batch.append(job)
+            self._run_batch(batch)
+
+    def _wait(self, job):
+        with self._order:
+            self._order.wait_for(lambda: self._done_below > job.after)
+
+    def _finish(self, jobs):
+        with self._order:
+            self._done.update(job.seq for job in jobs)
+            while self._done_below in self._done:
+                self._done.remove(self._done_below)
+                self._done_below += 1
+            self._order.notify_all()
+
+    def _run(self, job):
+        self._wait(job)
+        try:
+            self.__call(job)
+        finally:
+            self._finish((job,))
+
+    def __call(self, job):
+        try:
+            if job.op == 'swap':
+                result = IPSet.swap(self._ipset, *job.args)
+            else:
+                result = getattr(self._ipset, job.op)(*job.args)
+        except Exception as e:
+            job.resolve(error=e)
+        else:
+            job.resolve(result)
+
+    def _run_batch(self, batch):
+        if len(batch) == 1:
+            return self._run(batch[0])
+
+        self._wait(batch[0])
+        try:
+            self.__add_batch(batch)
+        finally:
+            self._finish(batch)
+
+    def __add_batch(self, batch):
+        try:
+            result = self._ipset.add_many([job.args[0] for job in batch],
+                                          batch_size=len(batch),
+                                          keep_going=True)
+        except Exception as e:
+            for job in batch:
+                job.resolve(error=e)
+            return
+        # Only the jobs whose element failed report an error.
+        errors = dict((failure.lineno - 1, failure)
+                      for failure in result.failures)
+        for i, job in enumerate(batch):
+            failure = errors.get(i)
+            if failure is None:
+                job.resolve()
+            else:
+                job.resolve(error=IPSetError(failure.message,
+                                             self._ipset.name, 'add',
+                                             [failure]))
+
+    async def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        loop = asyncio.get_running_loop()
+        for thread in self._threads:
+            await loop.run_in_executor(None, thread.join)
+        self._threads = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+algebra.py
+~~~~~~~~~~
+
+Union, intersection and difference of address sets as interval lists.
+
+A set's contents are read as sorted, disjoint ``(first, last)`` address
+ranges held in two packed columns, and operations merge the columns in
+a single pass. Every element is the block of addresses it matches, so
+the semantics are those of CIDR: 10.0.0.0/8 minus 10.1.0.0/16 leaves
+the rest of 10.0.0.0/8, and a host address of a hash:ip set is part of
+any hash:net network that contains it. Results are cut back into the
+fewest CIDR blocks, or into single addresses for sets that only take
+those, and handed over as packed records.
+"""
+from array import array
+from . import cidr
+from .snapshot import PackedRecords
+
+
+def _column(maxlen):
+    # IPv4 addresses fit in a packed array, IPv6 ones stay Python ints.
+    return array('I') if maxlen <= 32 else []
+
+
+class Intervals(object):
+    """Sorted, disjoint and non-adjacent inclusive address ranges."""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.firsts = _column(maxlen)
+        self.lasts = _column(maxlen)
+
+    @classmethod
+    def from_keys(cls, keys, maxlen):
+        """Build Intervals from ``(packed, prefixlen)`` keys in any order."""
+        # One int per key sorts in far less memory than tuples.
+        starts = sorted(int.from_bytes(packed, 'big') << 8 | prefix
+                        for packed, prefix in keys)
+        result = cls(maxlen)
+        for start in starts:
+            first = start >> 8
+            result.append(first,
+                          first | ((1 << (maxlen - (start & 0xff))) - 1))
+        return result
+
+    @classmethod
+    def from_elements(cls, encoder, elements, netmask=None):
+        """Build Intervals from listed elements.
+
+        With a netmask, as for hash:ip, every element stands for its whole
+        block of addresses.
+        """
+        keys = (encoder.pack(elem) for elem in elements)
+        if netmask is not None:
+            netmask = int(netmask)
+            keys = ((packed, min(prefix, netmask)) for packed, prefix in keys)
+        return cls.from_keys(keys, encoder.maxlen)
+
+    def append(self, first, last):
+        """Add a range starting at or after the start of the last one."""
+        lasts = self.lasts
+        if lasts and first <= lasts[-1] + 1:
+            if last > lasts[-1]:
+                lasts[-1] = last
+        else:
+            self.firsts.append(first)
+            lasts.append(last)
+
+    def __len__(self):
+        return len(self.firsts)
+
+    def __iter__(self):
+        return zip(self.firsts, self.lasts)
+
+    @property
+    def addresses(self):
+        return sum(last - first + 1 for first, last in self)
+
+    def union(self, other):
+        result = Intervals(self.maxlen)
+        mine, theirs = iter(self), iter(other)
+        a, b = next(mine, None), next(theirs, None)
+        while a is not None or b is not None:
+            if b is None or a is not None and a[0] <= b[0]:
+                result.append(*a)
+                a = next(mine, None)
+            else:
+                result.append(*b)
+                b = next(theirs, None)
+        return result
+
+    def intersection(self, other):
+        result = Intervals(self.maxlen)
+        firsts, lasts = other.firsts, other.lasts
+        count = len(firsts)
+        j = 0
+        for first, last in self:
+            while j < count and lasts[j] < first:
+                j += 1
+            # Ranges of other overlapping this one; the last of them may
+            # still overlap the next.
+            k = j
+            while k < count and firsts[k] <= last:
+                result.append(max(first, firsts[k]), min(last, lasts[k]))
+                if lasts[k] > last:
+                    break
+                k += 1
+        return result
+
+    def difference(self, other):
+        result = Intervals(self.maxlen)
+        firsts, lasts = other.firsts, other.lasts
+        count = len(firsts)
+        j = 0
+        for first, last in self:
+            while j < count and lasts[j] < first:
+                j += 1
+            k = j
+            while k < count and firsts[k] <= last:
+                if firsts[k] > first:
+                    result.append(first, firsts[k] - 1)
+                first = lasts[k] + 1
+                if first > last:
+                    break
+                k += 1
+            if first <= last:
+                result.append(first, last)
+        return result
+
+    def keys(self, hosts=False):
+        """Yield the fewest ``(packed, prefixlen)`` CIDR blocks covering
+        the ranges, in order, or every address in them with hosts."""
+        if not hosts:
+            return cidr.cover(self, self.maxlen)
+        size = self.maxlen // 8
+        return ((addr.to_bytes(size, 'big'), self.maxlen)
+                for first, last in self for addr in range(first, last + 1))
+
+    def records(self, hosts=False):
+        """Return the keys as PackedRecords."""
+        size = self.maxlen // 8
+        data = bytearray()
+        for packed, prefix in self.keys(hosts):
+            data += packed
+            data.append(prefix)
+        return PackedRecords(data, size)
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+arrays.py
+~~~~~~~~~
+
+NumPy input and output for address sets.
+
+IPv4 addresses are ``uint32`` arrays in host order, IPv6 addresses are
+``(N, 16) uint8`` arrays in network order, and prefix lengths are ``uint8``
+arrays. NumPy is optional: only these functions need it, and it is only
+imported when one of them is first called.
+"""
+numpy = None
+
+
+def require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('NumPy is required for array operations')
+    return numpy
+
+
+class ArrayElements(object):
+    """Elements read straight from array buffers, addressed by index.
+
+    Values that do not fit their field, such as a negative address or a
+    prefix length over the family's, are refused by ``key()`` and
+    ``encode()`` with a ValueError, so that bulk operations report them
+    as failed elements instead of sending a wrapped-around address.
+    """
+
+    def __init__(self, encoder, addrs, prefixes=None):
+        numpy = require_numpy()
+        self._encoder = encoder
+        self._size = encoder.size
+        self._invalid = {}
+
+        addrs = numpy.asarray(addrs)
+        if encoder.size == 4:
+            if addrs.ndim != 1:
+                raise ValueError('IPv4 addresses must be a 1-D uint32 array')
+            bad = self.__out_of_range(addrs, 0xffffffff)
+            self.__refuse(bad, addrs, 'IPv4 address out of range: {v}')
+            addrs = numpy.where(bad, 0, addrs)
+            addrs = numpy.ascontiguousarray(addrs, dtype='>u4')
+        else:
+            if addrs.ndim != 2 or addrs.shape[1] != 16:
+                raise ValueError('IPv6 addresses must be an (N, 16) array')
+            bad = self.__out_of_range(addrs, 0xff)
+            rows = bad.any(axis=1)
+            self.__refuse(rows, addrs, 'IPv6 address bytes out of range: {v}')
+            addrs = numpy.where(bad, 0, addrs)
+            addrs = numpy.ascontiguousarray(addrs, dtype=numpy.uint8)
+        # Keep references so the buffers outlive the cffi views.
+        self._addrs = addrs.view(numpy.uint8).reshape(-1)
+        self._count = len(addrs)
+        self._src = None
+
+        self._prefixes = None
+        if prefixes is not None:
+            prefixes = numpy.asarray(prefixes)
+            if prefixes.shape != (self._count,):
+                raise ValueError('Expected {n} prefix lengths'
+                                 .format(n=self._count))
+            bad = self.__out_of_range(prefixes, encoder.maxlen)
+            self.__refuse(bad, prefixes, 'Prefix length out of range: {v}')
+            prefixes = numpy.where(bad, 0, prefixes)
+            self._prefixes = numpy.ascontiguousarray(prefixes,
+                                                     dtype=numpy.uint8)
+
+    @staticmethod
+    def __out_of_range(values, maximum):
+        if values.dtype.kind not in 'buif':
+            raise ValueError('Expected an array of integers, got {t}'
+                             .format(t=values.dtype))
+        bad = (values < 0) | (values > maximum)
+        if values.dtype.kind == 'f':
+            bad |= values != numpy.floor(values)
+        return bad
+
+    def __refuse(self, bad, values, message):
+        for index in numpy.flatnonzero(bad).tolist():
+            self._invalid.setdefault(index, message.format(
+                v=values[index].tolist()))
+
+    def __len__(self):
+        return self._count
+
+    def __check(self, index):
+        message = self._invalid.get(index)
+        if message is not None:
+            raise ValueError(message)
+
+    def key(self, index):
+        self.__check(index)
+        start = index * self._size
+        packed = bytes(self._addrs[start:start + self._size])
+        if self._prefixes is None:
+            return packed, self._encoder.maxlen
+        return packed, int(self._prefixes[index])
+
+    def describe(self, index):
+        """Return the key of an element, or its index if it is invalid."""
+        if index in self._invalid:
+            return index
+        return self.key(index)
+
+    def _bind(self):
+        from .libipset.ipset import ffi
+        self._memmove = ffi.memmove
+        if self._prefixes is not None:
+            self._cidrs = ffi.from_buffer("uint8_t[]", self._prefixes)
+        self._src = ffi.from_buffer("uint8_t[]", self._addrs)
+
+    def encode(self, index):
+        self.__check(index)
+        if self._src is None:
+            self._bind()
+        ip, cidr = self._encoder.buffers()
+        self._memmove(ip, self._src + index * self._size, self._size)
+        if self._prefixes is None:
+            cidr[0] = self._encoder.maxlen
+        else:
+            cidr[0] = self._cidrs[index]
+        return ip, cidr
+
+
+def to_arrays(encoder, elements):
+    """Pack listed elements into ``(addresses, prefixes)`` arrays."""
+    numpy = require_numpy()
+    packed = bytearray()
+    prefixes = bytearray()
+    for elem in elements:
+        addr, prefix = encoder.pack(elem)
+        packed += addr
+        prefixes.append(prefix)
+
+    if encoder.size == 4:
+        addrs = numpy.frombuffer(packed, dtype='>u4').astype(numpy.uint32)
+    else:
+        addrs = numpy.frombuffer(packed, dtype=numpy.uint8).reshape(-1, 16)
+    return addrs, numpy.frombuffer(prefixes, dtype=numpy.uint8)
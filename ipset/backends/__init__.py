@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+backends
+~~~~~~~~
+
+Everything IPSet asks of the kernel goes through a backend. The default
+backend drives libipset; the memory backend simulates the kernel in
+process, so code can be tested and benchmarked without root or ip_set.
+"""
+import threading
+
+ENGINES = (
+    'libipset',
+    'netlink',
+)
+
+_defaults = {}
+_default_lock = threading.Lock()
+
+
+class Backend(object):
+    """The operations a backend provides.
+
+    Most methods take the IPSet they act on; the ``*_sets`` methods run
+    one command on each of several sets by name. Bulk methods return a
+    BulkResult; ``*_indexed`` methods take objects with ``len()``,
+    ``key(i)``, ``encode(i)`` and ``describe(i)``, such as ArrayElements
+    and Snapshot. ``describe(i)`` is what a failure reports for element i.
+
+    Commands that fail raise IPSetError. With ``keep_going``, bulk methods
+    instead record each element that failed in the result's ``failures``
+    and carry on with the rest.
+    """
+
+    def create(self, ipset):
+        raise NotImplementedError
+
+    def destroy(self, ipset):
+        raise NotImplementedError
+
+    def swap(self, first_set, second_set):
+        raise NotImplementedError
+
+    def add(self, ipset, item):
+        raise NotImplementedError
+
+    def delete(self, ipset, item):
+        raise NotImplementedError
+
+    def test(self, ipset, item):
+        raise NotImplementedError
+
+    def add_many(self, ipset, items, batch_size, keep_going=False):
+        raise NotImplementedError
+
+    def delete_many(self, ipset, items, batch_size, keep_going=False):
+        raise NotImplementedError
+
+    def add_indexed(self, ipset, elements, batch_size, keep_going=False):
+        raise NotImplementedError
+
+    def delete_indexed(self, ipset, elements, batch_size, keep_going=False):
+        raise NotImplementedError
+
+    def test_indexed(self, ipset, elements):
+        raise NotImplementedError
+
+    def iter_members(self, ipset, queue_size):
+        raise NotImplementedError
+
+    def header(self, ipset):
+        raise NotImplementedError
+
+    def list(self, ipset):
+        raise NotImplementedError
+
+    def headers(self):
+        """Return the SetHeader of every set, from a single listing."""
+        raise NotImplementedError
+
+    def flush_sets(self, names):
+        raise NotImplementedError
+
+    def destroy_sets(self, names):
+        raise NotImplementedError
+
+    def rename_sets(self, renames):
+        """Rename sets, given ``(old_name, new_name)`` pairs."""
+        raise NotImplementedError
+
+    def shares_sets(self, other):
+        """Whether sets of this and the other backend can be swapped."""
+        return other is self
+
+
+def engine_backend(engine, pool=None):
+    if engine == 'libipset':
+        from .libipset import LibipsetBackend
+        return LibipsetBackend(pool)
+    if engine == 'netlink':
+        from .netlink import NetlinkBackend
+        return NetlinkBackend(pool)
+    raise ValueError('Engine should be one of {E}'.format(E=repr(ENGINES)))
+
+
+def resolve_backend(backend=None, engine=None, pool=None):
+    """Return the backend for the arguments IPSet and friends accept."""
+    if backend is not None:
+        if engine is not None:
+            raise ValueError('Pass either a backend or an engine')
+        return backend
+    if pool is not None:
+        return engine_backend(engine or 'libipset', pool)
+    return default_backend(engine or 'libipset')
+
+
+def default_backend(engine='libipset'):
+    with _default_lock:
+        backend = _defaults.get(engine)
+        if backend is None:
+            backend = _defaults[engine] = engine_backend(engine)
+        return backend
@@ -0,0 +1,663 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import queue
+import re
+import threading
+from collections import deque
+from . import Backend
+from ..common import (ADDRESS_TYPES, BulkResult, ElementFailure, IPSetError,
+                      SetHeader, record_failure)
+from ..elements import (FIELDS, mac_address, port_number, protocol,
+                        proto_port, split_element)
+from ..encode import AddressEncoder
+from ..libipset.ipset import ffi, lib
+from ..lib_utils import Output
+from ..metrics import clock, metrics
+from ..pool import default_pool
+
+_DONE = object()
+
+# In restore mode libipset prefixes errors with the line number of the
+# command that failed, as reported by the kernel.
+_LINE_ERROR = re.compile(r'Error in line (\d+): ')
+
+
+def _report(text):
+    if text == ffi.NULL:
+        return ''
+    return ffi.string(text).decode(errors='replace').strip()
+
+
+def _session_error(s):
+    """Return and clear the error reported in a session."""
+    message = _report(lib.ipset_session_error(s))
+    lib.ipset_session_report_reset(s)
+    return message or 'Unknown error'
+
+
+def _check(s, rc, set_name=None, command=None):
+    if rc != 0:
+        raise IPSetError(_session_error(s), set_name, command)
+
+
+def _tested(s, rc, set_name=None):
+    """Return whether a test command found its element.
+
+    libipset turns the kernel's IPSET_ERR_EXIST for a test into a warning
+    that the element is not in the set; any error is raised.
+    """
+    if rc == 0:
+        return True
+    if lib.ipset_session_error(s) == ffi.NULL and \
+            lib.ipset_session_warning(s) != ffi.NULL:
+        lib.ipset_session_report_reset(s)
+        return False
+    _check(s, rc, set_name, 'test')
+
+
+def _stream_chunks(dump, queue_size):
+    # The dump runs inside a single ipset_cmd() call, so it is moved to a
+    # worker thread and its output handed over through a bounded queue.
+    # A full queue stalls the netlink reader instead of buffering the set.
+    chunks = queue.Queue(maxsize=queue_size)
+    abandoned = threading.Event()
+
+    def put(item):
+        while not abandoned.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        try:
+            dump(put)
+        except BaseException as e:
+            put(e)
+        else:
+            put(_DONE)
+
+    worker = threading.Thread(target=produce)
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        abandoned.set()
+
+
+def _iter_members(chunks, set_name):
+    # ElementTree is only needed once something is listed.
+    import xml.etree.ElementTree as ET
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parents = []
+    for chunk in chunks:
+        with metrics.phase(set_name, 'parse'):
+            parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            if elem.tag == "member":
+                yield elem
+                # Detach finished members so the tree never grows.
+                parents[-1].remove(elem)
+    parser.close()
+
+
+class _Batch(object):
+    """The elements of a bulk operation that are waiting for the kernel.
+
+    Elements are keyed by the line number of their command in the session.
+    When the kernel rejects one, the elements before it were applied and
+    the ones after it were not; those are queued to be sent again.
+    """
+
+    def __init__(self, result, keep_going, set_name, command, describe):
+        self.result = result
+        self.keep_going = keep_going
+        self.set_name = set_name
+        self.command = command
+        self.describe = describe
+        self.pending = {}
+        self.retry = deque()
+        self.lineno = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def entries(self, items):
+        """Yield ``(position, item)``, retried elements first."""
+        items = enumerate(items, 1)
+        while True:
+            if self.retry:
+                yield self.retry.popleft()
+                continue
+            entry = next(items, None)
+            if entry is None:
+                return
+            yield entry
+
+    def push(self, position, item):
+        self.lineno += 1
+        self.pending[self.lineno] = (position, item)
+        return self.lineno
+
+    def done(self):
+        self.result.submitted += len(self.pending)
+        self.result.batches += 1
+        self.pending.clear()
+
+    def blame(self, failed, message):
+        """The kernel stopped at the command on line failed."""
+        self.result.batches += 1
+        later = []
+        for lineno, entry in sorted(self.pending.items()):
+            if lineno < failed:
+                self.result.submitted += 1
+            elif lineno > failed:
+                later.append(entry)
+        # They go out again before anything else still waiting.
+        self.retry.extendleft(reversed(later))
+        position, item = self.pending[failed]
+        self.pending.clear()
+        self.fail(position, item, message)
+
+    def fail(self, position, item, message):
+        self.result.submitted += 1
+        if self.describe is not None:
+            item = self.describe(item)
+        record_failure(self.result, ElementFailure(position, item, message),
+                       self.keep_going, self.set_name, self.command)
+
+
+class ElementEncoder(object):
+
+    def __init__(self, set_type, family="inet"):
+        self._fields = FIELDS[set_type]
+        self._addr = AddressEncoder(family)
+        self._addr2 = AddressEncoder(family)
+        self._local = threading.local()
+        self._setters = tuple(getattr(self, '_set_' + kind)
+                              for kind in self._fields)
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @property
+    def address(self):
+        return self._addr
+
+    def _buffer(self, name, ctype):
+        buf = getattr(self._local, name, None)
+        if buf is None:
+            buf = ffi.new(ctype)
+            setattr(self._local, name, buf)
+        return buf
+
+    def set(self, data, item):
+        for setter, part in zip(self._setters,
+                                split_element(self._fields, item)):
+            setter(data, part)
+
+    def _set_net(self, data, part):
+        ip, cidr = self._addr.encode(part)
+        lib.ipset_data_set(data, lib.IPSET_OPT_IP, ip)
+        lib.ipset_data_set(data, lib.IPSET_OPT_CIDR, cidr)
+
+    def _set_ip(self, data, part):
+        ip, cidr = self._addr.encode(part)
+        lib.ipset_data_set(data, lib.IPSET_OPT_IP, ip)
+        if cidr[0] != self._addr.maxlen:
+            lib.ipset_data_set(data, lib.IPSET_OPT_CIDR, cidr)
+
+    def _set_net2(self, data, part):
+        ip, cidr = self._addr2.encode(part)
+        lib.ipset_data_set(data, lib.IPSET_OPT_IP2, ip)
+        lib.ipset_data_set(data, lib.IPSET_OPT_CIDR2, cidr)
+
+    def _set_ip2(self, data, part):
+        ip, cidr = self._addr2.encode(part)
+        lib.ipset_data_set(data, lib.IPSET_OPT_IP2, ip)
+        if cidr[0] != self._addr2.maxlen:
+            lib.ipset_data_set(data, lib.IPSET_OPT_CIDR2, cidr)
+
+    def _set_proto_port(self, data, part):
+        proto, port = proto_port(part)
+        proto_buf = self._buffer('proto', 'uint8_t *')
+        proto_buf[0] = protocol(proto)
+        lib.ipset_data_set(data, lib.IPSET_OPT_PROTO, proto_buf)
+        self._set_port(data, port, proto if isinstance(proto, str) else 'tcp')
+
+    def _set_port(self, data, part, proto='tcp'):
+        port = self._buffer('port', 'uint16_t *')
+        port[0] = port_number(part, proto)
+        lib.ipset_data_set(data, lib.IPSET_OPT_PORT, port)
+
+    def _set_mac(self, data, part):
+        ether = self._buffer('ether', 'unsigned char[6]')
+        ffi.memmove(ether, mac_address(part), 6)
+        lib.ipset_data_set(data, lib.IPSET_OPT_ETHER, ether)
+
+    def _set_mark(self, data, part):
+        mark = self._buffer('mark', 'uint32_t *')
+        mark[0] = part
+        lib.ipset_data_set(data, lib.IPSET_OPT_MARK, mark)
+
+    def _set_iface(self, data, part):
+        lib.ipset_data_set(data, lib.IPSET_OPT_IFACE, part.encode())
+
+    def _set_name(self, data, part):
+        lib.ipset_data_set(data, lib.IPSET_OPT_NAME, part.encode())
+
+
+class LibipsetBackend(Backend):
+
+    def __init__(self, pool=None):
+        self._pool = pool if pool is not None else default_pool
+        self._codecs = {}
+
+    @property
+    def pool(self):
+        return self._pool
+
+    def session(self, exist=False, batched=False):
+        return self._pool.session(lib.IPSET_ENV_EXIST if exist else 0,
+                                  batched)
+
+    def __codec(self, ipset):
+        key = (ipset.type, ipset.family)
+        codec = self._codecs.get(key)
+        if codec is None:
+            codec = self._codecs.setdefault(key, ElementEncoder(*key))
+        return codec
+
+    def shares_sets(self, other):
+        # Every libipset based backend talks to the same kernel.
+        return isinstance(other, LibipsetBackend)
+
+    def create(self, ipset):
+        with self.session(exist=ipset.ignore_existing) as s:
+            rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                  lib.IPSET_SETNAME, ipset.name.encode())
+            _check(s, rc, ipset.name, 'create')
+
+            lib.ipset_data_set(lib.ipset_session_data(s),
+                             lib.IPSET_OPT_TYPENAME, ipset.type.encode())
+
+            t = lib.ipset_type_get(s, lib.IPSET_CMD_CREATE)
+            lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_TYPE, t)
+
+            family_ptr = None
+            if ipset.family == 'inet':
+                family_ptr = ffi.new("int *", lib.NFPROTO_IPV4)
+            elif ipset.family == 'inet6':
+                family_ptr = ffi.new("int *", lib.NFPROTO_IPV6)
+
+            lib.ipset_data_set(lib.ipset_session_data(s),
+                             lib.IPSET_OPT_FAMILY, family_ptr)
+
+            if ipset.netmask is not None:
+                mask = ffi.new("struct in_addr *")
+                mask.s_addr = int(ipset.netmask)
+                lib.ipset_data_set(lib.ipset_session_data(s),
+                                 lib.IPSET_OPT_NETMASK, mask)
+
+            self.__set_create_options(lib.ipset_session_data(s),
+                                      ipset.create_options)
+
+            with metrics.phase(ipset.name, 'cmd'):
+                rc = lib.ipset_cmd(s, lib.IPSET_CMD_CREATE, 0)
+            self.__count(ipset.name, 'create')
+            _check(s, rc, ipset.name, 'create')
+
+    @staticmethod
+    def __set_create_options(data, options):
+        for option, opt in (('hashsize', lib.IPSET_OPT_HASHSIZE),
+                            ('maxelem', lib.IPSET_OPT_MAXELEM),
+                            ('timeout', lib.IPSET_OPT_TIMEOUT)):
+            if option in options:
+                value = ffi.new("uint32_t *", options[option])
+                lib.ipset_data_set(data, opt, value)
+
+        # Flags only need to be present; libipset ignores their value.
+        flag = ffi.new("uint32_t *", 1)
+        for option, opt in (('counters', lib.IPSET_OPT_COUNTERS),
+                            ('comment', lib.IPSET_OPT_CREATE_COMMENT),
+                            ('forceadd', lib.IPSET_OPT_FORCEADD)):
+            if options.get(option):
+                lib.ipset_data_set(data, opt, flag)
+
+    @staticmethod
+    def __set_ip(s, buffers):
+        ip, prefix = buffers
+        lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_IP, ip)
+        lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_CIDR, prefix)
+
+    def __elem_setter(self, ipset):
+        codec = self.__codec(ipset)
+        parse = ipset.type not in ADDRESS_TYPES
+
+        def set_elem(s, item):
+            if parse and isinstance(item, str):
+                _check(s, lib.ipset_parse_elem(s, 1, item.encode()))
+                return
+            try:
+                codec.set(lib.ipset_session_data(s), item)
+            except ValueError:
+                if not isinstance(item, str):
+                    raise
+                # Ranges and networks with host bits set are left to
+                # libipset, which reads any ipset syntax.
+                _check(s, lib.ipset_parse_elem(s, 1, item.encode()))
+        return set_elem
+
+    def __indexed_setter(self, elements):
+        set_ip = self.__set_ip
+        return lambda s, i: set_ip(s, elements.encode(i))
+
+    @staticmethod
+    def __count(set_name, command, elements=None, commands=1):
+        if metrics.enabled:
+            metrics.count(set_name, 'commands', commands, command=command)
+            if elements is not None:
+                metrics.count(set_name, 'elements', elements,
+                              command=command)
+
+    @staticmethod
+    def __prepare(s, ipset, cmd):
+        rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                lib.IPSET_SETNAME, ipset.name.encode())
+        _check(s, rc, ipset.name)
+
+        t = lib.ipset_type_get(s, cmd)
+        lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_TYPE, t)
+
+    def __run(self, s, ipset, cmd, item, command):
+        if not metrics.enabled:
+            self.__prepare(s, ipset, cmd)
+            self.__elem_setter(ipset)(s, item)
+            return lib.ipset_cmd(s, cmd, 0)
+
+        start = clock()
+        self.__prepare(s, ipset, cmd)
+        self.__elem_setter(ipset)(s, item)
+        encoded = clock()
+        rc = lib.ipset_cmd(s, cmd, 0)
+        metrics.observe(ipset.name, 'encode', encoded - start)
+        metrics.observe(ipset.name, 'cmd', clock() - encoded)
+        self.__count(ipset.name, command, 1)
+        return rc
+
+    def add(self, ipset, item):
+        with self.session(exist=ipset.ignore_existing) as s:
+            rc = self.__run(s, ipset, lib.IPSET_CMD_ADD, item, 'add')
+            _check(s, rc, ipset.name, 'add')
+
+    def delete(self, ipset, item):
+        with self.session() as s:
+            rc = self.__run(s, ipset, lib.IPSET_CMD_DEL, item, 'delete')
+            _check(s, rc, ipset.name, 'delete')
+
+    def test(self, ipset, item):
+        with self.session() as s:
+            rc = self.__run(s, ipset, lib.IPSET_CMD_TEST, item, 'test')
+            return _tested(s, rc, ipset.name)
+
+    def __bulk(self, ipset, cmd, set_elem, items, batch_size,
+               keep_going=False, describe=None):
+        # A non-zero line number puts libipset in restore mode: consecutive
+        # ADD/DEL commands on the same set are aggregated into one netlink
+        # message until ipset_commit() sends it, and each carries its line
+        # number so that the kernel can say which one failed.
+        exist = cmd == lib.IPSET_CMD_ADD and ipset.ignore_existing
+        command = 'add' if cmd == lib.IPSET_CMD_ADD else 'delete'
+        timing = metrics.enabled
+        encoding = 0.0
+        result = BulkResult()
+        batch = _Batch(result, keep_going, ipset.name, command, describe)
+        with self.session(exist=exist, batched=True) as s:
+            data = lib.ipset_session_data(s)
+            for position, item in batch.entries(items):
+                if timing:
+                    start = clock()
+                lib.ipset_data_reset(data)
+                try:
+                    self.__prepare(s, ipset, cmd)
+                    set_elem(s, item)
+                except (IPSetError, ValueError, TypeError) as e:
+                    lib.ipset_session_report_reset(s)
+                    batch.fail(position, item, str(e))
+                    continue
+
+                lineno = batch.push(position, item)
+                rc = lib.ipset_cmd(s, cmd, lineno)
+                if timing:
+                    encoding += clock() - start
+                if rc != 0:
+                    self.__recover(s, ipset, cmd, set_elem, batch, lineno)
+                elif len(batch) >= batch_size:
+                    self.__commit(s, ipset, cmd, set_elem, batch, encoding)
+                    encoding = 0.0
+
+            if len(batch):
+                self.__commit(s, ipset, cmd, set_elem, batch, encoding)
+        result.received = result.submitted
+        return result
+
+    def __commit(self, s, ipset, cmd, set_elem, batch, encoding):
+        if not metrics.enabled:
+            rc = lib.ipset_commit(s)
+        else:
+            metrics.observe(ipset.name, 'encode', encoding)
+            start = clock()
+            rc = lib.ipset_commit(s)
+            metrics.observe(ipset.name, 'cmd', clock() - start)
+            self.__count(ipset.name, batch.command, len(batch))
+        if rc != 0:
+            return self.__recover(s, ipset, cmd, set_elem, batch)
+
+        warning = _report(lib.ipset_session_warning(s))
+        if warning:
+            batch.result.warnings.append(warning)
+            lib.ipset_session_report_reset(s)
+        batch.done()
+
+    def __recover(self, s, ipset, cmd, set_elem, batch, lineno=None):
+        message = _session_error(s)
+        match = _LINE_ERROR.match(message)
+        failed = int(match.group(1)) if match else None
+        if failed is None or failed not in batch.pending:
+            # Nothing to tell which commands the kernel got to, so every
+            # pending element is sent again on its own; one the kernel had
+            # already added is then reported as existing.
+            return self.__one_by_one(s, ipset, cmd, set_elem, batch)
+
+        batch.blame(failed, message[match.end():])
+        if failed == lineno:
+            # libipset refused the element itself; the ones before it are
+            # still waiting in the buffer.
+            return self.__commit(s, ipset, cmd, set_elem, batch, 0.0)
+
+    def __one_by_one(self, s, ipset, cmd, set_elem, batch):
+        data = lib.ipset_session_data(s)
+        pending = list(batch.pending.values())
+        batch.pending.clear()
+        batch.result.batches += 1
+        for position, item in pending:
+            lib.ipset_data_reset(data)
+            self.__prepare(s, ipset, cmd)
+            set_elem(s, item)
+            if lib.ipset_cmd(s, cmd, 0) != 0:
+                batch.fail(position, item, _session_error(s))
+            else:
+                batch.result.submitted += 1
+
+    def add_many(self, ipset, items, batch_size, keep_going=False):
+        return self.__bulk(ipset, lib.IPSET_CMD_ADD, self.__elem_setter(ipset),
+                           items, batch_size, keep_going)
+
+    def delete_many(self, ipset, items, batch_size, keep_going=False):
+        return self.__bulk(ipset, lib.IPSET_CMD_DEL, self.__elem_setter(ipset),
+                           items, batch_size, keep_going)
+
+    def add_indexed(self, ipset, elements, batch_size, keep_going=False):
+        return self.__bulk(ipset, lib.IPSET_CMD_ADD,
+                           self.__indexed_setter(elements),
+                           range(len(elements)), batch_size, keep_going,
+                           elements.describe)
+
+    def delete_indexed(self, ipset, elements, batch_size, keep_going=False):
+        return self.__bulk(ipset, lib.IPSET_CMD_DEL,
+                           self.__indexed_setter(elements),
+                           range(len(elements)), batch_size, keep_going,
+                           elements.describe)
+
+    def test_indexed(self, ipset, elements):
+        found = []
+        with self.session() as s:
+            data = lib.ipset_session_data(s)
+            for i in range(len(elements)):
+                lib.ipset_data_reset(data)
+                self.__prepare(s, ipset, lib.IPSET_CMD_TEST)
+                self.__set_ip(s, elements.encode(i))
+                rc = lib.ipset_cmd(s, lib.IPSET_CMD_TEST, 0)
+                found.append(_tested(s, rc, ipset.name))
+        self.__count(ipset.name, 'test', len(found), len(found))
+        return found
+
+    def __dump(self, set_name, sink, envopts=0, command='list'):
+        # Without a set name, the kernel lists every set.
+        with self._pool.session(envopts) as s:
+            if set_name is not None:
+                rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                        lib.IPSET_SETNAME, set_name.encode())
+                _check(s, rc, set_name, command)
+
+            lib.ipset_session_output(s, lib.IPSET_LIST_XML)
+            lib.ipset_session_outfn(s, lib.out_fn)
+
+            if metrics.enabled:
+                sink = self.__counting(set_name, sink, command)
+            with Output.capture(s, sink), metrics.phase(set_name, 'cmd'):
+                rc = lib.ipset_cmd(s, lib.IPSET_CMD_LIST, 0)
+            self.__count(set_name, command)
+            _check(s, rc, set_name, command)
+
+    @staticmethod
+    def __counting(set_name, sink, command):
+        def count(chunk):
+            metrics.count(set_name, 'bytes', len(chunk), command=command)
+            sink(chunk)
+        return count
+
+    def iter_members(self, ipset, queue_size):
+        return _iter_members(_stream_chunks(
+            lambda sink: self.__dump(ipset.name, sink), queue_size), ipset.name)
+
+    def header(self, ipset):
+        # IPSET_CMD_HEADER only reports the type, revision and family, so
+        # the kernel is asked for a header-only listing instead. Either way
+        # the cost does not depend on the number of elements.
+        return self.__headers(ipset.name)[0]
+
+    def headers(self):
+        return self.__headers(None)
+
+    def __headers(self, set_name):
+        chunks = []
+        self.__dump(set_name, chunks.append, lib.IPSET_ENV_LIST_HEADER,
+                    'header')
+        import xml.etree.ElementTree as ET
+        with metrics.phase(set_name, 'parse'):
+            nodes = ET.fromstring("".join(chunks)).findall("ipset")
+        return [SetHeader.from_xml(node) for node in nodes]
+
+    def list(self, ipset):
+        with self.session() as s:
+            rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                  lib.IPSET_SETNAME, ipset.name.encode())
+            _check(s, rc, ipset.name, 'list')
+
+            lib.ipset_session_output(s, lib.IPSET_LIST_PLAIN)
+            rc = lib.ipset_cmd(s, lib.IPSET_CMD_LIST, 0)
+            _check(s, rc, ipset.name, 'list')
+
+    def destroy(self, ipset):
+        with self.session() as s:
+            rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                  lib.IPSET_SETNAME, ipset.name.encode())
+            _check(s, rc, ipset.name, 'destroy')
+
+            t = lib.ipset_type_get(s, lib.IPSET_CMD_DESTROY)
+            lib.ipset_data_set(lib.ipset_session_data(s),
+                             lib.IPSET_OPT_TYPE, t)
+
+            with metrics.phase(ipset.name, 'cmd'):
+                rc = lib.ipset_cmd(s, lib.IPSET_CMD_DESTROY, 0)
+            self.__count(ipset.name, 'destroy')
+            _check(s, rc, ipset.name, 'destroy')
+
+    def swap(self, first_set, second_set):
+        with self.session() as s:
+            rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                  lib.IPSET_SETNAME, first_set.name.encode())
+            _check(s, rc, first_set.name, 'swap')
+
+            t = lib.ipset_type_get(s, lib.IPSET_CMD_SWAP)
+            lib.ipset_data_set(lib.ipset_session_data(s),
+                             lib.IPSET_OPT_TYPE, t)
+
+            rc = lib.ipset_data_set(lib.ipset_session_data(s),
+                                  lib.IPSET_OPT_SETNAME2, second_set.name.encode())
+            _check(s, rc, first_set.name, 'swap')
+
+            with metrics.phase(first_set.name, 'cmd'):
+                rc = lib.ipset_cmd(s, lib.IPSET_CMD_SWAP, 0)
+            self.__count(first_set.name, 'swap')
+            _check(s, rc, first_set.name, 'swap')
+
+    def __each_set(self, cmd, command, names, prepare=None):
+        # One session runs the command for every set in turn.
+        with self.session() as s:
+            data = lib.ipset_session_data(s)
+            for name in names:
+                lib.ipset_data_reset(data)
+                rc = lib.ipset_data_set(data, lib.IPSET_SETNAME,
+                                        name.encode())
+                _check(s, rc, name, command)
+                if prepare is not None:
+                    prepare(s, data, name)
+
+                with metrics.phase(name, 'cmd'):
+                    rc = lib.ipset_cmd(s, cmd, 0)
+                self.__count(name, command)
+                _check(s, rc, name, command)
+
+    def flush_sets(self, names):
+        self.__each_set(lib.IPSET_CMD_FLUSH, 'flush', names)
+
+    def destroy_sets(self, names):
+        def prepare(s, data, name):
+            t = lib.ipset_type_get(s, lib.IPSET_CMD_DESTROY)
+            lib.ipset_data_set(data, lib.IPSET_OPT_TYPE, t)
+        self.__each_set(lib.IPSET_CMD_DESTROY, 'destroy', names, prepare)
+
+    def rename_sets(self, renames):
+        renames = dict(renames)
+
+        def prepare(s, data, name):
+            rc = lib.ipset_data_set(data, lib.IPSET_OPT_SETNAME2,
+                                    renames[name].encode())
+            _check(s, rc, name, 'rename')
+        self.__each_set(lib.IPSET_CMD_RENAME, 'rename', list(renames),
+                        prepare)
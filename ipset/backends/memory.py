@@ -0,0 +1,469 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+memory.py
+~~~~~~~~~
+
+A pure-Python simulation of the kernel's ip_set, for tests and benchmarks.
+
+Sets live in a table per backend and follow the kernel's rules for
+create, add, del, test, list, swap, flush, rename and destroy: adding an
+existing element or deleting a missing one fails with IPSetError unless
+the set ignores existing entries, hash:ip expands IPv4 ranges, rejects
+IPv6 ones and applies its netmask, a host address tests positive against
+any network stored in a hash:net set, and hash sets hold at most maxelem
+elements.
+
+Sets created with counters keep packet and byte counters per element,
+listed like the kernel's. Nothing sends traffic through a simulated set,
+so ``count_traffic()`` stands in for packets matching it.
+
+``latency`` adds a sleep to every round trip to the simulated kernel: once
+per single command, listing or header, and once per committed batch.
+"""
+import threading
+import time
+import xml.etree.ElementTree as ET
+from . import Backend
+from ..common import (ADDRESS_TYPES, DEFAULT_HASHSIZE, DEFAULT_MAXELEM,
+                      MIN_HASHSIZE, BulkResult, ElementFailure, IPSetError,
+                      SetHeader, record_failure)
+from ..elements import (FIELDS, mac_address, port_number, protocol,
+                        proto_port, split_element)
+from ..encode import AddressEncoder, address_blocks, element_keys
+
+# Rough costs of a hash set, used for the reported memsize.
+_BUCKET_OVERHEAD = 8
+_ENTRY_OVERHEAD = 16
+
+_PROTOCOL_NAMES = {
+    1: 'icmp',
+    6: 'tcp',
+    17: 'udp',
+    58: 'ipv6-icmp',
+    132: 'sctp',
+    136: 'udplite',
+}
+
+
+class _MemorySet(object):
+
+    def __init__(self, ipset):
+        self.type = ipset.type
+        self.family = ipset.family
+        self.netmask = ipset.netmask
+        self.encoder = AddressEncoder(ipset.family)
+        self.fields = FIELDS[ipset.type]
+        self.members = {}
+        # Number of stored networks per prefix length, for host lookups.
+        self.prefixes = {}
+
+        options = ipset.create_options
+        self.hashed = ipset.type.startswith('hash:')
+        self.hashsize = None
+        self.maxelem = None
+        if self.hashed:
+            # The kernel rounds the hashsize up to a power of two.
+            hashsize = max(options.get('hashsize', DEFAULT_HASHSIZE),
+                           MIN_HASHSIZE)
+            self.hashsize = 1 << (hashsize - 1).bit_length()
+            self.maxelem = options.get('maxelem', DEFAULT_MAXELEM)
+        self.timeout = options.get('timeout')
+        self.flags = tuple(sorted(flag for flag in
+                                  ('counters', 'comment', 'forceadd')
+                                  if options.get(flag)))
+        self.counters = 'counters' in self.flags
+
+    @property
+    def params(self):
+        """The create parameters an existing set must match.
+
+        Like the kernel, the hashsize is left out: it grows as the set
+        does.
+        """
+        return (self.type, self.family, self.netmask, self.maxelem,
+                self.timeout, self.flags)
+
+    def keys(self, item):
+        if self.type not in ADDRESS_TYPES:
+            return [self.__key(item)]
+        blocks = address_blocks(self.encoder, item)
+        if self.type == 'hash:ip' and self.family == 'inet6' and \
+                any(prefix != self.encoder.maxlen for _, prefix in blocks):
+            # The kernel only expands IPv4 networks and ranges.
+            raise IPSetError('The value of the CIDR parameter of the IP '
+                             'address is invalid')
+        return list(element_keys(self.encoder, self.type, self.netmask,
+                                 blocks))
+
+    def __key(self, item):
+        if isinstance(item, str):
+            parts = item.split(',')
+            if len(parts) != len(self.fields):
+                raise ValueError('Expected {n} components ({f}), got {i!r}'
+                                 .format(n=len(self.fields),
+                                         f=','.join(self.fields), i=item))
+        else:
+            parts = split_element(self.fields, item)
+        return tuple(getattr(self, '_key_' + kind)(part)
+                     for kind, part in zip(self.fields, parts))
+
+    def _key_net(self, part):
+        return self.encoder.pack(part)
+
+    _key_ip = _key_net2 = _key_ip2 = _key_net
+
+    def _key_proto_port(self, part):
+        proto, port = proto_port(part)
+        return (protocol(proto),
+                port_number(port, proto if isinstance(proto, str) else 'tcp'))
+
+    def _key_port(self, part):
+        return port_number(part)
+
+    def _key_mac(self, part):
+        return mac_address(part)
+
+    def _key_mark(self, part):
+        return part if isinstance(part, int) else int(part, 0)
+
+    def _key_iface(self, part):
+        return part
+
+    _key_name = _key_iface
+
+    def render(self, key):
+        if self.type in ADDRESS_TYPES:
+            return self.encoder.unpack(*key)
+        return ','.join(getattr(self, '_render_' + kind)(part)
+                        for kind, part in zip(self.fields, key))
+
+    def _render_net(self, part):
+        return self.encoder.unpack(*part)
+
+    _render_ip = _render_net2 = _render_ip2 = _render_net
+
+    def _render_proto_port(self, part):
+        proto, port = part
+        if proto in (1, 58):
+            return '{p}:{t}/{c}'.format(p=_PROTOCOL_NAMES[proto],
+                                        t=port >> 8, c=port & 0xff)
+        return '{p}:{n}'.format(p=_PROTOCOL_NAMES.get(proto, proto), n=port)
+
+    def _render_mac(self, part):
+        return ':'.join('{b:02X}'.format(b=b) for b in part)
+
+    def _render_port(self, part):
+        return str(part)
+
+    _render_mark = _render_iface = _render_name = _render_port
+
+    def insert(self, key):
+        if key in self.members:
+            return False
+        if self.hashed and len(self.members) >= self.maxelem:
+            if 'forceadd' not in self.flags:
+                raise IPSetError('Hash is full, cannot add more elements')
+            # forceadd evicts a random element; the oldest will do here.
+            self.discard(next(iter(self.members)))
+        # Packet and byte counters, when the set keeps them.
+        self.members[key] = [0, 0] if self.counters else None
+        if self.type == 'hash:net':
+            self.prefixes[key[1]] = self.prefixes.get(key[1], 0) + 1
+        return True
+
+    def discard(self, key):
+        if key not in self.members:
+            return False
+        del self.members[key]
+        if self.type == 'hash:net':
+            self.prefixes[key[1]] -= 1
+            if not self.prefixes[key[1]]:
+                del self.prefixes[key[1]]
+        return True
+
+    def contains(self, key):
+        return self.match(key) is not None
+
+    def match(self, key):
+        """Return the stored key that key matches, or None."""
+        if key in self.members:
+            return key
+        maxlen = self.encoder.maxlen
+        if self.type != 'hash:net' or key[1] != maxlen:
+            return None
+        # Like the kernel, a host address matches any stored network.
+        value = int.from_bytes(key[0], 'big')
+        for prefix in self.prefixes:
+            mask = ((1 << prefix) - 1) << (maxlen - prefix)
+            packed = (value & mask).to_bytes(self.encoder.size, 'big')
+            if (packed, prefix) in self.members:
+                return packed, prefix
+        return None
+
+    @property
+    def memsize(self):
+        buckets = (self.hashsize or 0) * _BUCKET_OVERHEAD
+        return buckets + len(self.members) * (self.encoder.size +
+                                              _ENTRY_OVERHEAD)
+
+
+class MemoryBackend(Backend):
+
+    def __init__(self, latency=0.0):
+        self._latency = latency
+        self._sets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def latency(self):
+        return self._latency
+
+    def _round_trip(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def __get(self, name):
+        mset = self._sets.get(name)
+        if mset is None:
+            raise IPSetError('The set with the given name does not exist: '
+                             '{n}'.format(n=name), name)
+        return mset
+
+    def create(self, ipset):
+        self._round_trip()
+        with self._lock:
+            mset = self._sets.get(ipset.name)
+            created = _MemorySet(ipset)
+            if mset is not None:
+                if not ipset.ignore_existing or \
+                        mset.params != created.params:
+                    raise IPSetError('Set cannot be created: set with the '
+                                     'same name already exists: {n}'
+                                     .format(n=ipset.name), ipset.name,
+                                     'create')
+                return
+            self._sets[ipset.name] = created
+
+    def destroy(self, ipset):
+        self._round_trip()
+        with self._lock:
+            self.__get(ipset.name)
+            del self._sets[ipset.name]
+
+    def swap(self, first_set, second_set):
+        self._round_trip()
+        with self._lock:
+            first = self.__get(first_set.name)
+            second = self.__get(second_set.name)
+            if (first.type, first.family) != (second.type, second.family):
+                raise IPSetError('The sets cannot be swapped: their type '
+                                 'does not match', first_set.name, 'swap')
+            self._sets[first_set.name] = second
+            self._sets[second_set.name] = first
+
+    def __add(self, mset, item, exist):
+        for key in mset.keys(item):
+            if not mset.insert(key) and not exist:
+                raise IPSetError("Element cannot be added to the set: it's "
+                                 "already added")
+
+    def __delete(self, mset, item):
+        for key in mset.keys(item):
+            if not mset.discard(key):
+                raise IPSetError("Element cannot be deleted from the set: "
+                                 "it's not added")
+
+    def add(self, ipset, item):
+        self._round_trip()
+        with self._lock:
+            self.__add(self.__get(ipset.name), item, ipset.ignore_existing)
+
+    def delete(self, ipset, item):
+        self._round_trip()
+        with self._lock:
+            self.__delete(self.__get(ipset.name), item)
+
+    def test(self, ipset, item):
+        self._round_trip()
+        with self._lock:
+            mset = self.__get(ipset.name)
+            return all(mset.contains(key) for key in mset.keys(item))
+
+    def count_traffic(self, ipset, item, packets=1, bytes=0):
+        """Count traffic matching item against a set with counters.
+
+        Returns whether every key of item matched an element.
+        """
+        with self._lock:
+            mset = self.__get(ipset.name)
+            if not mset.counters:
+                raise IPSetError('The set does not keep counters: {n}'
+                                 .format(n=ipset.name), ipset.name)
+            matched = True
+            for key in mset.keys(item):
+                key = mset.match(key)
+                if key is None:
+                    matched = False
+                    continue
+                counters = mset.members[key]
+                counters[0] += packets
+                counters[1] += bytes
+            return matched
+
+    def __bulk(self, ipset, apply, items, batch_size, keep_going, command,
+               describe=None):
+        # Every batch is applied under the lock in one go, like a netlink
+        # message the kernel processes in a single call.
+        result = BulkResult()
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.__commit(ipset, apply, batch, result, keep_going,
+                              command, describe)
+                batch = []
+        if batch:
+            self.__commit(ipset, apply, batch, result, keep_going, command,
+                          describe)
+        result.received = result.submitted
+        return result
+
+    def __commit(self, ipset, apply, batch, result, keep_going, command,
+                 describe):
+        self._round_trip()
+        lineno = result.submitted
+        result.batches += 1
+        with self._lock:
+            mset = self.__get(ipset.name)
+            for item in batch:
+                lineno += 1
+                result.submitted += 1
+                try:
+                    apply(mset, item)
+                except (IPSetError, ValueError, TypeError) as e:
+                    if describe is not None:
+                        item = describe(item)
+                    record_failure(result, ElementFailure(lineno, item,
+                                                          str(e)),
+                                   keep_going, ipset.name, command)
+
+    def add_many(self, ipset, items, batch_size, keep_going=False):
+        exist = ipset.ignore_existing
+        return self.__bulk(ipset,
+                           lambda mset, item: self.__add(mset, item, exist),
+                           items, batch_size, keep_going, 'add')
+
+    def delete_many(self, ipset, items, batch_size, keep_going=False):
+        return self.__bulk(ipset, self.__delete, items, batch_size,
+                           keep_going, 'delete')
+
+    def add_indexed(self, ipset, elements, batch_size, keep_going=False):
+        exist = ipset.ignore_existing
+        return self.__bulk(ipset,
+                           lambda mset, i: self.__add(mset, elements.key(i),
+                                                      exist),
+                           range(len(elements)), batch_size, keep_going,
+                           'add', elements.describe)
+
+    def delete_indexed(self, ipset, elements, batch_size, keep_going=False):
+        return self.__bulk(ipset,
+                           lambda mset, i: self.__delete(mset,
+                                                         elements.key(i)),
+                           range(len(elements)), batch_size, keep_going,
+                           'delete', elements.describe)
+
+    def test_indexed(self, ipset, elements):
+        self._round_trip()
+        with self._lock:
+            mset = self.__get(ipset.name)
+            return [all(mset.contains(key)
+                        for key in mset.keys(elements.key(i)))
+                    for i in range(len(elements))]
+
+    def iter_members(self, ipset, queue_size):
+        self._round_trip()
+        with self._lock:
+            mset = self.__get(ipset.name)
+            elems = [(mset.render(key), tuple(counters) if counters else None)
+                     for key, counters in mset.members.items()]
+        for elem, counters in elems:
+            member = ET.Element("member")
+            ET.SubElement(member, "elem").text = elem
+            if counters is not None:
+                ET.SubElement(member, "packets").text = str(counters[0])
+                ET.SubElement(member, "bytes").text = str(counters[1])
+            yield member
+
+    @staticmethod
+    def __header(name, mset):
+        fields = dict(entries=len(mset.members), memsize=mset.memsize,
+                      references=0)
+        if mset.hashed:
+            fields.update(hashsize=mset.hashsize, maxelem=mset.maxelem)
+        if mset.timeout is not None:
+            fields['timeout'] = mset.timeout
+        if mset.netmask is not None:
+            fields['netmask'] = int(mset.netmask)
+        for flag in mset.flags:
+            fields[flag] = True
+        return SetHeader(name, mset.type, revision=0, family=mset.family,
+                         **fields)
+
+    def header(self, ipset):
+        self._round_trip()
+        with self._lock:
+            return self.__header(ipset.name, self.__get(ipset.name))
+
+    def headers(self):
+        self._round_trip()
+        with self._lock:
+            return [self.__header(name, mset)
+                    for name, mset in self._sets.items()]
+
+    def flush_sets(self, names):
+        self._round_trip()
+        with self._lock:
+            for name in names:
+                mset = self.__get(name)
+                mset.members.clear()
+                mset.prefixes.clear()
+
+    def destroy_sets(self, names):
+        self._round_trip()
+        with self._lock:
+            for name in names:
+                self.__get(name)
+                del self._sets[name]
+
+    def rename_sets(self, renames):
+        self._round_trip()
+        with self._lock:
+            for old_name, new_name in renames:
+                mset = self.__get(old_name)
+                if new_name in self._sets:
+                    raise IPSetError('Set cannot be renamed: a set with the '
+                                     'new name already exists: {n}'
+                                     .format(n=new_name), old_name, 'rename')
+                del self._sets[old_name]
+                self._sets[new_name] = mset
+
+    def list(self, ipset):
+        header = self.header(ipset)
+        with self._lock:
+            mset = self.__get(ipset.name)
+            elems = [mset.render(key) for key in mset.members]
+        options = ['family', header.family]
+        for field in ('hashsize', 'maxelem', 'netmask', 'timeout'):
+            if getattr(header, field) is not None:
+                options += [field, str(getattr(header, field))]
+        print('Name: {n}'.format(n=header.name))
+        print('Type: {t}'.format(t=header.type))
+        print('Revision: {r}'.format(r=header.revision))
+        print('Header: {h}'.format(h=' '.join(options)))
+        print('Size in memory: {m}'.format(m=header.memsize))
+        print('References: {r}'.format(r=header.references))
+        print('Number of entries: {e}'.format(e=header.entries))
+        print('Members:')
+        for elem in elems:
+            print(elem)
@@ -0,0 +1,396 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+netlink.py
+~~~~~~~~~~
+
+A batching engine that talks to ip_set over netlink directly.
+
+ADD, DEL and TEST of hash:ip and hash:net elements skip libipset's data
+and parse layers: each element becomes one netlink message, copied from a
+per-set template into a reusable buffer, and hundreds of messages travel
+in a single ``send()``. Only the last message of a batch asks for an ACK;
+the kernel handles the messages in order and reports errors by sequence
+number, so every failure is traced back to its element. A rejected
+element does not stop the rest of its batch.
+
+Other set types and commands go through libipset as before.
+"""
+import errno
+import os
+import socket
+import struct
+import threading
+from itertools import islice
+from .libipset import LibipsetBackend
+from ..common import (ADDRESS_TYPES, BulkResult, ElementFailure, IPSetError,
+                      record_failure)
+from ..encode import AddressEncoder
+from ..metrics import clock, metrics
+
+NETLINK_NETFILTER = 12
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_EXCL = 0x200
+NLMSG_ERROR = 0x2
+
+NLA_F_NESTED = 1 << 15
+NLA_F_NET_BYTEORDER = 1 << 14
+
+NFNL_SUBSYS_IPSET = 6
+NFPROTO_IPV4 = 2
+NFPROTO_IPV6 = 10
+
+IPSET_PROTOCOL = 6
+IPSET_CMD_ADD = 9
+IPSET_CMD_DEL = 10
+IPSET_CMD_TEST = 11
+
+IPSET_ATTR_PROTOCOL = 1
+IPSET_ATTR_SETNAME = 2
+IPSET_ATTR_DATA = 7
+IPSET_ATTR_IP = 1
+IPSET_ATTR_CIDR = 3
+IPSET_ATTR_IPADDR_IPV4 = 1
+IPSET_ATTR_IPADDR_IPV6 = 2
+
+IPSET_ERR_PRIVATE = 4096
+IPSET_ERR_EXIST = 4103
+
+IPSET_ERRORS = {
+    4097: 'Kernel does not support the ipset protocol version',
+    4098: 'Kernel does not support the set type',
+    4099: 'Kernel cannot create more sets',
+    4100: 'Set is busy',
+    4101: 'The second set does not exist',
+    4102: 'The sets have different types',
+    4103: 'Element already added or not added',
+    4104: 'Invalid CIDR',
+    4105: 'Invalid netmask',
+    4106: 'Invalid family',
+    4107: 'Timeout cannot be used: set was created without timeout support',
+    4108: 'Set is referenced',
+    4109: 'Invalid IPv4 address',
+    4110: 'Invalid IPv6 address',
+}
+
+_HEADER = struct.Struct("=IHHII")
+_SEQ = struct.Struct("=I")
+_ERROR = struct.Struct("=i")
+
+
+def strerror(code):
+    if code >= IPSET_ERR_PRIVATE:
+        return IPSET_ERRORS.get(code, 'ipset error {c}'.format(c=code))
+    return os.strerror(code)
+
+
+class NetlinkError(IPSetError):
+    """Elements the kernel rejected, as ElementFailures."""
+
+    def __init__(self, failures, result=None, set_name=None, command=None):
+        first = failures[0]
+        super(NetlinkError, self).__init__(
+            '{n} element(s) failed, first {i!r}: {e}'.format(
+                n=len(failures), i=first.item, e=first.message),
+            set_name, command, failures, result)
+
+
+def _attr(attr_type, payload):
+    attr = struct.pack("=HH", 4 + len(payload), attr_type) + payload
+    return attr + bytes(-len(attr) % 4)
+
+
+class _Template(object):
+    """One ADT message with the set name filled in."""
+
+    def __init__(self, cmd, flags, family, set_name, size, cidr):
+        if family == 'inet':
+            nfproto, addr_attr = NFPROTO_IPV4, IPSET_ATTR_IPADDR_IPV4
+        else:
+            nfproto, addr_attr = NFPROTO_IPV6, IPSET_ATTR_IPADDR_IPV6
+        attrs = (_attr(IPSET_ATTR_PROTOCOL, bytes([IPSET_PROTOCOL])) +
+                 _attr(IPSET_ATTR_SETNAME, set_name.encode() + b'\0'))
+        data = _attr(IPSET_ATTR_IP | NLA_F_NESTED,
+                     _attr(addr_attr | NLA_F_NET_BYTEORDER, bytes(size)))
+        if cidr:
+            data += _attr(IPSET_ATTR_CIDR, b'\0')
+        payload = (struct.pack("=BBH", nfproto, 0, 0) + attrs +
+                   _attr(IPSET_ATTR_DATA | NLA_F_NESTED, data))
+
+        self.message = _HEADER.pack(_HEADER.size + len(payload),
+                                    (NFNL_SUBSYS_IPSET << 8) | cmd,
+                                    flags, 0, 0) + payload
+        self.size = size
+        # Nested attribute headers before the address: DATA, IP, IPADDR.
+        self.addr_offset = _HEADER.size + 4 + len(attrs) + 12
+        self.cidr_offset = self.addr_offset + size + 4 if cidr else None
+
+
+class _Socket(object):
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_NETFILTER)
+        try:
+            # Errors then echo only the request header, not the message.
+            self.sock.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, 1)
+        except OSError:
+            pass
+        self.sock.bind((0, 0))
+        self.seq = 0
+        self.buffer = bytearray()
+        self.replies = bytearray(65536)
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+
+class NetlinkBackend(LibipsetBackend):
+
+    def __init__(self, pool=None, max_batch=256):
+        super(NetlinkBackend, self).__init__(pool)
+        self._max_batch = max_batch
+        self._local = threading.local()
+        self._templates = {}
+        self._encoders = {}
+
+    @property
+    def max_batch(self):
+        return self._max_batch
+
+    def _socket(self):
+        sock = getattr(self._local, 'socket', None)
+        if sock is None:
+            sock = self._local.socket = _Socket()
+        return sock
+
+    def _template(self, ipset, cmd, flags, cidr):
+        key = (ipset.name, ipset.family, cmd, flags, cidr)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates.setdefault(key, _Template(
+                cmd, flags, ipset.family, ipset.name,
+                self.__encoder(ipset).size, cidr))
+        return template
+
+    def _flags(self, ipset, cmd):
+        flags = NLM_F_REQUEST
+        # Without NLM_F_EXCL the kernel ignores existing elements on ADD.
+        if cmd != IPSET_CMD_ADD or not ipset.ignore_existing:
+            flags |= NLM_F_EXCL
+        return flags
+
+    def _send(self, ipset, cmd, keys):
+        """Send one batch of ``(packed, prefix)`` keys.
+
+        Returns ``(index, errno)`` for every key the kernel rejected.
+        """
+        sock = self._socket()
+        flags = self._flags(ipset, cmd)
+        # hash:ip takes a CIDR to add a range; a host needs none.
+        always_cidr = ipset.type != 'hash:ip'
+        maxlen = self.__encoder(ipset).maxlen
+
+        if sock.seq > 0xffffffff - len(keys):
+            # Keep the batch's sequence numbers contiguous.
+            sock.seq = 0
+        buf = sock.buffer
+        offset = 0
+        first_seq = sock.seq + 1
+        last = len(keys) - 1
+        for i, (packed, prefix) in enumerate(keys):
+            cidr = always_cidr or prefix != maxlen
+            template = self._template(ipset, cmd,
+                                      flags | (NLM_F_ACK if i == last else 0),
+                                      cidr)
+            end = offset + len(template.message)
+            if end > len(buf):
+                buf.extend(bytes(end - len(buf)))
+            buf[offset:end] = template.message
+            _SEQ.pack_into(buf, offset + 8, sock.next_seq())
+            addr = offset + template.addr_offset
+            buf[addr:addr + template.size] = packed
+            if cidr:
+                buf[offset + template.cidr_offset] = prefix
+            offset = end
+
+        sock.sock.send(memoryview(buf)[:offset])
+        return self._receive(sock, first_seq, sock.seq)
+
+    @staticmethod
+    def _receive(sock, first_seq, last_seq):
+        failures = []
+        view = memoryview(sock.replies)
+        while True:
+            try:
+                n = sock.sock.recv_into(sock.replies)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    raise OSError(e.errno, 'Netlink replies were dropped; '
+                                  'use a smaller batch')
+                raise
+            offset = 0
+            while offset + _HEADER.size <= n:
+                length, msg_type, _, seq, _ = _HEADER.unpack_from(view, offset)
+                if msg_type == NLMSG_ERROR and \
+                        first_seq <= seq <= last_seq:
+                    code = -_ERROR.unpack_from(view, offset + _HEADER.size)[0]
+                    if code:
+                        failures.append((seq - first_seq, code))
+                    if seq == last_seq:
+                        return failures
+                offset += (length + 3) & ~3
+
+    def __direct(self, ipset):
+        return ipset.type in ADDRESS_TYPES
+
+    def __encoder(self, ipset):
+        encoder = self._encoders.get(ipset.family)
+        if encoder is None:
+            encoder = self._encoders.setdefault(ipset.family,
+                                                AddressEncoder(ipset.family))
+        return encoder
+
+    def __run(self, ipset, cmd, items, pack, batch_size, command,
+              keep_going=None, describe=None):
+        """Send items in batches; return the result and the failures.
+
+        Failures are ``(position, item, errno)`` for the elements the
+        kernel rejected. Items are consumed one batch at a time. Unless
+        keep_going is None, elements that cannot be packed are recorded in
+        the result rather than raised, like any other failure.
+        """
+        batch_size = min(batch_size, self._max_batch)
+        result = BulkResult()
+        failures = []
+        timing = metrics.enabled
+        items = iter(items)
+        position = 0
+        while True:
+            if timing:
+                began = clock()
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            keys = []
+            sent = []
+            for item in batch:
+                position += 1
+                try:
+                    keys.append(pack(item))
+                except (ValueError, TypeError) as e:
+                    if keep_going is None:
+                        raise
+                    result.submitted += 1
+                    if describe is not None:
+                        item = describe(item)
+                    record_failure(result,
+                                   ElementFailure(position, item, str(e)),
+                                   keep_going, ipset.name, command)
+                    continue
+                sent.append((position, item))
+            if not keys:
+                continue
+            if timing:
+                encoded = clock()
+            for index, code in self._send(ipset, cmd, keys):
+                position, item = sent[index]
+                if describe is not None:
+                    item = describe(item)
+                failures.append((position, item, code))
+            if timing:
+                metrics.observe(ipset.name, 'encode', encoded - began)
+                metrics.observe(ipset.name, 'cmd', clock() - encoded)
+                metrics.count(ipset.name, 'commands', len(keys),
+                              command=command)
+                metrics.count(ipset.name, 'elements', len(keys),
+                              command=command)
+            result.submitted += len(keys)
+            result.batches += 1
+        result.received = result.submitted
+        return result, failures
+
+    @staticmethod
+    def __failed(ipset, command, result, failures, keep_going):
+        result.failures.extend(ElementFailure(position, item, strerror(code),
+                                              code)
+                               for position, item, code in failures)
+        result.failures.sort(key=lambda failure: failure.lineno)
+        if failures and not keep_going:
+            raise NetlinkError(result.failures, result, ipset.name, command)
+        return result
+
+    def __bulk(self, ipset, cmd, items, batch_size, command,
+               keep_going=False):
+        result, failures = self.__run(ipset, cmd, items,
+                                      self.__encoder(ipset).pack,
+                                      batch_size, command, keep_going)
+        return self.__failed(ipset, command, result, failures, keep_going)
+
+    def __indexed(self, ipset, cmd, elements, batch_size, command,
+                  keep_going):
+        result, failures = self.__run(ipset, cmd, range(len(elements)),
+                                      elements.key, batch_size, command,
+                                      keep_going, elements.describe)
+        return self.__failed(ipset, command, result, failures, keep_going)
+
+    def __test(self, ipset, items, pack, describe=None):
+        result, failures = self.__run(ipset, IPSET_CMD_TEST, items, pack,
+                                      self._max_batch, 'test',
+                                      describe=describe)
+        found = [True] * result.submitted
+        errors = []
+        for position, item, code in failures:
+            # The kernel answers a TEST for a missing element with an error.
+            if code == IPSET_ERR_EXIST:
+                found[position - 1] = False
+            else:
+                errors.append((position, item, code))
+        self.__failed(ipset, 'test', result, errors, False)
+        return found
+
+    def add(self, ipset, item):
+        if not self.__direct(ipset):
+            return super(NetlinkBackend, self).add(ipset, item)
+        self.__bulk(ipset, IPSET_CMD_ADD, (item,), 1, 'add', None)
+
+    def delete(self, ipset, item):
+        if not self.__direct(ipset):
+            return super(NetlinkBackend, self).delete(ipset, item)
+        self.__bulk(ipset, IPSET_CMD_DEL, (item,), 1, 'delete', None)
+
+    def test(self, ipset, item):
+        if not self.__direct(ipset):
+            return super(NetlinkBackend, self).test(ipset, item)
+        return self.__test(ipset, (item,), self.__encoder(ipset).pack)[0]
+
+    def add_many(self, ipset, items, batch_size, keep_going=False):
+        if not self.__direct(ipset):
+            return super(NetlinkBackend, self).add_many(ipset, items,
+                                                        batch_size, keep_going)
+        return self.__bulk(ipset, IPSET_CMD_ADD, items, batch_size, 'add',
+                           keep_going)
+
+    def delete_many(self, ipset, items, batch_size, keep_going=False):
+        if not self.__direct(ipset):
+            return super(NetlinkBackend, self).delete_many(
+                ipset, items, batch_size, keep_going)
+        return self.__bulk(ipset, IPSET_CMD_DEL, items, batch_size, 'delete',
+                           keep_going)
+
+    def add_indexed(self, ipset, elements, batch_size, keep_going=False):
+        return self.__indexed(ipset, IPSET_CMD_ADD, elements, batch_size,
+                              'add', keep_going)
+
+    def delete_indexed(self, ipset, elements, batch_size, keep_going=False):
+        return self.__indexed(ipset, IPSET_CMD_DEL, elements, batch_size,
+                              'delete', keep_going)
+
+    def test_indexed(self, ipset, elements):
+        return self.__test(ipset, range(len(elements)), elements.key,
+                           elements.describe)
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+cidr.py
+~~~~~~~
+
+Prefix aggregation on integer intervals.
+
+Prefixes are turned into ``(first, last)`` integer ranges, sorted once and
+merged in a single pass, and the merged ranges are cut back into the
+fewest aligned CIDR blocks. Nothing here builds ``ipaddress`` objects, so
+it scales to millions of prefixes.
+"""
+
+
+def intervals(keys, maxlen):
+    """Turn ``(packed, prefixlen)`` keys into sorted ``(first, last)``
+    ranges."""
+    ranges = []
+    for packed, prefix in keys:
+        first = int.from_bytes(packed, "big")
+        ranges.append((first, first | ((1 << (maxlen - prefix)) - 1)))
+    ranges.sort()
+    return ranges
+
+
+def merge(ranges):
+    """Merge overlapping and adjacent ranges of a sorted list."""
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def range_to_cidrs(first, last, maxlen):
+    """Yield the minimal ``(address, prefixlen)`` cover of a range."""
+    while first <= last:
+        # The block must be aligned on first and must not pass last.
+        bits = (first & -first).bit_length() - 1 if first else maxlen
+        bits = min(bits, (last - first + 1).bit_length() - 1)
+        yield first, maxlen - bits
+        first += 1 << bits
+
+
+def cover(ranges, maxlen):
+    """Yield the ``(packed, prefixlen)`` keys covering sorted ranges.
+
+    A /0 is yielded as two /1 blocks, since the kernel rejects a zero
+    prefix.
+    """
+    size = maxlen // 8
+    for first, last in ranges:
+        for addr, prefix in range_to_cidrs(first, last, maxlen):
+            if prefix == 0:
+                half = 1 << (maxlen - 1)
+                yield (0).to_bytes(size, "big"), 1
+                yield half.to_bytes(size, "big"), 1
+            else:
+                yield addr.to_bytes(size, "big"), prefix
+
+
+def collapse(keys, maxlen):
+    """Return the minimal CIDR cover of ``(packed, prefixlen)`` keys.
+
+    The result is a sorted list of ``(packed, prefixlen)`` keys.
+    """
+    return list(cover(merge(intervals(keys, maxlen)), maxlen))
@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+FAMILIES = [
+    'inet',
+    'inet6',
+]
+
+TYPES = [
+    'bitmap:ip',
+    'bitmap:ip,mac',
+    'bitmap:port',
+    'hash:ip',
+    'hash:mac',
+    'hash:net',
+    'hash:net,net',
+    'hash:ip,port',
+    'hash:net,port',
+    'hash:ip,port,ip',
+    'hash:ip,port,net',
+    'hash:ip,mark',
+    'hash:net,port,net',
+    'hash:net,iface',
+    'list:set',
+]
+
+# Types whose elements are a single address or network.
+ADDRESS_TYPES = (
+    'hash:ip',
+    'hash:net',
+)
+
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_QUEUE_SIZE = 64
+
+# The kernel's sizing of hash sets created without hashsize/maxelem.
+DEFAULT_HASHSIZE = 1024
+DEFAULT_MAXELEM = 65536
+MIN_HASHSIZE = 64
+
+# Elements per bucket that expected_size sizes a hash set for. Buckets grow
+# in place up to a limit before the whole table is rehashed, so a few
+# elements per bucket keep memory low without triggering resizes.
+HASH_LOAD = 4
+
+
+def hash_sizing(expected_size):
+    """Return ``(hashsize, maxelem)`` for a hash set of expected_size.
+
+    The hashsize is the power of two the kernel would round up to, and
+    maxelem leaves half the expected size again as headroom.
+    """
+    if expected_size < 0:
+        raise ValueError('expected_size must not be negative')
+    hashsize = MIN_HASHSIZE
+    while hashsize * HASH_LOAD < expected_size:
+        hashsize <<= 1
+    maxelem = max(DEFAULT_MAXELEM, expected_size + expected_size // 2)
+    return hashsize, maxelem
+
+
+class IPSetError(Exception):
+    """A command that libipset or the kernel refused."""
+
+    def __init__(self, message, set_name=None, command=None, failures=None,
+                 result=None):
+        super(IPSetError, self).__init__(message)
+        self.message = message
+        self.set_name = set_name
+        self.command = command
+        self.failures = failures if failures is not None else []
+        self.result = result
+
+
+class ElementFailure(object):
+    """One element of a bulk operation that was not applied.
+
+    ``lineno`` is the 1-based position of the element in the items given to
+    the bulk operation, and ``code`` the kernel's errno when known.
+    """
+
+    __slots__ = ('lineno', 'item', 'message', 'code')
+
+    def __init__(self, lineno, item, message, code=None):
+        self.lineno = lineno
+        self.item = item
+        self.message = message
+        self.code = code
+
+    def __repr__(self):
+        return '{c}(lineno={n}, item={i!r}, message={m!r})'.format(
+            c=self.__class__.__name__, n=self.lineno, i=self.item,
+            m=self.message)
+
+
+class BulkResult(object):
+
+    def __init__(self):
+        self.received = 0
+        self.submitted = 0
+        self.batches = 0
+        self.failures = []
+        self.warnings = []
+
+    @property
+    def failed(self):
+        return len(self.failures)
+
+    @property
+    def applied(self):
+        return self.submitted - len(self.failures)
+
+    def __repr__(self):
+        return ('{c}(received={r}, submitted={s}, failed={f}, batches={b})'
+                .format(c=self.__class__.__name__, r=self.received,
+                        s=self.submitted, f=self.failed, b=self.batches))
+
+
+def record_failure(result, failure, keep_going, set_name=None, command=None):
+    """Add failure to a BulkResult, or raise it unless keep_going."""
+    result.failures.append(failure)
+    if not keep_going:
+        raise IPSetError('Element {n} ({i!r}): {m}'.format(
+            n=failure.lineno, i=failure.item, m=failure.message),
+            set_name, command, result.failures, result)
+
+
+class FeedResult(object):
+
+    def __init__(self):
+        self.shards = 0
+        self.lines = 0
+        self.records = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.submitted = 0
+        self.failures = []
+
+    def __repr__(self):
+        return ('{c}(lines={l}, records={r}, duplicates={d}, invalid={i}, '
+                'submitted={s}, failed={f})'.format(
+                    c=self.__class__.__name__, l=self.lines, r=self.records,
+                    d=self.duplicates, i=self.invalid, s=self.submitted,
+                    f=len(self.failures)))
+
+
+class SyncResult(object):
+
+    def __init__(self, added=0, removed=0, unchanged=0, swapped=False):
+        self.added = added
+        self.removed = removed
+        self.unchanged = unchanged
+        self.swapped = swapped
+
+    def __repr__(self):
+        return ('{c}(added={a}, removed={r}, unchanged={u}, swapped={s})'
+                .format(c=self.__class__.__name__, a=self.added,
+                        r=self.removed, u=self.unchanged, s=self.swapped))
+
+
+class SetHeader(object):
+
+    # Numeric header fields, keyed by their XML tag.
+    FIELDS = {
+        'entries': 'numentries',
+        'memsize': 'memsize',
+        'references': 'references',
+        'hashsize': 'hashsize',
+        'maxelem': 'maxelem',
+        'timeout': 'timeout',
+        'netmask': 'netmask',
+        'size': 'size',
+    }
+
+    # Create flags, listed as empty elements when the set has them.
+    FLAGS = ('counters', 'comment', 'forceadd')
+
+    def __init__(self, name, type, revision=None, family=None, **fields):
+        self.name = name
+        self.type = type
+        self.revision = revision
+        self.family = family
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+        for flag in self.FLAGS:
+            setattr(self, flag, bool(fields.get(flag)))
+
+    @classmethod
+    def from_xml(cls, node):
+        header = node.find("header")
+        if header is None:
+            import xml.etree.ElementTree as ET
+            header = ET.Element("header")
+        fields = {}
+        for field, tag in cls.FIELDS.items():
+            text = header.findtext(tag)
+            if text is not None:
+                fields[field] = int(text)
+        for flag in cls.FLAGS:
+            fields[flag] = header.find(flag) is not None
+        revision = node.findtext("revision")
+        if revision is not None:
+            revision = int(revision)
+        return cls(node.get("name"), node.findtext("type"), revision=revision,
+                   family=header.findtext("family"), **fields)
+
+    def __repr__(self):
+        return '{c}(name={n!r}, type={t!r}, entries={e}, memsize={m})'.format(
+            c=self.__class__.__name__, n=self.name, t=self.type,
+            e=self.entries, m=self.memsize)
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+counters.py
+~~~~~~~~~~~
+
+Incremental polling of per-element packet and byte counters.
+
+A CounterTable keeps the last counters of every element in flat arrays,
+indexed through one dict from element to slot that is only extended as
+new elements appear. Each poll streams a listing, updates the arrays in
+place and returns the elements whose counters changed, with their rate
+since the previous poll. Top-N queries run over the arrays with heapq,
+without building a mapping of every element.
+
+An element whose counters went down, or that was missing from the
+previous poll, was deleted and added again, so its counters are taken as
+counted from zero. Slots of deleted elements are reclaimed once they make
+up most of the table.
+"""
+import heapq
+import time
+from array import array
+
+ORDERS = ('packets', 'bytes', 'packet_rate', 'byte_rate')
+
+# Tables smaller than this are never compacted.
+_MIN_COMPACT = 4096
+
+
+class CounterDelta(object):
+
+    __slots__ = ('elem', 'packets', 'bytes', 'delta_packets', 'delta_bytes',
+                 'packet_rate', 'byte_rate')
+
+    def __init__(self, elem, packets, bytes, delta_packets, delta_bytes,
+                 packet_rate, byte_rate):
+        self.elem = elem
+        self.packets = packets
+        self.bytes = bytes
+        self.delta_packets = delta_packets
+        self.delta_bytes = delta_bytes
+        self.packet_rate = packet_rate
+        self.byte_rate = byte_rate
+
+    def __repr__(self):
+        return ('{c}(elem={e!r}, packets={p}, bytes={b}, '
+                'packet_rate={pr:.1f}, byte_rate={br:.1f})'.format(
+                    c=self.__class__.__name__, e=self.elem, p=self.packets,
+                    b=self.bytes, pr=self.packet_rate, br=self.byte_rate))
+
+
+class CounterTable(object):
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._slots = {}
+        self._elems = []
+        self._packets = array('Q')
+        self._bytes = array('Q')
+        self._packet_rate = array('d')
+        self._byte_rate = array('d')
+        # The poll that last listed each slot; older slots were deleted.
+        self._seen = array('L')
+        self._polls = 0
+        self._polled = None
+        self._listed = 0
+
+    def __len__(self):
+        # Elements listed by the last poll.
+        return self._listed
+
+    @property
+    def polls(self):
+        return self._polls
+
+    def poll(self, members):
+        """Update the table from listed members and return what changed.
+
+        members are the XML members of a listing, as yielded by
+        ``IPSet.iter_members()``. On the first poll every element counts
+        as changed and rates are zero.
+        """
+        now = self._clock()
+        elapsed = now - self._polled if self._polled is not None else 0.0
+        self._polled = now
+        self._polls += 1
+        poll = self._polls
+
+        slots = self._slots
+        elems = self._elems
+        packets = self._packets
+        bytes_ = self._bytes
+        packet_rate = self._packet_rate
+        byte_rate = self._byte_rate
+        seen = self._seen
+        changed = []
+        listed = 0
+        for member in members:
+            elem = member.findtext('elem')
+            npackets = int(member.findtext('packets') or 0)
+            nbytes = int(member.findtext('bytes') or 0)
+            listed += 1
+            slot = slots.get(elem)
+            if slot is None:
+                slot = slots[elem] = len(elems)
+                elems.append(elem)
+                packets.append(0)
+                bytes_.append(0)
+                packet_rate.append(0.0)
+                byte_rate.append(0.0)
+                seen.append(poll)
+                dpackets, dbytes = npackets, nbytes
+                new = True
+            else:
+                dpackets = npackets - packets[slot]
+                dbytes = nbytes - bytes_[slot]
+                # Deleted and added again since the last poll.
+                new = seen[slot] != poll - 1 or dpackets < 0 or dbytes < 0
+                if new:
+                    dpackets, dbytes = npackets, nbytes
+                seen[slot] = poll
+            if not (new or dpackets or dbytes):
+                packet_rate[slot] = byte_rate[slot] = 0.0
+                continue
+
+            packets[slot] = npackets
+            bytes_[slot] = nbytes
+            prate = dpackets / elapsed if elapsed else 0.0
+            brate = dbytes / elapsed if elapsed else 0.0
+            packet_rate[slot] = prate
+            byte_rate[slot] = brate
+            changed.append(CounterDelta(elem, npackets, nbytes, dpackets,
+                                        dbytes, prate, brate))
+
+        self._listed = listed
+        if len(elems) > max(2 * listed, _MIN_COMPACT):
+            self.__compact()
+        return changed
+
+    def __compact(self):
+        # Drop the slots of elements missing from the last poll.
+        poll = self._polls
+        keep = [slot for slot in range(len(self._elems))
+                if self._seen[slot] == poll]
+        self._elems = [self._elems[slot] for slot in keep]
+        self._slots = dict((elem, slot)
+                           for slot, elem in enumerate(self._elems))
+        for name in ('_packets', '_bytes', '_packet_rate', '_byte_rate',
+                     '_seen'):
+            values = getattr(self, name)
+            setattr(self, name, array(values.typecode,
+                                      (values[slot] for slot in keep)))
+
+    def top(self, n=10, by='byte_rate'):
+        """Return the n listed elements with the highest counter or rate."""
+        if by not in ORDERS:
+            raise ValueError('by should be one of {o}'.format(o=ORDERS))
+        values = getattr(self, '_' + by)
+        seen = self._seen
+        poll = self._polls
+        live = (slot for slot in range(len(values)) if seen[slot] == poll)
+        return [self.__delta(slot)
+                for slot in heapq.nlargest(n, live, key=values.__getitem__)]
+
+    def get(self, elem):
+        slot = self._slots.get(elem)
+        if slot is None or self._seen[slot] != self._polls:
+            return None
+        return self.__delta(slot)
+
+    def __delta(self, slot):
+        return CounterDelta(self._elems[slot], self._packets[slot],
+                            self._bytes[slot], None, None,
+                            self._packet_rate[slot], self._byte_rate[slot])
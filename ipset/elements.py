@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+elements.py
+~~~~~~~~~~~
+
+The structure of elements for every set type.
+
+Each set type maps to the components of its elements. A structured element
+is a tuple with one entry per component, for example ``("10.0.0.1", 80)``
+or ``("10.0.0.1", "udp", 53)`` for ``hash:ip,port``. Backends encode each
+component directly, e.g. into the matching ``IPSET_OPT_*`` field, instead
+of going through libipset's text parser.
+
+Components:
+
+- ``ip``/``ip2``: an address as accepted by :class:`AddressEncoder`
+- ``net``/``net2``: an address or network, always sent with its prefix
+- ``proto_port``: a port (TCP), ``(proto, port)`` or ``"proto:port"``;
+  for ICMP the port is ``"type/code"``
+- ``port``: a port number or service name
+- ``mac``: ``"aa:bb:cc:dd:ee:ff"`` or 6 packed bytes
+- ``mark``: an integer
+- ``iface``/``name``: a string
+"""
+import socket
+
+FIELDS = {
+    'bitmap:ip': ('net',),
+    'bitmap:ip,mac': ('ip', 'mac'),
+    'bitmap:port': ('port',),
+    'hash:ip': ('net',),
+    'hash:mac': ('mac',),
+    'hash:net': ('net',),
+    'hash:net,net': ('net', 'net2'),
+    'hash:ip,port': ('ip', 'proto_port'),
+    'hash:net,port': ('net', 'proto_port'),
+    'hash:ip,port,ip': ('ip', 'proto_port', 'ip2'),
+    'hash:ip,port,net': ('ip', 'proto_port', 'net2'),
+    'hash:ip,mark': ('ip', 'mark'),
+    'hash:net,port,net': ('net', 'proto_port', 'net2'),
+    'hash:net,iface': ('net', 'iface'),
+    'list:set': ('name',),
+}
+
+_PROTOCOLS = {}
+
+ICMP_PROTOCOLS = ('icmp', 'icmpv6', 'ipv6-icmp')
+
+
+def protocol(proto):
+    if isinstance(proto, int):
+        return proto
+    number = _PROTOCOLS.get(proto)
+    if number is None:
+        try:
+            number = socket.getprotobyname(proto)
+        except OSError:
+            raise ValueError('Unknown protocol {p!r}'.format(p=proto))
+        _PROTOCOLS[proto] = number
+    return number
+
+
+def port_number(port, proto='tcp'):
+    if isinstance(port, int):
+        number = port
+    elif proto in ICMP_PROTOCOLS and '/' in port:
+        # ICMP elements carry the type and code where the port would be.
+        icmp_type, _, code = port.partition('/')
+        number = int(icmp_type) << 8 | int(code)
+    elif port.isdigit():
+        number = int(port)
+    else:
+        try:
+            number = socket.getservbyname(port, proto)
+        except OSError:
+            raise ValueError('Unknown service {p!r}'.format(p=port))
+    if not 0 <= number <= 0xffff:
+        raise ValueError('Port {p} out of range'.format(p=port))
+    return number
+
+
+def mac_address(mac):
+    if isinstance(mac, str):
+        mac = bytes.fromhex(mac.replace(':', '').replace('-', ''))
+    if len(mac) != 6:
+        raise ValueError('{m!r} is not a MAC address'.format(m=mac))
+    return bytes(mac)
+
+
+def split_element(fields, item):
+    """Return one entry per component of a structured element.
+
+    A ``proto_port`` component may also be given as two flat entries,
+    e.g. ``("10.0.0.1", "udp", 53)``.
+    """
+    if len(fields) == 1:
+        return (item,)
+
+    parts = tuple(item)
+    if 'proto_port' in fields and len(parts) == len(fields) + 1:
+        i = fields.index('proto_port')
+        parts = parts[:i] + ((parts[i], parts[i + 1]),) + parts[i + 2:]
+    if len(parts) != len(fields):
+        raise ValueError('Expected {n} components ({f}), got {i!r}'
+                         .format(n=len(fields), f=','.join(fields), i=item))
+    return parts
+
+
+def proto_port(part):
+    """Return ``(proto, port)`` for a proto_port component."""
+    if isinstance(part, str):
+        proto, sep, port = part.rpartition(':')
+        proto = proto if sep else 'tcp'
+    elif isinstance(part, tuple):
+        proto, port = part
+    else:
+        proto, port = 'tcp', part
+    return proto, port
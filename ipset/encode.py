@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+encode.py
+~~~~~~~~~
+
+Fast conversion of IP elements into the buffers libipset expects.
+
+An element can be an int, a packed 4- or 16-byte ``bytes`` value, an
+``ipaddress`` address or network, a string (``"10.0.0.1"``,
+``"10.0.0.0/24"``) or an ``(address, prefixlen)`` tuple of any of those.
+"""
+import ipaddress
+import socket
+import threading
+from . import cidr
+
+
+class AddressEncoder(object):
+
+    def __init__(self, family="inet"):
+        if family == "inet":
+            self._af = socket.AF_INET
+            self._size = 4
+        elif family == "inet6":
+            self._af = socket.AF_INET6
+            self._size = 16
+        else:
+            raise ValueError("Unknown family {f!r}".format(f=family))
+        self._maxlen = self._size * 8
+        self._local = threading.local()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def maxlen(self):
+        return self._maxlen
+
+    def _address(self, addr):
+        if isinstance(addr, (bytes, bytearray)):
+            if len(addr) != self._size:
+                raise ValueError("Expected {n} packed bytes, got {m}"
+                                 .format(n=self._size, m=len(addr)))
+            return bytes(addr)
+        if isinstance(addr, str):
+            try:
+                return socket.inet_pton(self._af, addr)
+            except OSError:
+                raise ValueError("{a!r} is not a valid address".format(a=addr))
+        if isinstance(addr, bool):
+            raise TypeError("Cannot encode bool as an address")
+        if isinstance(addr, int):
+            if addr < 0 or addr >> self._maxlen:
+                raise ValueError("{a} is out of range for an address"
+                                 .format(a=addr))
+            return addr.to_bytes(self._size, "big")
+        if isinstance(addr, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            if addr.max_prefixlen != self._maxlen:
+                raise ValueError("{a} does not match the set family"
+                                 .format(a=addr))
+            return addr.packed
+        raise TypeError("Cannot encode {t} as an address"
+                        .format(t=type(addr).__name__))
+
+    def pack(self, item):
+        """Return ``(packed_address, prefixlen)`` for an element."""
+        if isinstance(item, str):
+            addr, sep, prefix = item.partition("/")
+            if not sep:
+                return self._address(addr), self._maxlen
+            return self._network(self._address(addr), int(prefix), item)
+        if isinstance(item, tuple):
+            addr, prefix = item
+            return self._network(self._address(addr), int(prefix), item)
+        if isinstance(item, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return (self._address(item.network_address),
+                    item.prefixlen)
+        return self._address(item), self._maxlen
+
+    def unpack(self, packed, prefix=None):
+        """Format a packed element the way libipset lists it."""
+        addr = socket.inet_ntop(self._af, packed)
+        if prefix is None or prefix == self._maxlen:
+            return addr
+        return "{a}/{p}".format(a=addr, p=prefix)
+
+    def _network(self, packed, prefix, item):
+        if not 0 <= prefix <= self._maxlen:
+            raise ValueError("Invalid prefix length in {i!r}".format(i=item))
+        if prefix < self._maxlen:
+            host_bits = (1 << (self._maxlen - prefix)) - 1
+            if int.from_bytes(packed, "big") & host_bits:
+                raise ValueError("{i!r} has host bits set".format(i=item))
+        return packed, prefix
+
+    def buffers(self):
+        """Return this thread's reusable ``(nf_inet_addr, cidr)`` buffers."""
+        local = self._local
+        try:
+            return local.ip, local.cidr
+        except AttributeError:
+            # Only the libipset backend needs buffers, so the compiled
+            # module is loaded on first use.
+            from .libipset.ipset import ffi
+            self._memmove = ffi.memmove
+            local.ip = ffi.new("union nf_inet_addr *")
+            local.cidr = ffi.new("uint8_t *")
+            return local.ip, local.cidr
+
+    def encode(self, item):
+        """Fill and return the buffers for an element.
+
+        The buffers are reused by the next call on the same thread, which
+        is safe because ``ipset_data_set()`` copies the values.
+        """
+        packed, prefix = self.pack(item)
+        ip, cidr = self.buffers()
+        self._memmove(ip, packed, self._size)
+        cidr[0] = prefix
+        return ip, cidr
+
+
+def address_blocks(encoder, item):
+    """Return the ``(packed, prefixlen)`` blocks an element stands for.
+
+    Strings the encoder refuses are read as libipset reads them: an IPv4
+    ``first-last`` range is cut into CIDR blocks, and host bits set in a
+    network are cleared.
+    """
+    try:
+        return [encoder.pack(item)]
+    except ValueError as e:
+        if not isinstance(item, str):
+            raise
+        error = e
+    maxlen = encoder.maxlen
+    if '-' in item:
+        first, _, last = item.partition('-')
+        first = int.from_bytes(encoder.pack(first)[0], 'big')
+        last = int.from_bytes(encoder.pack(last)[0], 'big')
+        if maxlen != 32:
+            raise ValueError('IPv6 ranges are not supported: {i!r}'
+                             .format(i=item))
+        if first > last:
+            raise ValueError('{i!r} is not a valid range'.format(i=item))
+        return [(addr.to_bytes(encoder.size, 'big'), prefix) for addr, prefix
+                in cidr.range_to_cidrs(first, last, maxlen)]
+    addr, sep, prefix = item.partition('/')
+    if not sep:
+        raise error
+    packed, prefix = encoder.pack(addr)[0], int(prefix)
+    if not 0 < prefix <= maxlen:
+        raise error
+    first = int.from_bytes(packed, 'big') & ~((1 << (maxlen - prefix)) - 1)
+    return [(first.to_bytes(encoder.size, 'big'), prefix)]
+
+
+def element_keys(encoder, set_type, netmask, items):
+    """Yield canonical ``(packed, prefixlen)`` keys for address elements.
+
+    The keys match what the kernel stores: hash:net cuts ranges into
+    blocks, and hash:ip expands them into single addresses and applies its
+    netmask.
+    """
+    maxlen = encoder.maxlen
+    if set_type != 'hash:ip':
+        for item in items:
+            for key in address_blocks(encoder, item):
+                yield key
+        return
+
+    hostlen = maxlen - int(netmask) if netmask else 0
+    mask = ~((1 << hostlen) - 1)
+    for item in items:
+        for packed, prefix in address_blocks(encoder, item):
+            if prefix == maxlen and not hostlen:
+                yield packed, maxlen
+                continue
+            if maxlen == 128 and prefix != maxlen:
+                # The kernel only expands IPv4 networks and ranges.
+                raise ValueError('IPv6 hash:ip sets only take single '
+                                 'addresses, got {i!r}'.format(i=item))
+            first = int.from_bytes(packed, 'big') & mask
+            last = first | ((1 << (maxlen - prefix)) - 1)
+            for addr in range(first, last + 1, 1 << hostlen):
+                yield addr.to_bytes(encoder.size, 'big'), maxlen
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+feeds.py
+~~~~~~~~
+
+Parse and validate large blocklist feeds on a process pool.
+
+Feed files are split into shards of whole lines by byte range. Workers
+parse the first field of every line as an address or network, validate
+it, drop duplicates within the shard and return the rest as packed
+records: the address followed by its prefix length, as in snapshots.
+Shards come back in input order and are loaded by a single writer, so
+parsing runs on every core while kernel writes stay serialized and
+ordered.
+
+Blank lines and comments starting with ``#`` or ``;`` are skipped. Unless
+``strict``, host bits of networks are cleared rather than rejected.
+"""
+import functools
+import os
+import socket
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .common import DEFAULT_BATCH_SIZE, FeedResult
+from .encode import AddressEncoder
+from .snapshot import PackedRecords
+
+DEFAULT_SHARD_SIZE = 4 << 20
+DEFAULT_MAX_ERRORS = 100
+
+
+def shards(paths, shard_size=DEFAULT_SHARD_SIZE):
+    """Yield ``(path, start, end)`` byte ranges covering every file."""
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, shard_size):
+            yield path, start, min(start + shard_size, size)
+
+
+def _read_shard(path, start, end):
+    # A line belongs to the shard it starts in.
+    with open(path, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            data = f.read(end - start + 1)
+            cut = data.find(b'\n')
+            if cut < 0:
+                return b''
+            data = data[cut + 1:]
+        else:
+            data = f.read(end)
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+    return data
+
+
+class ParsedShard(object):
+
+    __slots__ = ('path', 'start', 'lines', 'records', 'duplicates',
+                 'invalid', 'errors')
+
+    def __init__(self, path, start, lines, records, duplicates, invalid,
+                 errors):
+        self.path = path
+        self.start = start
+        self.lines = lines
+        self.records = records
+        self.duplicates = duplicates
+        self.invalid = invalid
+        # (line number within the shard, text, message)
+        self.errors = errors
+
+
+def parse_shard(shard, family='inet', strict=False,
+                max_errors=DEFAULT_MAX_ERRORS):
+    """Parse one shard into a ParsedShard of packed records."""
+    path, start, end = shard
+    data = _read_shard(path, start, end)
+    encoder = AddressEncoder(family)
+    size = encoder.size
+    maxlen = encoder.maxlen
+    af = socket.AF_INET if family == 'inet' else socket.AF_INET6
+    inet_pton = socket.inet_pton
+
+    records = bytearray()
+    seen = set()
+    duplicates = invalid = 0
+    errors = []
+    # An empty shard has no lines, and a final newline ends the last one.
+    lines = data.split(b'\n') if data else []
+    if data.endswith(b'\n'):
+        lines.pop()
+    for lineno, line in enumerate(lines, 1):
+        if b'#' in line or b';' in line:
+            line = line.split(b'#', 1)[0].split(b';', 1)[0]
+        fields = line.split(None, 1)
+        if not fields:
+            continue
+        token = fields[0]
+        try:
+            addr, sep, prefix = token.decode('ascii').partition('/')
+            try:
+                packed = inet_pton(af, addr)
+            except OSError:
+                raise ValueError('{a!r} is not a valid address'
+                                 .format(a=addr))
+            if sep:
+                if strict:
+                    packed, prefix = encoder.pack(token.decode('ascii'))
+                else:
+                    prefix = int(prefix)
+                    if not 0 <= prefix <= maxlen:
+                        raise ValueError('Invalid prefix length')
+                    host_bits = (1 << (maxlen - prefix)) - 1
+                    packed = (int.from_bytes(packed, 'big') & ~host_bits) \
+                        .to_bytes(size, 'big')
+            else:
+                prefix = maxlen
+        except ValueError as e:
+            invalid += 1
+            if len(errors) < max_errors:
+                errors.append((lineno, token.decode('ascii', 'replace'),
+                               str(e)))
+            continue
+
+        record = packed + bytes((prefix,))
+        if record in seen:
+            duplicates += 1
+            continue
+        seen.add(record)
+        records += record
+    return ParsedShard(path, start, len(lines), bytes(records), duplicates,
+                       invalid, errors)
+
+
+def normalize(paths, family='inet', workers=None,
+              shard_size=DEFAULT_SHARD_SIZE, strict=False,
+              max_errors=DEFAULT_MAX_ERRORS):
+    """Yield a ParsedShard for every shard of paths, in input order.
+
+    Shards are parsed on a pool of ``workers`` processes, by default one per
+    CPU, with at most two shards per worker in flight. ``workers=0`` parses
+    in this process.
+    """
+    parse = functools.partial(parse_shard, family=family, strict=strict,
+                              max_errors=max_errors)
+    if workers == 0:
+        for shard in shards(paths, shard_size):
+            yield parse(shard)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for shard in shards(paths, shard_size):
+            pending.append(executor.submit(parse, shard))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_feeds(ipset, paths, workers=None, shard_size=DEFAULT_SHARD_SIZE,
+               batch_size=DEFAULT_BATCH_SIZE, strict=False, dedupe=False,
+               keep_going=False, max_errors=DEFAULT_MAX_ERRORS):
+    """Parse feed files in parallel and add their elements to ipset.
+
+    Duplicates are always dropped within a shard; ``dedupe`` also drops
+    them across shards, at the cost of keeping every record in memory.
+    Returns a FeedResult; its ``errors`` are ``(path, line number, text,
+    message)`` for up to ``max_errors`` invalid lines per shard.
+    """
+    result = FeedResult()
+    seen = set() if dedupe else None
+    size = AddressEncoder(ipset.family).size
+    offset = 0
+    for shard in normalize(paths, ipset.family, workers, shard_size, strict,
+                           max_errors):
+        # Shards arrive in order, so lines are counted from each file's
+        # first shard.
+        if not shard.start:
+            offset = 0
+        result.shards += 1
+        result.lines += shard.lines
+        result.duplicates += shard.duplicates
+        result.invalid += shard.invalid
+        result.errors.extend((shard.path, offset + lineno, text, message)
+                             for lineno, text, message in shard.errors)
+        offset += shard.lines
+
+        data = shard.records
+        if seen is not None:
+            data = _unseen(data, size + 1, seen, result)
+        records = PackedRecords(data, size)
+        result.records += len(records)
+        if not len(records):
+            continue
+        bulk = ipset.add_records(records, batch_size, keep_going)
+        result.submitted += bulk.submitted
+        result.failures.extend(bulk.failures)
+    return result
+
+
+def _unseen(data, recsize, seen, result):
+    unseen = bytearray()
+    for start in range(0, len(data), recsize):
+        record = data[start:start + recsize]
+        if record in seen:
+            result.duplicates += 1
+        else:
+            seen.add(record)
+            unseen += record
+    return bytes(unseen)
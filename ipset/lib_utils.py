@@ -1,17 +1,49 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
+import sys
+import threading
+from contextlib import contextmanager
 from .libipset.ipset import ffi, lib
 
 class Output:
-    _buffer = ""
+    # libipset's output callback carries no context, so captures are bound
+    # to sessions, and each thread records the session whose command it is
+    # running.
+    _sinks = {}
+    _lock = threading.Lock()
+    _local = threading.local()
 
     @staticmethod
-    def buffer():
-        _buffer = Output._buffer
-        Output._buffer = ""
-        return _buffer
+    def _key(session):
+        return int(ffi.cast("uintptr_t", session))
+
+    @staticmethod
+    @contextmanager
+    def capture(session, sink):
+        key = Output._key(session)
+        with Output._lock:
+            if key in Output._sinks:
+                raise RuntimeError("Session output is already captured")
+            Output._sinks[key] = sink
+        previous = getattr(Output._local, "session", None)
+        Output._local.session = key
+        try:
+            yield
+        finally:
+            Output._local.session = previous
+            with Output._lock:
+                del Output._sinks[key]
+
+    @staticmethod
+    def write(chunk):
+        key = getattr(Output._local, "session", None)
+        sink = Output._sinks.get(key)
+        if sink is None:
+            sys.stdout.write(chunk)
+        else:
+            sink(chunk)
 
 @ffi.def_extern()
 def out_buffer(str):
-    Output._buffer += ffi.string(str).decode()
-    return 0
\ No newline at end of file
+    Output.write(ffi.string(str).decode())
+    return 0
@@ -193,6 +193,7 @@ extern int ipset_data_set(struct ipset_data *data, enum ipset_opt opt,
                           const void *value);
 extern const void *ipset_data_get(const struct ipset_data *data,
                                   enum ipset_opt opt);
+extern void ipset_data_reset(struct ipset_data *data);
 
 
 /* errcode.h */
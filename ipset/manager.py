@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+manager.py
+~~~~~~~~~~
+
+Manage many sets from one listing of the kernel.
+
+An IPSetManager reads the header of every set with a single LIST command
+and caches it, builds IPSet objects for existing sets without a create
+round trip, and runs flush, destroy and rename on several sets in one
+session.
+"""
+import threading
+import time
+from .backends import resolve_backend
+from .common import SetHeader
+from .wrapper import IPSet
+
+
+class IPSetManager(object):
+
+    def __init__(self, backend=None, engine=None, pool=None, max_age=None):
+        self._backend = resolve_backend(backend, engine, pool)
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._headers = {}
+        self._loaded = None
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def stale(self):
+        if self._loaded is None:
+            return True
+        if self._max_age is None:
+            return False
+        return time.monotonic() - self._loaded > self._max_age
+
+    def refresh(self):
+        headers = self._backend.headers()
+        with self._lock:
+            self._headers = dict((header.name, header) for header in headers)
+            self._loaded = time.monotonic()
+        return headers
+
+    def invalidate(self):
+        self._loaded = None
+
+    def __cache(self):
+        if self.stale:
+            self.refresh()
+        return self._headers
+
+    def names(self):
+        return list(self.__cache())
+
+    def headers(self):
+        return list(self.__cache().values())
+
+    def header(self, name):
+        try:
+            return self.__cache()[name]
+        except KeyError:
+            raise KeyError('No set named {n!r}'.format(n=name))
+
+    def __contains__(self, name):
+        return name in self.__cache()
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        return len(self.__cache())
+
+    def get(self, name, **kwargs):
+        """Return an IPSet for an existing set, without creating it."""
+        header = self.header(name)
+        # Only types created with a family list one; the others, such as
+        # bitmap:* and list:set, take the default.
+        options = dict(set_type=header.type,
+                       set_family=header.family or 'inet',
+                       netmask=header.netmask)
+        for field in ('hashsize', 'maxelem', 'timeout'):
+            if getattr(header, field) is not None:
+                options[field] = getattr(header, field)
+        for flag in SetHeader.FLAGS:
+            options[flag] = getattr(header, flag)
+        options.update(kwargs)
+        return IPSet(name, create=False, backend=self._backend, **options)
+
+    def create(self, name, **kwargs):
+        ipset = IPSet(name, backend=self._backend, **kwargs)
+        with self._lock:
+            if name not in self._headers:
+                # Enough to build IPSets until the next refresh.
+                self._headers[name] = SetHeader(
+                    name, ipset.type, family=ipset.family,
+                    netmask=ipset.netmask, entries=0,
+                    **dict((field, value) for field, value
+                           in ipset.create_options.items()
+                           if field in SetHeader.FIELDS or
+                           field in SetHeader.FLAGS))
+        return ipset
+
+    def flush(self, names):
+        names = list(names)
+        try:
+            self._backend.flush_sets(names)
+        finally:
+            self.invalidate()
+
+    def destroy(self, names):
+        names = list(names)
+        try:
+            self._backend.destroy_sets(names)
+        except BaseException:
+            self.invalidate()
+            raise
+        with self._lock:
+            for name in names:
+                self._headers.pop(name, None)
+
+    def rename(self, renames):
+        """Rename sets, given a mapping or ``(old, new)`` pairs."""
+        if isinstance(renames, dict):
+            renames = renames.items()
+        renames = list(renames)
+        try:
+            self._backend.rename_sets(renames)
+        except BaseException:
+            self.invalidate()
+            raise
+        with self._lock:
+            for old_name, new_name in renames:
+                header = self._headers.pop(old_name, None)
+                if header is not None:
+                    header.name = new_name
+                    self._headers[new_name] = header
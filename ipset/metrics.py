@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+metrics.py
+~~~~~~~~~~
+
+Opt-in instrumentation of the libipset hot path.
+
+When enabled, the time spent in each phase of a command is recorded in a
+histogram per set and phase, and commands, elements and bytes are counted
+per set:
+
+- ``session``: taking a session from the pool, including setting one up
+- ``load_types``: ``ipset_load_types()``, once per process
+- ``encode``: writing elements into the session data
+- ``cmd``: the ``ipset_cmd()``/``ipset_commit()`` round trip to the kernel
+- ``parse``: parsing the XML of a listing
+
+Phases that are not tied to a set (``session`` and ``load_types``) are
+recorded without one. While disabled, the per-command paths only check a
+flag; rarer commands enter a shared no-op context manager.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0,
+)
+
+clock = time.perf_counter
+
+
+class Histogram(object):
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        # One count per bucket, plus one for values above the last bound.
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile q."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'buckets': list(BUCKETS),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+def _series(name, **labels):
+    labels = ','.join('{k}="{v}"'.format(
+        k=k, v=str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in sorted(labels.items()) if v is not None)
+    return '{n}{{{l}}}'.format(n=name, l=labels) if labels else name
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def observe(self, set_name, phase, seconds):
+        key = (set_name, phase)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, set_name, counter, n=1, command=None):
+        key = (counter, set_name, command)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def phase(self, set_name, phase):
+        """Time a block as one observation of a phase."""
+        if not self.enabled:
+            return _NOT_TIMED
+        return _Timer(self, set_name, phase)
+
+    def histogram(self, set_name, phase):
+        with self._lock:
+            return self._histograms.get((set_name, phase))
+
+    def snapshot(self):
+        with self._lock:
+            histograms = [dict(set=set_name, phase=phase, **h.snapshot())
+                          for (set_name, phase), h
+                          in sorted(self._histograms.items(), key=_sort_key)]
+            counters = [dict(counter=counter, set=set_name, command=command,
+                             value=value)
+                        for (counter, set_name, command), value
+                        in sorted(self._counters.items(), key=_sort_key)]
+        return {'histograms': histograms, 'counters': counters}
+
+    def prometheus(self, prefix='ipset'):
+        """Return all metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        name = prefix + '_phase_seconds'
+        if snapshot['histograms']:
+            lines.append('# HELP {n} Time spent per command phase.'
+                         .format(n=name))
+            lines.append('# TYPE {n} histogram'.format(n=name))
+        for h in snapshot['histograms']:
+            seen = 0
+            bounds = [repr(b) for b in h['buckets']] + ['+Inf']
+            for bound, n in zip(bounds, h['counts']):
+                seen += n
+                lines.append('{s} {v}'.format(
+                    s=_series(name + '_bucket', set=h['set'],
+                              phase=h['phase'], le=bound), v=seen))
+            lines.append('{s} {v!r}'.format(
+                s=_series(name + '_sum', set=h['set'], phase=h['phase']),
+                v=h['sum']))
+            lines.append('{s} {v}'.format(
+                s=_series(name + '_count', set=h['set'], phase=h['phase']),
+                v=h['count']))
+
+        typed = set()
+        for c in snapshot['counters']:
+            name = '{p}_{c}_total'.format(p=prefix, c=c['counter'])
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {n} counter'.format(n=name))
+            lines.append('{s} {v}'.format(
+                s=_series(name, set=c['set'], command=c['command']),
+                v=c['value']))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _sort_key(item):
+    return tuple('' if k is None else k for k in item[0])
+
+
+class _Timer(object):
+
+    __slots__ = ('metrics', 'set_name', 'phase', 'start')
+
+    def __init__(self, metrics, set_name, phase):
+        self.metrics = metrics
+        self.set_name = set_name
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.set_name, self.phase, clock() - self.start)
+        return False
+
+
+class _NotTimed(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOT_TIMED = _NotTimed()
+
+metrics = Metrics()
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+mirror.py
+~~~~~~~~~
+
+A local, read-mostly copy of an address set for fast membership tests.
+
+Elements are kept per prefix length in sorted tables of packed integers
+(``array('I')`` for IPv4, 16-byte big-endian records in a bytearray for
+IPv6), the same layout the kernel uses for hash:net: a lookup masks the
+address for each prefix length present and bisects. Queries are
+canonicalised like updates, so a network tested against a hash:ip
+mirror matches only if every address in it is stored.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+# Batches up to this size are inserted or deleted one by one, larger ones
+# are merged into the tables in a single pass.
+_MERGE_MIN = 64
+
+
+class _Records(object):
+    """A sorted table of 16-byte values packed in one bytearray.
+
+    Values go in and come out as ints, so the table bisects, merges and
+    filters like an ``array``.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, values=()):
+        self._data = bytearray(b''.join(value.to_bytes(16, 'big')
+                                        for value in values))
+
+    def __len__(self):
+        return len(self._data) >> 4
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self._data) >> 4:
+            raise IndexError('table index out of range')
+        start = index << 4
+        return int.from_bytes(self._data[start:start + 16], 'big')
+
+    def __iter__(self):
+        data = self._data
+        for start in range(0, len(data), 16):
+            yield int.from_bytes(data[start:start + 16], 'big')
+
+    def insert(self, index, value):
+        start = index << 4
+        self._data[start:start] = value.to_bytes(16, 'big')
+
+    def __delitem__(self, index):
+        start = index << 4
+        del self._data[start:start + 16]
+
+
+class SetMirror(object):
+
+    def __init__(self, encoder, canonical, max_age=None):
+        self._encoder = encoder
+        self._canonical = canonical
+        self._max_age = max_age
+        self._maxlen = encoder.maxlen
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._prefixes = ()
+        self._loaded = None
+
+    def _mask(self, prefix):
+        return ((1 << prefix) - 1) << (self._maxlen - prefix)
+
+    def _table(self, values=()):
+        if self._encoder.size == 4:
+            return array('I', values)
+        return _Records(values)
+
+    @property
+    def max_age(self):
+        return self._max_age
+
+    @property
+    def stale(self):
+        if self._loaded is None:
+            return True
+        if self._max_age is None:
+            return False
+        return time.monotonic() - self._loaded > self._max_age
+
+    def invalidate(self):
+        self._loaded = None
+
+    def load(self, items):
+        values = {}
+        for packed, prefix in self._canonical(items):
+            values.setdefault(prefix, set()).add(int.from_bytes(packed, 'big'))
+
+        tables = dict((prefix, self._table(sorted(v)))
+                      for prefix, v in values.items())
+        with self._lock:
+            self._tables = tables
+            self._prefixes = tuple(sorted(tables, reverse=True))
+            self._loaded = time.monotonic()
+
+    def add(self, item):
+        with self._lock:
+            for packed, prefix in self._canonical((item,)):
+                value = int.from_bytes(packed, 'big')
+                table = self._tables.get(prefix)
+                if table is None:
+                    table = self._tables[prefix] = self._table()
+                    self._prefixes = tuple(sorted(self._tables, reverse=True))
+                i = bisect_left(table, value)
+                if i == len(table) or table[i] != value:
+                    table.insert(i, value)
+
+    def remove(self, item):
+        with self._lock:
+            for packed, prefix in self._canonical((item,)):
+                value = int.from_bytes(packed, 'big')
+                table = self._tables.get(prefix, ())
+                i = bisect_left(table, value)
+                if i < len(table) and table[i] == value:
+                    del table[i]
+
+    def add_many(self, items):
+        self.__update(items, self.__insert)
+
+    def remove_many(self, items):
+        self.__update(items, self.__delete)
+
+    def __update(self, items, apply):
+        values = {}
+        for packed, prefix in self._canonical(items):
+            values.setdefault(prefix, set()).add(int.from_bytes(packed, 'big'))
+        with self._lock:
+            for prefix, batch in values.items():
+                apply(prefix, sorted(batch))
+
+    def __insert(self, prefix, batch):
+        table = self._tables.get(prefix)
+        if table is None:
+            self._tables[prefix] = self._table(batch)
+            self._prefixes = tuple(sorted(self._tables, reverse=True))
+        elif len(batch) <= _MERGE_MIN:
+            for value in batch:
+                i = bisect_left(table, value)
+                if i == len(table) or table[i] != value:
+                    table.insert(i, value)
+        else:
+            self._tables[prefix] = self._table(
+                value for value, _ in groupby(heapq.merge(table, batch)))
+
+    def __delete(self, prefix, batch):
+        table = self._tables.get(prefix)
+        if table is None:
+            return
+        if len(batch) <= _MERGE_MIN:
+            for value in batch:
+                i = bisect_left(table, value)
+                if i < len(table) and table[i] == value:
+                    del table[i]
+        else:
+            batch = set(batch)
+            self._tables[prefix] = self._table(
+                value for value in table if value not in batch)
+
+    @staticmethod
+    def track(items, seen):
+        """Pass items through, appending each to seen."""
+        for item in items:
+            seen.append(item)
+            yield item
+
+    def _find(self, prefix, value):
+        table = self._tables.get(prefix, ())
+        i = bisect_left(table, value)
+        return i < len(table) and table[i] == value
+
+    def __contains__(self, item):
+        # Queries go through the same canonical keys as updates, so hash:ip
+        # expands a network and applies its netmask, as the backends do.
+        return all(self.__match(packed, prefix)
+                   for packed, prefix in self._canonical((item,)))
+
+    def __match(self, packed, prefix):
+        value = int.from_bytes(packed, 'big')
+        if prefix != self._maxlen:
+            return self._find(prefix, value)
+        # Like the kernel, a host address matches any stored prefix.
+        for prefix in self._prefixes:
+            if self._find(prefix, value & self._mask(prefix)):
+                return True
+        return False
+
+    def __len__(self):
+        return sum(len(table) for table in self._tables.values())
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+pool.py
+~~~~~~~
+
+A bounded pool of long-lived libipset sessions.
+
+Setting up a session opens a netlink socket, which costs more than the
+command itself for small operations. The pool keeps sessions open and
+resets their data between commands instead. libipset's type registry is
+process-wide, so it is loaded once, by whichever session comes first.
+
+At most ``max_open`` sessions exist at a time; beyond that, callers wait
+for one to be returned. A command the kernel refuses leaves its session
+usable, so it goes back to the pool. Sessions are only thrown away when
+something else went wrong, or when they may still hold batched commands.
+"""
+import threading
+from contextlib import contextmanager
+from .common import IPSetError
+from .libipset.ipset import ffi, lib
+from .metrics import clock, metrics
+
+_types_lock = threading.Lock()
+_types_loaded = False
+
+
+def load_types():
+    """Register libipset's set types, once per process."""
+    global _types_loaded
+    if _types_loaded:
+        return
+    with _types_lock:
+        if not _types_loaded:
+            with metrics.phase(None, 'load_types'):
+                lib.ipset_load_types()
+            _types_loaded = True
+
+
+class SessionPool(object):
+
+    def __init__(self, max_size=8, max_open=64):
+        if max_open < 1:
+            raise ValueError('max_open must be positive')
+        self._max_size = max_size
+        self._max_open = max_open
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+        # Environment options stick to a session, so idle sessions are
+        # kept apart by the options they were opened with.
+        self._idle = {}
+        self._idle_count = 0
+        self._open = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def max_open(self):
+        return self._max_open
+
+    def _new_session(self, envopts):
+        load_types()
+        s = lib.ipset_session_init(lib.printf)
+        if s == ffi.NULL:
+            raise MemoryError('Cannot initialize ipset session')
+
+        flag = 1
+        while flag <= envopts:
+            if envopts & flag:
+                lib.ipset_envopt_parse(s, flag, ffi.NULL)
+            flag <<= 1
+        return s
+
+    def acquire(self, envopts=0):
+        evicted = None
+        with self._lock:
+            while True:
+                idle = self._idle.get(envopts)
+                if idle:
+                    self._idle_count -= 1
+                    return idle.pop()
+                if self._open < self._max_open:
+                    break
+                if self._idle_count:
+                    # Make room by closing an idle session opened with
+                    # other options.
+                    evicted = next(v for v in self._idle.values() if v).pop()
+                    self._idle_count -= 1
+                    break
+                self._returned.wait()
+            if evicted is None:
+                self._open += 1
+        if evicted is not None:
+            lib.ipset_session_fini(evicted)
+        try:
+            return self._new_session(envopts)
+        except BaseException:
+            self.__closed()
+            raise
+
+    def release(self, s, envopts=0):
+        lib.ipset_data_reset(lib.ipset_session_data(s))
+        lib.ipset_session_report_reset(s)
+        lib.ipset_session_output(s, lib.IPSET_LIST_NONE)
+        lib.ipset_session_outfn(s, lib.printf)
+
+        with self._lock:
+            if self._idle_count < self._max_size:
+                self._idle.setdefault(envopts, []).append(s)
+                self._idle_count += 1
+                self._returned.notify()
+                return
+        self.discard(s)
+
+    def discard(self, s):
+        lib.ipset_session_fini(s)
+        self.__closed()
+
+    def __closed(self):
+        with self._lock:
+            self._open -= 1
+            self._returned.notify()
+
+    @contextmanager
+    def session(self, envopts=0, batched=False):
+        """Lend a session for the duration of a with block.
+
+        ``batched`` sessions may hold commands that were buffered but not
+        committed when an error is raised, so they are never reused after
+        one.
+        """
+        if metrics.enabled:
+            start = clock()
+            s = self.acquire(envopts)
+            metrics.observe(None, 'session', clock() - start)
+        else:
+            s = self.acquire(envopts)
+        try:
+            yield s
+        except IPSetError:
+            # The kernel refused a command; the session itself is fine.
+            if batched:
+                self.discard(s)
+            else:
+                self.release(s, envopts)
+            raise
+        except BaseException:
+            # The session may be left mid-command; rebuild rather than reuse.
+            self.discard(s)
+            raise
+        else:
+            self.release(s, envopts)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._open -= self._idle_count
+            self._idle_count = 0
+            self._returned.notify_all()
+        for sessions in idle.values():
+            for s in sessions:
+                lib.ipset_session_fini(s)
+
+
+default_pool = SessionPool()
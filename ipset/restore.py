@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+restore.py
+~~~~~~~~~~
+
+Load the ``ipset save``/``ipset restore`` text format as a stream.
+
+Lines are parsed one at a time as they are read. Consecutive ``add`` or
+``del`` lines for the same set are handed to ``IPSet.add_many()`` or
+``IPSet.remove_many()`` as one lazy iterator, so they reach the kernel in
+batches while memory stays constant whatever the size of the input.
+``create``, ``flush``, ``destroy``, ``rename`` and ``swap`` go through an
+:class:`IPSetManager`. Comments, blank lines and ``COMMIT`` are skipped.
+
+Elements are passed on as text, for libipset to parse as ``ipset restore``
+would. Per-element options (``timeout``, ``comment``, counters...) cannot
+be sent through :class:`IPSet`, so lines that carry them are rejected
+unless they are told to be ignored. ``nomatch`` never is: dropping it
+would turn an exception into a match. By default the first command that
+fails stops the load; with ``keep_going`` elements the kernel rejects are
+reported and the rest of the input is still applied.
+
+Installed as the ``pyipset-restore`` command::
+
+    ipset save | ssh host pyipset-restore --exist --progress 5
+"""
+import argparse
+import sys
+import time
+from itertools import groupby
+from .common import DEFAULT_BATCH_SIZE, IPSetError
+from .manager import IPSetManager
+from .wrapper import IPSet
+
+COMMANDS = {
+    'create': 'create', '-N': 'create', 'n': 'create',
+    'add': 'add', '-A': 'add', 'a': 'add',
+    'del': 'del', '-D': 'del', 'd': 'del',
+    'flush': 'flush', '-F': 'flush', 'f': 'flush',
+    'destroy': 'destroy', '-X': 'destroy', 'x': 'destroy',
+    'rename': 'rename', '-E': 'rename', 'e': 'rename',
+    'swap': 'swap', '-W': 'swap', 'w': 'swap',
+}
+
+# The least and most arguments of every command, None for no limit.
+_ARGUMENTS = {
+    'create': (2, None),
+    'add': (2, None),
+    'del': (2, None),
+    'flush': (0, 1),
+    'destroy': (0, 1),
+    'rename': (2, 2),
+    'swap': (2, 2),
+}
+
+# Create options chosen by the kernel, which ``ipset save`` lists but a
+# new set does not need.
+_KERNEL_OPTIONS = ('bucketsize', 'initval')
+_INT_OPTIONS = ('hashsize', 'maxelem', 'timeout', 'netmask')
+_FLAG_OPTIONS = ('counters', 'comment', 'forceadd')
+
+
+def _option_names(words):
+    # Option names, leaving out quoted comment text that may hold any word.
+    quoted = False
+    for word in words:
+        if not quoted:
+            yield word
+        if word.count('"') % 2:
+            quoted = not quoted
+
+
+class RestoreError(Exception):
+
+    def __init__(self, lineno, message):
+        super(RestoreError, self).__init__(
+            'line {n}: {m}'.format(n=lineno, m=message))
+        self.lineno = lineno
+
+
+class Restorer(object):
+
+    def __init__(self, manager=None, exist=False,
+                 batch_size=DEFAULT_BATCH_SIZE, ignore_options=False,
+                 progress=None, progress_interval=None, keep_going=False,
+                 on_failure=None):
+        self._manager = manager if manager is not None else IPSetManager()
+        self._exist = exist
+        self._batch_size = batch_size
+        self._ignore_options = ignore_options
+        self._progress = progress
+        self._interval = progress_interval
+        self._keep_going = keep_going
+        self._on_failure = on_failure
+        self._sets = {}
+        self.lineno = 0
+        self.commands = 0
+        self.elements = 0
+        self.failed = 0
+        self.started = None
+        self._reported = None
+
+    @property
+    def manager(self):
+        return self._manager
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def run(self, lines):
+        """Apply every command read from an iterable of lines."""
+        self.started = self._reported = time.monotonic()
+        for (command, name), group in groupby(self.__commands(lines),
+                                              key=self.__batch_key):
+            try:
+                if command in ('add', 'del'):
+                    self.__bulk(command, name, group)
+                else:
+                    for _, args in group:
+                        self.commands += 1
+                        getattr(self, '_cmd_' + command)(*args)
+            except RestoreError:
+                raise
+            except (IPSetError, KeyError, ValueError,
+                    NotImplementedError) as e:
+                raise RestoreError(self.lineno, e.args[0] if e.args else e)
+        self.__report(final=True)
+        return self
+
+    @staticmethod
+    def __batch_key(parsed):
+        command, args = parsed
+        # Only add and del lines are batched.
+        if command in ('add', 'del'):
+            return command, args[0]
+        return command, None
+
+    def __commands(self, lines):
+        for line in lines:
+            self.lineno += 1
+            line = line.strip()
+            if not line or line.startswith('#') or line == 'COMMIT':
+                continue
+            words = line.split()
+            command = COMMANDS.get(words[0])
+            if command is None:
+                raise RestoreError(self.lineno, 'Unknown command {c!r}'
+                                   .format(c=words[0]))
+            args = words[1:]
+            least, most = _ARGUMENTS[command]
+            if len(args) < least or most is not None and len(args) > most:
+                raise RestoreError(self.lineno, 'Wrong number of arguments '
+                                   'to {c}'.format(c=command))
+            yield command, args
+
+    def __set(self, name):
+        ipset = self._sets.get(name)
+        if ipset is None:
+            ipset = self._sets[name] = self._manager.get(
+                name, ignore_existing=self._exist)
+        return ipset
+
+    def __bulk(self, command, name, group):
+        ipset = self.__set(name)
+        self.commands += 1
+        elements = self.__elements(group)
+        if command == 'add':
+            result = ipset.add_many(elements, batch_size=self._batch_size,
+                                    keep_going=self._keep_going)
+        else:
+            result = ipset.remove_many(elements, batch_size=self._batch_size,
+                                       keep_going=self._keep_going)
+        self.failed += result.failed
+        if self._on_failure is not None:
+            for failure in result.failures:
+                self._on_failure(name, command, failure)
+
+    def __elements(self, group):
+        for _, args in group:
+            if len(args) > 2 and not self._ignore_options:
+                raise RestoreError(self.lineno,
+                                   'Element options are not supported: {o}'
+                                   .format(o=' '.join(args[2:])))
+            if len(args) > 2 and 'nomatch' in _option_names(args[2:]):
+                raise RestoreError(self.lineno, 'nomatch is not supported '
+                                   'and cannot be ignored')
+            self.elements += 1
+            if self._progress is not None and not self.elements & 0xfff:
+                self.__report()
+            yield args[1]
+
+    def __report(self, final=False):
+        if self._progress is None:
+            return
+        now = time.monotonic()
+        if not final and (self._interval is None or
+                          now - self._reported < self._interval):
+            return
+        self._reported = now
+        self._progress(self)
+
+    def _cmd_create(self, name, set_type, *options):
+        kwargs = {}
+        options = list(options)
+        while options:
+            option = options.pop(0)
+            if option in _FLAG_OPTIONS:
+                kwargs[option] = True
+            elif option in _INT_OPTIONS + _KERNEL_OPTIONS + ('family',):
+                if not options:
+                    raise RestoreError(self.lineno, '{o} needs a value'
+                                       .format(o=option))
+                value = options.pop(0)
+                if option == 'family':
+                    kwargs['set_family'] = value
+                elif option in _INT_OPTIONS:
+                    kwargs[option] = int(value, 0)
+            else:
+                raise RestoreError(self.lineno, 'Unsupported create option '
+                                   '{o!r}'.format(o=option))
+        self._sets[name] = self._manager.create(
+            name, set_type=set_type, ignore_existing=self._exist, **kwargs)
+
+    def __names(self, name):
+        return [name] if name is not None else self._manager.names()
+
+    def _cmd_flush(self, name=None):
+        self._manager.flush(self.__names(name))
+
+    def _cmd_destroy(self, name=None):
+        names = self.__names(name)
+        self._manager.destroy(names)
+        for name in names:
+            self._sets.pop(name, None)
+
+    def _cmd_rename(self, old_name, new_name):
+        self._manager.rename([(old_name, new_name)])
+        ipset = self._sets.pop(old_name, None)
+        if ipset is not None:
+            ipset.name = new_name
+            self._sets[new_name] = ipset
+
+    def _cmd_swap(self, first_name, second_name):
+        first = self.__set(first_name)
+        second = self.__set(second_name)
+        IPSet.swap(first, second)
+        self._manager.invalidate()
+        # The kernel swapped contents, the cached headers and sets no longer
+        # describe the names.
+        self._sets.pop(first_name, None)
+        self._sets.pop(second_name, None)
+
+
+def report(restorer, stream=sys.stderr):
+    elapsed = restorer.elapsed
+    rate = restorer.elements / elapsed if elapsed else 0.0
+    stream.write('{l} lines, {c} commands, {e} elements, {f} failed in '
+                 '{t:.1f}s ({r:.0f} elements/s)\n'.format(
+                     l=restorer.lineno, c=restorer.commands,
+                     e=restorer.elements, f=restorer.failed, t=elapsed,
+                     r=rate))
+    stream.flush()
+
+
+def report_failure(name, command, failure, stream=sys.stderr):
+    stream.write('{c} {n} {i}: {m}\n'.format(
+        c=command, n=name, i=failure.item, m=failure.message))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyipset-restore',
+        description='Restore sets from ipset save output, as a stream.')
+    parser.add_argument('-f', '--file', default='-',
+                        help='file to read, - for stdin (the default)')
+    parser.add_argument('--exist', action='store_true',
+                        help='ignore sets and elements that already exist')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--engine', choices=('libipset', 'netlink'),
+                        default='libipset')
+    parser.add_argument('-k', '--keep-going', action='store_true',
+                        help='report elements that fail and carry on')
+    parser.add_argument('--ignore-element-options', action='store_true',
+                        help='drop per-element options instead of failing')
+    parser.add_argument('--progress', type=float, metavar='SECONDS',
+                        help='report progress every SECONDS')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    restorer = Restorer(IPSetManager(engine=args.engine), exist=args.exist,
+                        batch_size=args.batch_size,
+                        ignore_options=args.ignore_element_options,
+                        progress=None if args.quiet else report,
+                        progress_interval=args.progress,
+                        keep_going=args.keep_going,
+                        on_failure=report_failure)
+    stream = sys.stdin if args.file == '-' else open(args.file)
+    try:
+        restorer.run(stream)
+    except RestoreError as e:
+        sys.stderr.write('{p}: {e}\n'.format(p=parser.prog, e=e))
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return 1 if restorer.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+"""
+snapshot.py
+~~~~~~~~~~~
+
+A compact, versioned binary format for address set contents.
+
+Layout, all integers big-endian::
+
+    magic    8s   b"IPSETSNP"
+    version  H
+    recsize  H    bytes per record
+    count    Q    number of records
+    metalen  I    length of the JSON metadata that follows
+    meta          set name, type, family, netmask and create options
+    records       count * (packed address, prefix length u8)
+"""
+import json
+import mmap
+import struct
+
+MAGIC = b"IPSETSNP"
+VERSION = 1
+
+_HEADER = struct.Struct(">8sHHQI")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write_snapshot(path, meta, size, keys):
+    """Write ``(packed, prefixlen)`` keys of ``size``-byte addresses."""
+    meta = json.dumps(meta, sort_keys=True).encode()
+    count = 0
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, size + 1, 0, len(meta)))
+        f.write(meta)
+        record = bytearray(size + 1)
+        for packed, prefix in keys:
+            record[:size] = packed
+            record[size] = prefix
+            f.write(record)
+            count += 1
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, size + 1, count, len(meta)))
+    return count
+
+
+class PackedRecords(object):
+    """Packed ``(address, prefix length)`` records addressed by index.
+
+    Each record is a ``size``-byte address followed by one prefix length
+    byte, starting at ``offset`` in any buffer.
+    """
+
+    def __init__(self, data, size, offset=0, count=None):
+        self._data = data
+        self._size = size
+        self._offset = offset
+        if count is None:
+            count = (len(data) - offset) // (size + 1)
+        self._count = count
+        self._src = None
+        self._encoder = None
+
+    def bind(self, encoder):
+        if encoder.size != self._size:
+            raise SnapshotError("Records do not match the family")
+        self._encoder = encoder
+
+    def __len__(self):
+        return self._count
+
+    def key(self, index):
+        start = self._offset + index * (self._size + 1)
+        return (bytes(self._data[start:start + self._size]),
+                self._data[start + self._size])
+
+    describe = key
+
+    def encode(self, index):
+        if self._src is None:
+            from .libipset.ipset import ffi
+            self._ffi = ffi
+            self._src = ffi.from_buffer("uint8_t[]", self._data)
+        ip, cidr = self._encoder.buffers()
+        start = self._offset + index * (self._size + 1)
+        self._ffi.memmove(ip, self._src + start, self._size)
+        cidr[0] = self._src[start + self._size]
+        return ip, cidr
+
+    def release(self):
+        if self._src is not None:
+            self._ffi.release(self._src)
+            self._src = None
+
+
+class Snapshot(PackedRecords):
+    """A memory-mapped snapshot whose records are addressed by index."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size, start, count = self._parse()
+        except BaseException:
+            self._map.close()
+            raise
+        super(Snapshot, self).__init__(self._map, size, start, count)
+
+    def _parse(self):
+        if len(self._map) < _HEADER.size:
+            raise SnapshotError("Truncated snapshot header")
+        magic, version, recsize, count, metalen = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError("Not an ipset snapshot")
+        if version != VERSION:
+            raise SnapshotError("Unsupported snapshot version {v}"
+                                .format(v=version))
+
+        start = _HEADER.size + metalen
+        if len(self._map) != start + count * recsize:
+            raise SnapshotError("Snapshot size does not match its header")
+        self.meta = json.loads(self._map[_HEADER.size:start].decode())
+        return recsize - 1, start, count
+
+    def close(self):
+        if self._map.closed:
+            return
+        # The mapping cannot close while a cffi view exports it.
+        self.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
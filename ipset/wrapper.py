@@ -1,40 +1,24 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
 
-import ipaddress
-from contextlib import contextmanager
-from .libipset.ipset import ffi, lib
-from .lib_utils import Output
-import xml.etree.ElementTree as ET
-
-FAMILIES = [
-    'inet',
-    'inet6',
-]
-
-TYPES = [
-    'bitmap:ip',
-    'bitmap:ip,mac',
-    'bitmap:port',
-    'hash:ip',
-    'hash:mac',
-    'hash:net',
-    'hash:net,net',
-    'hash:ip,port',
-    'hash:net,port',
-    'hash:ip,port,ip',
-    'hash:ip,port,net',
-    'hash:ip,mark',
-    'hash:net,port,net',
-    'hash:net,iface',
-    'list:set',
-]
+from . import arrays, cidr
+from .arrays import ArrayElements
+from .backends import resolve_backend
+from .common import (FAMILIES, TYPES, ADDRESS_TYPES, DEFAULT_BATCH_SIZE,
+                     DEFAULT_QUEUE_SIZE, BulkResult, SyncResult, SetHeader,
+                     ElementFailure, IPSetError, hash_sizing, record_failure)
+from .counters import CounterTable
+from .encode import AddressEncoder, element_keys
+from .mirror import SetMirror
 
 
 class IPSet(object):
 
     def __init__(self, set_name, set_type="hash:ip", set_family="inet",
-                 netmask=None, create=True, ignore_existing=True):
+                 netmask=None, create=True, ignore_existing=True, pool=None,
+                 backend=None, engine=None, hashsize=None, maxelem=None,
+                 timeout=None, counters=False, comment=False, forceadd=False,
+                 expected_size=None):
 
         self._name = set_name
         self._netmask = netmask
@@ -50,9 +34,39 @@ class IPSet(object):
 
         self._family = set_family
         self._type = set_type
+        self._options = self.__create_options(
+            hashsize=hashsize, maxelem=maxelem, timeout=timeout,
+            counters=counters, comment=comment, forceadd=forceadd,
+            expected_size=expected_size)
+        self._backend = resolve_backend(backend, engine, pool)
+        self._encoder = AddressEncoder(set_family)
+        self._mirror = None
+        self._counters = None
 
         if create:
-            self.__create()
+            self._backend.create(self)
+
+    def __create_options(self, expected_size, **options):
+        hashed = self._type.startswith('hash:')
+        for option in ('hashsize', 'maxelem', 'forceadd', 'expected_size'):
+            value = expected_size if option == 'expected_size' \
+                else options[option]
+            if value and not hashed:
+                raise ValueError('{o} only applies to hash types'
+                                 .format(o=option))
+        for option in ('hashsize', 'maxelem', 'timeout'):
+            if options[option] is not None and options[option] < 0:
+                raise ValueError('{o} must not be negative'.format(o=option))
+
+        if expected_size is not None:
+            hashsize, maxelem = hash_sizing(expected_size)
+            if options['hashsize'] is None:
+                options['hashsize'] = hashsize
+            if options['maxelem'] is None:
+                options['maxelem'] = maxelem
+
+        return dict((option, value) for option, value in options.items()
+                    if value is not None and value is not False)
 
     @property
     def name(self):
@@ -74,167 +88,461 @@ class IPSet(object):
     def netmask(self):
         return self._netmask
 
-    @staticmethod
-    def __init_session():
-        lib.ipset_load_types()
-        session = lib.ipset_session_init(lib.printf)
+    @property
+    def ignore_existing(self):
+        return self._exist
 
-        return session
+    @property
+    def create_options(self):
+        return dict(self._options)
 
-    @staticmethod
-    def __close_session(session):
-        lib.ipset_session_fini(session)
+    @property
+    def mirror(self):
+        return self._mirror
 
-    @classmethod
-    @contextmanager
-    def session(cls, s):
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def pool(self):
+        return getattr(self._backend, 'pool', None)
+
+    def add(self, item):
+        self._backend.add(self, item)
+
+        if self._mirror is not None:
+            self._mirror.add(item)
+
+    def remove(self, item):
+        self._backend.delete(self, item)
+
+        if self._mirror is not None:
+            self._mirror.remove(item)
+
+    def __bulk(self, run, items, batch_size, update, keep_going):
+        mirror = self._mirror
+        if mirror is not None:
+            seen = []
+            items = mirror.track(items, seen)
         try:
-            yield s
-        finally:
-            cls.__close_session(s)
+            result = run(self, items, batch_size, keep_going)
+        except BaseException:
+            # Part of the batch may have reached the kernel.
+            if mirror is not None:
+                mirror.invalidate()
+            raise
+        if mirror is not None:
+            self.__update_mirror(mirror, update, seen, result)
+        return result
 
-    def __create(self):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+    @staticmethod
+    def __update_mirror(mirror, update, items, result, key=None):
+        # The whole bulk operation is merged into the mirror at once, but
+        # for the elements that failed.
+        if result.failures:
+            failed = set(failure.lineno for failure in result.failures)
+            items = (item for lineno, item in enumerate(items, 1)
+                     if lineno not in failed)
+        if key is not None:
+            items = map(key, items)
+        try:
+            update(mirror, items)
+        except ValueError:
+            # An element the kernel took but the mirror cannot parse.
+            mirror.invalidate()
+
+    def add_many(self, items, batch_size=DEFAULT_BATCH_SIZE, collapse=False,
+                 keep_going=False):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+
+        received = None
+        if collapse:
+            if self._type not in ADDRESS_TYPES:
+                raise ValueError('Only {t} elements can be collapsed'
+                                 .format(t=' and '.join(ADDRESS_TYPES)))
+            # Elements that do not parse fail at their own position; the
+            # rest are collapsed and sent.
+            rejected = BulkResult()
+            keys = []
+            for lineno, item in enumerate(items, 1):
+                try:
+                    keys.append(self._encoder.pack(item))
+                except (ValueError, TypeError) as e:
+                    record_failure(rejected,
+                                   ElementFailure(lineno, item, str(e)),
+                                   keep_going, self._name, 'add')
+            received = len(keys) + len(rejected.failures)
+            if self._type == 'hash:ip' and self._family == 'inet6':
+                # The kernel takes nothing but single IPv6 addresses in
+                # hash:ip, so there are only duplicates to drop.
+                items = sorted(set(keys))
+            else:
+                items = cidr.collapse(keys, self._encoder.maxlen)
+
+        result = self.__bulk(self._backend.add_many, items, batch_size,
+                             SetMirror.add_many, keep_going)
+        if received is not None:
+            result.received = received
+            result.submitted += len(rejected.failures)
+            result.failures[:0] = rejected.failures
+        return result
+
+    def remove_many(self, items, batch_size=DEFAULT_BATCH_SIZE,
+                    keep_going=False):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+
+        return self.__bulk(self._backend.delete_many, items, batch_size,
+                           SetMirror.remove_many, keep_going)
+
+    def add_array(self, addrs, prefixes=None, batch_size=DEFAULT_BATCH_SIZE,
+                  keep_going=False):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Adding to {t} not implemented yet'
+                                      .format(t=self._type))
 
-            lib.ipset_data_set(lib.ipset_session_data(s),
-                             lib.IPSET_OPT_TYPENAME, self._type.encode())
+        elements = ArrayElements(self._encoder, addrs, prefixes)
+        return self.__add_indexed(elements, batch_size, keep_going)
 
-            t = lib.ipset_type_get(s, lib.IPSET_CMD_CREATE)
-            lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_TYPE, t)
+    def add_records(self, records, batch_size=DEFAULT_BATCH_SIZE,
+                    keep_going=False):
+        """Add PackedRecords, such as a Snapshot or a parsed feed."""
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Adding to {t} not implemented yet'
+                                      .format(t=self._type))
 
-            if self._exist:
-                lib.ipset_envopt_parse(s, lib.IPSET_ENV_EXIST, ffi.NULL)
+        records.bind(self._encoder)
+        return self.__add_indexed(records, batch_size, keep_going)
 
-            family_ptr = None
-            if self._family == 'inet':
-                family_ptr = ffi.new("int *", lib.NFPROTO_IPV4)
-            elif self._family == 'inet6':
-                family_ptr = ffi.new("int *", lib.NFPROTO_IPV6)
+    def __indexed(self, run, update, elements, batch_size, keep_going):
+        mirror = self._mirror
+        try:
+            result = run(self, elements, batch_size, keep_going)
+        except BaseException:
+            # Part of the batch may have reached the kernel.
+            if mirror is not None:
+                mirror.invalidate()
+            raise
+        if mirror is not None:
+            self.__update_mirror(mirror, update, range(len(elements)),
+                                 result, elements.key)
+        return result
+
+    def __add_indexed(self, elements, batch_size, keep_going=False):
+        return self.__indexed(self._backend.add_indexed, SetMirror.add_many,
+                              elements, batch_size, keep_going)
+
+    def remove_array(self, addrs, prefixes=None,
+                     batch_size=DEFAULT_BATCH_SIZE, keep_going=False):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Removing from {t} not implemented yet'
+                                      .format(t=self._type))
 
-            lib.ipset_data_set(lib.ipset_session_data(s),
-                             lib.IPSET_OPT_FAMILY, family_ptr)
+        elements = ArrayElements(self._encoder, addrs, prefixes)
+        return self.__indexed(self._backend.delete_indexed,
+                              SetMirror.remove_many, elements, batch_size,
+                              keep_going)
 
-            if self._netmask is not None:
-                mask = ffi.new("struct in_addr *")
-                mask.s_addr = int(self._netmask)
-                lib.ipset_data_set(lib.ipset_session_data(s),
-                                 lib.IPSET_OPT_NETMASK, mask)
+    def test_array(self, addrs, prefixes=None):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Testing {t} not implemented yet'
+                                      .format(t=self._type))
 
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_CREATE, 0)
-            assert rc == 0
+        elements = ArrayElements(self._encoder, addrs, prefixes)
+        numpy = arrays.require_numpy()
+        return numpy.array(self._backend.test_indexed(self, elements),
+                           dtype=bool)
 
-    def add(self, item):
-        if self._type == 'hash:ip':
-            ip = None
-            cidr = None
-            ip_net = ipaddress.ip_network(item)
-            ip = ffi.new("union nf_inet_addr *")
-            af = None
-            if isinstance(ip_net, ipaddress.IPv4Network):
-                af = lib.AF_INET
-            elif isinstance(ip_net, ipaddress.IPv6Network):
-                af = lib.AF_INET6
-            rc = lib.inet_pton(af, str(ip_net.network_address).encode(), ip)
-            assert rc == 1
-            cidr = int(ip_net.prefixlen)
-
-            with self.__class__.session(self.__init_session()) as s:
-                rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                      lib.IPSET_SETNAME, self._name.encode())
-                assert rc == 0
-
-                t = lib.ipset_type_get(s, lib.IPSET_CMD_ADD)
-                lib.ipset_data_set(lib.ipset_session_data(s),
-                                 lib.IPSET_OPT_TYPE, t)
-
-                if self._exist:
-                    lib.ipset_envopt_parse(s, lib.IPSET_ENV_EXIST, ffi.NULL)
-
-                lib.ipset_data_set(lib.ipset_session_data(s),
-                                 lib.IPSET_OPT_IP, ip)
-
-                lib.ipset_data_set(lib.ipset_session_data(s),
-                                 lib.IPSET_OPT_CIDR, ffi.new("uint8_t *", cidr))
-
-                rc = lib.ipset_cmd(s, lib.IPSET_CMD_ADD, 0)
-                assert rc == 0
+    def to_array(self, with_prefixes=False):
+        addrs, prefixes = arrays.to_arrays(self._encoder, self.iter_elements())
+        if with_prefixes:
+            return addrs, prefixes
+        return addrs
 
-        else:
-            raise NotImplementedError('Adding to {t} not implemented yet'
+    def snapshot(self, path):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Snapshots of {t} not implemented yet'
                                       .format(t=self._type))
-        return
 
-    def remove(self, item):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                    lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+        header = self.header()
+        meta = {
+            'name': self._name,
+            'type': self._type,
+            'family': self._family,
+            'netmask': self._netmask,
+            'create': dict(self._options),
+        }
+        # The kernel may have grown the hash since the set was created.
+        for field in ('hashsize', 'maxelem', 'timeout'):
+            if getattr(header, field) is not None:
+                meta['create'][field] = getattr(header, field)
+        from .snapshot import write_snapshot
+        keys = (self._encoder.pack(elem) for elem in self.iter_elements())
+        return write_snapshot(path, meta, self._encoder.size, keys)
 
-            t = lib.ipset_type_get(s, lib.IPSET_CMD_DEL)
-            lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_TYPE, t)
+    @classmethod
+    def restore(cls, path, set_name=None, batch_size=DEFAULT_BATCH_SIZE,
+                **kwargs):
+        from .snapshot import Snapshot
+        with Snapshot(path) as snap:
+            meta = snap.meta
+            options = dict(meta.get('create', {}))
+            options.update(kwargs)
+            restored = cls(set_name=set_name or meta['name'],
+                           set_type=meta['type'], set_family=meta['family'],
+                           netmask=meta['netmask'], **options)
+            restored.add_records(snap, batch_size)
+        return restored
+
+    def __keys(self, items):
+        return element_keys(self._encoder, self._type, self._netmask, items)
+
+    def sync(self, desired, swap_threshold=0.5,
+             batch_size=DEFAULT_BATCH_SIZE):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Syncing {t} not implemented yet'
+                                      .format(t=self._type))
 
-            rc = lib.ipset_parse_elem(s, lib.IPSET_SETNAME, item.encode())
-            assert rc == 0
+        current = set(self.__keys(self.iter_elements()))
+        wanted = set(self.__keys(desired))
+        additions = wanted - current
+        deletions = current - wanted
+        result = SyncResult(unchanged=len(current & wanted))
+
+        delta = len(additions) + len(deletions)
+        if delta > swap_threshold * max(len(current), len(wanted)):
+            # Rebuilding costs about len(wanted) kernel operations and is
+            # atomic, so it wins once the delta is a large share of the set.
+            self.__replace('-sync', len(wanted),
+                           lambda shadow: shadow.add_many(
+                               wanted, batch_size=batch_size),
+                           lambda: wanted)
+            result.swapped = True
+        else:
+            unpack = self._encoder.unpack
+            self.add_many(additions, batch_size=batch_size)
+            self.remove_many((unpack(*key) for key in deletions),
+                             batch_size=batch_size)
+
+        result.added = len(additions)
+        result.removed = len(deletions)
+        return result
+
+    def __replace(self, suffix, size, load, keys):
+        # Load a new set of the same kind and swap it in for this one.
+        options = self.__live_options()
+        if self._type.startswith('hash:'):
+            hashsize, maxelem = hash_sizing(size)
+            options['hashsize'] = max(options.get('hashsize', 0), hashsize)
+            options['maxelem'] = max(options.get('maxelem', 0),
+                                     size if 'maxelem' in options
+                                     else maxelem)
+        name = self._name[:31 - len(suffix)] + suffix
+        try:
+            # A shadow left behind by a process that died mid-rebuild.
+            self._backend.destroy_sets([name])
+        except IPSetError:
+            pass
+        shadow = IPSet(set_name=name, set_type=self._type,
+                       set_family=self._family, netmask=self._netmask,
+                       ignore_existing=False, backend=self._backend,
+                       **options)
+        mirror = self._mirror
+        exist = self._exist
+        try:
+            result = load(shadow)
+            IPSet.swap(self, shadow)
+        finally:
+            shadow.destroy()
+        # The swap handed this object the shadow's state, which was
+        # created without ignore_existing.
+        self._exist = exist
+        if mirror is not None:
+            mirror.load(keys())
+            self._mirror = mirror
+        return result
+
+    def __live_options(self):
+        # The create options of the set in the kernel, which may have more
+        # than this object was given, e.g. when opened with create=False.
+        options = dict(self._options)
+        header = self.header()
+        for field in ('hashsize', 'maxelem', 'timeout'):
+            if getattr(header, field) is not None:
+                options[field] = getattr(header, field)
+        for flag in SetHeader.FLAGS:
+            if getattr(header, flag):
+                options[flag] = True
+        return options
+
+    def __intervals(self):
+        from .algebra import Intervals
+        netmask = self._netmask if self._type == 'hash:ip' else None
+        return Intervals.from_elements(self._encoder, self.iter_elements(),
+                                       netmask)
+
+    def __algebra(self, operation, others, into, batch_size):
+        into = self if into is None else into
+        for ipset in (self, into) + others:
+            if not isinstance(ipset, IPSet):
+                raise TypeError('Set algebra needs {c} instances'
+                                .format(c=IPSet.__name__))
+            if ipset.type not in ADDRESS_TYPES:
+                raise NotImplementedError('Set algebra on {t} not '
+                                          'implemented yet'
+                                          .format(t=ipset.type))
+            if ipset.family != self._family:
+                raise ValueError('The sets do not have the same family')
+
+        intervals = self.__intervals()
+        for other in others:
+            intervals = getattr(intervals, operation)(other.__intervals())
+        # IPv6 hash:ip sets only take single addresses, so blocks are
+        # expanded, at most to as many as the set may hold.
+        hosts = into.type == 'hash:ip' and into.family == 'inet6'
+        if hosts:
+            maxelem = into.header().maxelem
+            if maxelem is not None and intervals.addresses > maxelem:
+                raise ValueError('The result has {n} addresses, more than '
+                                 'the {m} {s} can hold'.format(
+                                     n=intervals.addresses, m=maxelem,
+                                     s=into.name))
+        records = intervals.records(hosts)
+        # hash:ip stores every address of a block.
+        size = intervals.addresses if into.type == 'hash:ip' \
+            else len(records)
+        return into.__replace('-tmp', size,
+                              lambda shadow: shadow.add_records(
+                                  records, batch_size),
+                              lambda: (records.key(i)
+                                       for i in range(len(records))))
+
+    def union(self, *others, into=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Store the union of this set and others.
+
+        The result replaces the contents of ``into``, by default this set,
+        in one atomic swap. Elements are taken as the addresses they match,
+        so networks and host addresses of hash:ip and hash:net sets of the
+        same family combine, and the result is stored as the fewest CIDR
+        blocks, or as single addresses in IPv6 hash:ip sets. Returns the
+        BulkResult of loading the result.
+        """
+        return self.__algebra('union', others, into, batch_size)
+
+    def intersection(self, *others, into=None,
+                     batch_size=DEFAULT_BATCH_SIZE):
+        """Store the addresses in this set and all others, as union()."""
+        return self.__algebra('intersection', others, into, batch_size)
+
+    def difference(self, *others, into=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Store the addresses in this set but no other, as union()."""
+        return self.__algebra('difference', others, into, batch_size)
+
+    def enable_mirror(self, max_age=None):
+        if self._type not in ADDRESS_TYPES:
+            raise NotImplementedError('Mirroring {t} not implemented yet'
+                                      .format(t=self._type))
+
+        mirror = SetMirror(self._encoder, self.__keys, max_age=max_age)
+        mirror.load(self.iter_elements())
+        self._mirror = mirror
 
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_DEL, 0)
-            assert rc == 0
+    def disable_mirror(self):
+        self._mirror = None
 
     def test(self, item):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                    lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+        mirror = self._mirror
+        if mirror is not None:
+            if mirror.stale:
+                mirror.load(self.iter_elements())
+            return item in mirror
+
+        return self._backend.test(self, item)
+
+    def iter_members(self, queue_size=DEFAULT_QUEUE_SIZE):
+        return self._backend.iter_members(self, queue_size)
+
+    def iter_elements(self, queue_size=DEFAULT_QUEUE_SIZE):
+        for member in self.iter_members(queue_size):
+            yield member.findtext("elem")
+
+    def poll_counters(self, queue_size=DEFAULT_QUEUE_SIZE):
+        """Return the elements whose counters changed since the last poll.
+
+        The set must have been created with counters. Returns a list of
+        CounterDelta with the current counters, their increase and their
+        rate per second since the previous poll.
+        """
+        if not self._options.get('counters') and \
+                not self.header().counters:
+            raise ValueError('Set {n} was not created with counters'
+                             .format(n=self._name))
+        if self._counters is None:
+            self._counters = CounterTable()
+        return self._counters.poll(self.iter_members(queue_size))
+
+    def top_counters(self, n=10, by='byte_rate'):
+        """Return the n elements with the highest counter or rate.
+
+        Ranks the elements of the last poll_counters() by ``packets``,
+        ``bytes``, ``packet_rate`` or ``byte_rate``.
+        """
+        if self._counters is None:
+            return []
+        return self._counters.top(n, by)
 
-            t = lib.ipset_type_get(s, lib.IPSET_CMD_TEST)
-            lib.ipset_data_set(lib.ipset_session_data(s), lib.IPSET_OPT_TYPE, t)
+    def list_get(self):
+        return list(self.iter_elements())
 
-            rc = lib.ipset_parse_elem(s, 1, item.encode())
-            assert rc == 0
+    def header(self):
+        return self._backend.header(self)
 
-            return lib.ipset_cmd(s, lib.IPSET_CMD_TEST, 0) == 0
+    def __len__(self):
+        entries = self.header().entries
+        if entries is None:
+            # Kernels before numentries was reported.
+            return sum(1 for _ in self.iter_elements())
+        return entries
 
-    def list_get(self):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+    def __bool__(self):
+        return True
 
-            lib.ipset_session_output(s, lib.IPSET_LIST_XML)
-            lib.ipset_session_outfn(s, lib.out_fn)
+    @property
+    def memsize(self):
+        return self.header().memsize
 
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_LIST, 0)
-            assert rc == 0
+    @property
+    def references(self):
+        return self.header().references
 
-            tree = ET.fromstring(Output.buffer())
-            return [e.text for e in tree.iter("elem")]
+    @property
+    def hashsize(self):
+        return self.header().hashsize
 
-    def list(self):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+    @property
+    def maxelem(self):
+        return self.header().maxelem
 
-            lib.ipset_session_output(s, lib.IPSET_LIST_PLAIN)
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_LIST, 0)
-            assert rc == 0
+    @property
+    def timeout(self):
+        return self.header().timeout
 
-            return
+    def list(self):
+        self._backend.list(self)
 
-    def destroy(self):
-        with self.__class__.session(self.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_SETNAME, self._name.encode())
-            assert rc == 0
+    def flush(self):
+        self._backend.flush_sets([self._name])
+        if self._mirror is not None:
+            self._mirror.load(())
 
-            t = lib.ipset_type_get(s, lib.IPSET_CMD_DESTROY)
-            lib.ipset_data_set(lib.ipset_session_data(s),
-                             lib.IPSET_OPT_TYPE, t)
+    def rename(self, new_name):
+        self._backend.rename_sets([(self._name, new_name)])
+        self._name = new_name
 
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_DESTROY, 0)
-            assert rc == 0
+    def destroy(self):
+        self._backend.destroy(self)
         self.__dict__ = {}
 
     @classmethod
@@ -245,21 +553,10 @@ class IPSet(object):
             raise Exception('Both arguments must be {c} instances'
                             .format(c=cls.__name__))
 
-        with cls.session(cls.__init_session()) as s:
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_SETNAME, first_set.name.encode())
-            assert rc == 0
-
-            t = lib.ipset_type_get(s, lib.IPSET_CMD_SWAP)
-            lib.ipset_data_set(lib.ipset_session_data(s),
-                             lib.IPSET_OPT_TYPE, t)
-
-            rc = lib.ipset_data_set(lib.ipset_session_data(s),
-                                  lib.IPSET_OPT_SETNAME2, second_set.name.encode())
-            assert rc == 0
+        if not first_set.backend.shares_sets(second_set.backend):
+            raise ValueError('The sets do not share a backend')
 
-            rc = lib.ipset_cmd(s, lib.IPSET_CMD_SWAP, 0)
-            assert rc == 0
+        first_set.backend.swap(first_set, second_set)
         first_set.name, second_set.name = second_set.name, first_set.name
         first_set.__dict__, second_set.__dict__ =\
             second_set.__dict__, first_set.__dict__
@@ -10,6 +10,14 @@ setup(
     install_requires=[
         'ipaddress',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': [
+            'pyipset-restore = ipset.restore:main',
+        ],
+    },
     author='Cory Benfield',
     author_email='cory@lukasa.co.uk',
     description='A Python wrapper around libipset.'
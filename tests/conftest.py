@@ -0,0 +1,18 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.backends.memory import MemoryBackend
+from ipset.wrapper import IPSet
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend()
+
+
+@pytest.fixture
+def make_set(backend):
+    def make(name, set_type='hash:ip', set_family='inet', **kwargs):
+        return IPSet(set_name=name, set_type=set_type, set_family=set_family,
+                     backend=backend, **kwargs)
+    return make
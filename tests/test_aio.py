@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import asyncio
+import threading
+import pytest
+from ipset.aio import AsyncIPSet
+from ipset.backends.memory import MemoryBackend
+from ipset.common import IPSetError
+from ipset.wrapper import IPSet
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def hold(ipset):
+    """Make the next test() block until the returned event is set."""
+    release = threading.Event()
+    test = ipset.test
+
+    def held(item):
+        release.wait(5)
+        return test(item)
+    ipset.test = held
+    return release
+
+
+def test_queued_adds_are_batched(make_set):
+    ipset = make_set('batched', ignore_existing=False)
+    batches = []
+    add_many = ipset.add_many
+
+    def record(items, **kwargs):
+        items = list(items)
+        batches.append(len(items))
+        return add_many(items, **kwargs)
+    ipset.add_many = record
+
+    async def main():
+        async with AsyncIPSet(ipset) as aset:
+            release = hold(ipset)
+            blocked = aset.test('10.0.0.1')
+            adds = [aset.add('10.0.0.{i}'.format(i=i)) for i in range(10)]
+            release.set()
+            assert not await blocked
+            await asyncio.gather(*adds)
+    run(main())
+    assert batches == [10]
+    assert len(ipset) == 10
+
+
+def test_batch_errors_fail_only_their_job(make_set):
+    ipset = make_set('batched', ignore_existing=False)
+    ipset.add('10.0.0.2')
+
+    async def main():
+        async with AsyncIPSet(ipset) as aset:
+            release = hold(ipset)
+            blocked = aset.test('10.0.0.1')
+            adds = [aset.add(item) for item in ('10.0.0.1', '10.0.0.2',
+                                                'bad', '10.0.0.3')]
+            release.set()
+            await blocked
+            return await asyncio.gather(*adds, return_exceptions=True)
+    results = run(main())
+    assert results[0] is None and results[3] is None
+    assert isinstance(results[1], IPSetError)
+    assert isinstance(results[2], IPSetError)
+    assert [failure.item for failure in results[2].failures] == ['bad']
+    assert len(ipset) == 3
+
+
+def test_workers_keep_submission_order():
+    ipset = IPSet('ordered', backend=MemoryBackend(latency=0.001),
+                  ignore_existing=False)
+
+    async def main():
+        async with AsyncIPSet(ipset, workers=4) as aset:
+            jobs = []
+            for i in range(50):
+                item = '10.0.0.{i}'.format(i=i)
+                jobs += [aset.add(item), aset.remove(item), aset.test(item),
+                         aset.add(item), aset.test(item)]
+            return await asyncio.gather(*jobs, return_exceptions=True)
+    results = run(main())
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert set(results[2::5]) == {False}
+    assert set(results[4::5]) == {True}
+    assert len(ipset) == 50
+
+
+def test_reads_and_swap(make_set):
+    first = make_set('first')
+    second = make_set('second')
+    second.add('10.0.0.9')
+
+    async def main():
+        async with AsyncIPSet(first, workers=2) as aset:
+            await aset.add('10.0.0.1')
+            assert await aset.test('10.0.0.1')
+            listing = await aset.list()
+            assert listing is not None
+            await aset.swap(second)
+            assert await aset.test('10.0.0.9')
+            assert not await aset.test('10.0.0.1')
+    run(main())
+    assert second.test('10.0.0.1')
+
+
+def test_workers_must_be_positive(make_set):
+    with pytest.raises(ValueError):
+        AsyncIPSet(make_set('idle'), workers=0)
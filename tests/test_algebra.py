@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+
+
+def elements(ipset):
+    return sorted(ipset.iter_elements())
+
+
+@pytest.fixture
+def nets(make_set):
+    first = make_set('first', set_type='hash:net')
+    first.add_many(['10.0.0.0/24', '10.0.2.0/24'])
+    second = make_set('second', set_type='hash:net')
+    second.add_many(['10.0.1.0/24', '10.0.2.128/25'])
+    return first, second
+
+
+def test_union(nets):
+    first, second = nets
+    first.union(second)
+    assert elements(first) == ['10.0.0.0/23', '10.0.2.0/24']
+
+
+def test_intersection(nets, make_set):
+    first, second = nets
+    into = make_set('into', set_type='hash:net')
+    first.intersection(second, into=into)
+    assert elements(into) == ['10.0.2.128/25']
+    assert elements(first) == ['10.0.0.0/24', '10.0.2.0/24']
+
+
+def test_difference(nets):
+    first, second = nets
+    first.difference(second)
+    assert elements(first) == ['10.0.0.0/24', '10.0.2.0/25']
+
+
+def test_hosts_and_networks(make_set):
+    hosts = make_set('hosts')
+    hosts.add_many(['10.0.0.1', '10.0.0.2', '10.0.0.3', '192.168.0.1'])
+    nets = make_set('nets', set_type='hash:net')
+    nets.add('10.0.0.0/31')
+    hosts.difference(nets)
+    assert elements(hosts) == ['10.0.0.2', '10.0.0.3', '192.168.0.1']
+
+
+def test_ipv6(make_set):
+    first = make_set('first6', set_type='hash:net', set_family='inet6')
+    first.add_many(['2001:db8::/64', '2001:db8:0:2::/64'])
+    second = make_set('second6', set_type='hash:net', set_family='inet6')
+    second.add('2001:db8:0:1::/64')
+    first.union(second)
+    assert elements(first) == sorted(['2001:db8::/63', '2001:db8:0:2::/64'])
+    first.difference(second)
+    assert elements(first) == sorted(['2001:db8::/64', '2001:db8:0:2::/64'])
+
+
+def test_ipv6_hash_ip_gets_single_addresses(make_set):
+    nets = make_set('nets6', set_type='hash:net', set_family='inet6')
+    nets.add('2001:db8::/126')
+    hosts = make_set('hosts6', set_family='inet6')
+    hosts.add('2001:db8::9')
+    nets.union(hosts, into=hosts)
+    assert elements(hosts) == ['2001:db8::', '2001:db8::1', '2001:db8::2',
+                               '2001:db8::3', '2001:db8::9']
+
+
+def test_ipv6_hash_ip_too_small(make_set):
+    nets = make_set('nets6', set_type='hash:net', set_family='inet6')
+    nets.add('2001:db8::/64')
+    hosts = make_set('hosts6', set_family='inet6')
+    with pytest.raises(ValueError):
+        nets.union(into=hosts)
+
+
+def test_family_mismatch(make_set):
+    four = make_set('four')
+    six = make_set('six', set_family='inet6')
+    with pytest.raises(ValueError):
+        four.union(six)
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.common import IPSetError
+
+numpy = pytest.importorskip('numpy')
+
+
+def test_add_array(make_set):
+    ipset = make_set('arrays', set_type='hash:net')
+    ipset.add_array(numpy.array([0x0a000000, 0xc0a80100], dtype=numpy.uint32),
+                    numpy.array([8, 24], dtype=numpy.uint8))
+    assert sorted(ipset.iter_elements()) == ['10.0.0.0/8', '192.168.1.0/24']
+    assert list(ipset.test_array([0x0a010203, 0x0b000000])) == [True, False]
+
+
+def test_out_of_range_values(make_set):
+    ipset = make_set('arrays', set_type='hash:net')
+    result = ipset.add_array(numpy.array([1, -1, 2 ** 32, 2]),
+                             numpy.array([32, 32, 32, 300]), keep_going=True)
+    assert [failure.lineno for failure in result.failures] == [2, 3, 4]
+    assert sorted(ipset.iter_elements()) == ['0.0.0.1']
+    with pytest.raises(IPSetError):
+        ipset.add_array([-1])
+
+
+def test_remove_array_keeps_mirror(make_set):
+    ipset = make_set('arrays')
+    ipset.add_many(['0.0.0.1', '0.0.0.2'])
+    ipset.enable_mirror()
+    result = ipset.remove_array(numpy.array([1, -1]), keep_going=True)
+    assert [failure.item for failure in result.failures] == [1]
+    assert not ipset.mirror.stale
+    assert not ipset.test('0.0.0.1')
+    assert ipset.test('0.0.0.2')
+
+
+def test_to_array(make_set):
+    ipset = make_set('arrays', set_type='hash:net')
+    ipset.add_many(['10.0.0.0/8', '192.168.1.1'])
+    addrs, prefixes = ipset.to_array(with_prefixes=True)
+    assert sorted(zip(addrs.tolist(), prefixes.tolist())) == \
+        [(0x0a000000, 8), (0xc0a80101, 32)]
+
+
+def test_ipv6_arrays(make_set):
+    ipset = make_set('arrays6', set_family='inet6')
+    addrs = numpy.zeros((2, 16), dtype=numpy.uint8)
+    addrs[0, 15] = 1
+    addrs[1, 15] = 2
+    ipset.add_array(addrs)
+    assert sorted(ipset.iter_elements()) == ['::1', '::2']
+    with pytest.raises(ValueError):
+        ipset.add_array(numpy.zeros(3, dtype=numpy.uint8))
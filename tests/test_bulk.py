@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+
+
+def elements(ipset):
+    return sorted(ipset.iter_elements())
+
+
+def test_add_many(make_set):
+    ipset = make_set('bulk')
+    result = ipset.add_many(['10.0.0.1', '10.0.0.2', '10.0.0.3'],
+                            batch_size=2)
+    assert result.submitted == 3
+    assert result.batches == 2
+    assert not result.failures
+    assert elements(ipset) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+
+
+def test_add_many_takes_any_iterable(make_set):
+    ipset = make_set('bulk', set_type='hash:net')
+    result = ipset.add_many('10.{}.0.0/16'.format(i) for i in range(5))
+    assert result.submitted == 5
+    assert len(ipset) == 5
+
+
+def test_remove_many(make_set):
+    ipset = make_set('bulk')
+    ipset.add_many(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+    result = ipset.remove_many(['10.0.0.1', '10.0.0.3'], batch_size=1)
+    assert result.batches == 2
+    assert elements(ipset) == ['10.0.0.2']
+
+
+def test_batch_size_must_be_positive(make_set):
+    ipset = make_set('bulk')
+    with pytest.raises(ValueError):
+        ipset.add_many(['10.0.0.1'], batch_size=0)
+    with pytest.raises(ValueError):
+        ipset.remove_many(['10.0.0.1'], batch_size=0)
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset import cidr
+from ipset.common import IPSetError
+from ipset.encode import AddressEncoder
+
+
+def elements(ipset):
+    return sorted(ipset.iter_elements())
+
+
+def test_collapse_keys():
+    encoder = AddressEncoder('inet')
+    keys = [encoder.pack(item) for item in
+            ('10.0.0.0/24', '10.0.1.0/24', '10.0.0.128/25', '10.0.3.0/24')]
+    assert [encoder.unpack(*key) for key in cidr.collapse(keys, 32)] == \
+        ['10.0.0.0/23', '10.0.3.0/24']
+
+
+def test_cover_splits_zero_prefix():
+    assert list(cidr.cover([(0, 2 ** 32 - 1)], 32)) == \
+        [(b'\x00\x00\x00\x00', 1), (b'\x80\x00\x00\x00', 1)]
+
+
+def test_range_to_cidrs():
+    assert list(cidr.range_to_cidrs(1, 6, 32)) == \
+        [(1, 32), (2, 31), (4, 31), (6, 32)]
+
+
+def test_add_many_collapse(make_set):
+    ipset = make_set('collapsed', set_type='hash:net')
+    result = ipset.add_many(['10.0.0.0/25', '10.0.0.128/25', '10.0.0.7',
+                             '10.0.1.0/24'], collapse=True)
+    assert result.received == 4
+    assert result.submitted == 1
+    assert elements(ipset) == ['10.0.0.0/23']
+
+
+def test_collapse_keeps_going_past_malformed(make_set):
+    ipset = make_set('collapsed', set_type='hash:net')
+    result = ipset.add_many(['10.0.0.0/24', 'bad', '10.0.1.0/24'],
+                            collapse=True, keep_going=True)
+    assert [(failure.lineno, failure.item)
+            for failure in result.failures] == [(2, 'bad')]
+    assert result.received == 3
+    assert elements(ipset) == ['10.0.0.0/23']
+    with pytest.raises(IPSetError):
+        ipset.add_many(['10.0.2.0/24', 'bad'], collapse=True)
+
+
+def test_ipv6_hash_ip_is_not_collapsed(make_set):
+    ipset = make_set('collapsed6', set_family='inet6')
+    ipset.add_many(['::1', '::0', '::1'], collapse=True)
+    assert elements(ipset) == ['::', '::1']
+
+
+def test_collapse_needs_address_type(make_set):
+    ipset = make_set('ports', set_type='hash:ip,port')
+    with pytest.raises(ValueError):
+        ipset.add_many(['10.0.0.1,tcp:80'], collapse=True)
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.manager import IPSetManager
+
+
+def test_poll_counters(make_set, backend):
+    ipset = make_set('counted', counters=True)
+    ipset.add_many(['10.0.0.1', '10.0.0.2'])
+    first = ipset.poll_counters()
+    assert sorted(delta.elem for delta in first) == ['10.0.0.1', '10.0.0.2']
+
+    backend.count_traffic(ipset, '10.0.0.2', packets=3, bytes=300)
+    changed = ipset.poll_counters()
+    assert [(delta.elem, delta.delta_packets, delta.delta_bytes)
+            for delta in changed] == [('10.0.0.2', 3, 300)]
+    assert ipset.poll_counters() == []
+    assert ipset.top_counters(1, by='bytes')[0].elem == '10.0.0.2'
+
+
+def test_poll_counters_readded(make_set, backend):
+    ipset = make_set('counted', counters=True)
+    ipset.add('10.0.0.1')
+    backend.count_traffic(ipset, '10.0.0.1', packets=5)
+    ipset.poll_counters()
+    ipset.remove('10.0.0.1')
+    ipset.add('10.0.0.1')
+    backend.count_traffic(ipset, '10.0.0.1', packets=2)
+    changed = ipset.poll_counters()
+    assert [(delta.elem, delta.delta_packets) for delta in changed] == \
+        [('10.0.0.1', 2)]
+
+
+def test_poll_counters_opened_set(make_set, backend):
+    make_set('counted', counters=True).add('10.0.0.1')
+    opened = IPSetManager(backend=backend).get('counted')
+    assert [delta.elem for delta in opened.poll_counters()] == ['10.0.0.1']
+
+
+def test_poll_counters_needs_counters(make_set):
+    with pytest.raises(ValueError):
+        make_set('uncounted').poll_counters()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.common import IPSetError
+from ipset.elements import mac_address, port_number, proto_port, \
+    split_element
+from ipset.encode import AddressEncoder, address_blocks
+
+
+def test_port_number():
+    assert port_number(80) == 80
+    assert port_number('443') == 443
+    assert port_number('domain', 'udp') == 53
+    assert port_number('8/0', 'icmp') == 8 << 8
+    assert port_number('128/1', 'icmpv6') == 128 << 8 | 1
+    with pytest.raises(ValueError):
+        port_number(65536)
+    with pytest.raises(ValueError):
+        port_number('no-such-service')
+
+
+def test_proto_port():
+    assert proto_port('udp:53') == ('udp', '53')
+    assert proto_port('80') == ('tcp', '80')
+    assert proto_port(80) == ('tcp', 80)
+    assert proto_port(('icmp', '8/0')) == ('icmp', '8/0')
+
+
+def test_mac_address():
+    packed = b'\x00\x11\x22\x33\x44\x55'
+    assert mac_address('00:11:22:33:44:55') == packed
+    assert mac_address('00-11-22-33-44-55') == packed
+    assert mac_address(packed) == packed
+    with pytest.raises(ValueError):
+        mac_address('00:11:22')
+
+
+def test_split_element():
+    fields = ('ip', 'proto_port')
+    assert split_element(fields, ('10.0.0.1', 'udp', 53)) == \
+        ('10.0.0.1', ('udp', 53))
+    assert split_element(('net',), '10.0.0.0/8') == ('10.0.0.0/8',)
+    with pytest.raises(ValueError):
+        split_element(fields, ('10.0.0.1',))
+
+
+def test_address_blocks():
+    inet = AddressEncoder('inet')
+    assert address_blocks(inet, '10.0.0.1-10.0.0.3') == \
+        [(b'\x0a\x00\x00\x01', 32), (b'\x0a\x00\x00\x02', 31)]
+    assert address_blocks(inet, '10.0.0.1/24') == [(b'\x0a\x00\x00\x00', 24)]
+    for item in ('10.0.0.3-10.0.0.1', '10.0.0.0/33', 'bad'):
+        with pytest.raises(ValueError):
+            address_blocks(inet, item)
+    with pytest.raises(ValueError):
+        address_blocks(AddressEncoder('inet6'), '::1-::3')
+
+
+def test_memory_takes_libipset_syntax(make_set):
+    ipset = make_set('ranges')
+    ipset.add('10.0.0.1-10.0.0.3')
+    assert sorted(ipset.iter_elements()) == \
+        ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert ipset.test('10.0.0.1-10.0.0.2')
+    ipset.remove('10.0.0.2-10.0.0.3')
+    assert sorted(ipset.iter_elements()) == ['10.0.0.1']
+
+    nets = make_set('networks', set_type='hash:net')
+    nets.add('192.168.1.7/24')
+    assert list(nets.iter_elements()) == ['192.168.1.0/24']
+
+    ipv6 = make_set('ranges6', set_family='inet6')
+    with pytest.raises(IPSetError):
+        ipv6.add('2001:db8::/64')
+
+
+def test_structured_elements(make_set):
+    ipset = make_set('ports', set_type='hash:ip,port')
+    ipset.add(('10.0.0.1', 'udp', 53))
+    ipset.add('10.0.0.2,tcp:80')
+    ipset.add(('10.0.0.3', 'icmp:8/0'))
+    assert sorted(ipset.iter_elements()) == \
+        ['10.0.0.1,udp:53', '10.0.0.2,tcp:80', '10.0.0.3,icmp:8/0']
+    assert ipset.test('10.0.0.1,udp:53')
+    assert not ipset.test(('10.0.0.1', 'tcp', 53))
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import ipaddress
+import pytest
+from ipset.encode import AddressEncoder
+
+
+@pytest.fixture
+def inet():
+    return AddressEncoder('inet')
+
+
+@pytest.mark.parametrize('item', [
+    '10.0.0.1',
+    0x0a000001,
+    b'\x0a\x00\x00\x01',
+    ipaddress.IPv4Address('10.0.0.1'),
+    ('10.0.0.1', 32),
+])
+def test_address_forms(inet, item):
+    assert inet.pack(item) == (b'\x0a\x00\x00\x01', 32)
+
+
+def test_networks(inet):
+    assert inet.pack('10.0.0.0/8') == (b'\x0a\x00\x00\x00', 8)
+    assert inet.pack(ipaddress.IPv4Network('10.0.0.0/8')) == \
+        (b'\x0a\x00\x00\x00', 8)
+    assert inet.unpack(b'\x0a\x00\x00\x00', 8) == '10.0.0.0/8'
+    assert inet.unpack(b'\x0a\x00\x00\x01', 32) == '10.0.0.1'
+
+
+def test_ipv6():
+    inet6 = AddressEncoder('inet6')
+    packed, prefix = inet6.pack('2001:db8::/32')
+    assert prefix == 32
+    assert inet6.unpack(packed, prefix) == '2001:db8::/32'
+    assert inet6.pack(2 ** 128 - 1)[0] == b'\xff' * 16
+
+
+@pytest.mark.parametrize('item', [
+    'bad', '10.0.0.1/33', '10.0.0.1/8', '::1', -1, 2 ** 32, b'\x00',
+    ipaddress.IPv6Address('::1'),
+])
+def test_malformed(inet, item):
+    with pytest.raises(ValueError):
+        inet.pack(item)
+
+
+@pytest.mark.parametrize('item', [None, True, 1.5])
+def test_wrong_type(inet, item):
+    with pytest.raises(TypeError):
+        inet.pack(item)
+
+
+def test_unknown_family():
+    with pytest.raises(ValueError):
+        AddressEncoder('inet7')
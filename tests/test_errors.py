@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.common import IPSetError
+
+
+def elements(ipset):
+    return sorted(ipset.iter_elements())
+
+
+def test_add_many_stops_at_malformed(make_set):
+    ipset = make_set('bulk')
+    with pytest.raises(IPSetError):
+        ipset.add_many(['10.0.0.1', 'bad', '10.0.0.2'])
+    assert elements(ipset) == ['10.0.0.1']
+
+
+def test_add_many_keep_going(make_set):
+    ipset = make_set('bulk', ignore_existing=False, maxelem=3)
+    ipset.add('10.0.0.1')
+    result = ipset.add_many(['10.0.0.1', 'bad', '10.0.0.2', None,
+                             '10.0.0.3', '10.0.0.4'], keep_going=True)
+    assert [failure.lineno for failure in result.failures] == [1, 2, 4, 6]
+    assert 'already added' in result.failures[0].message
+    assert result.failures[1].item == 'bad'
+    assert 'full' in result.failures[3].message
+    assert result.applied == 2
+    assert elements(ipset) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+
+
+def test_error_carries_failures(make_set):
+    ipset = make_set('bulk', ignore_existing=False)
+    ipset.add('10.0.0.1')
+    with pytest.raises(IPSetError) as excinfo:
+        ipset.add_many(['10.0.0.2', '10.0.0.1'])
+    error = excinfo.value
+    assert (error.set_name, error.command) == ('bulk', 'add')
+    assert [failure.lineno for failure in error.failures] == [2]
+    assert error.result.failures == error.failures
+
+
+def test_remove_many_keep_going(make_set):
+    ipset = make_set('bulk')
+    ipset.add_many(['10.0.0.1', '10.0.0.2'])
+    result = ipset.remove_many(['10.0.0.1', '10.0.0.9'], keep_going=True)
+    assert [failure.lineno for failure in result.failures] == [2]
+    assert elements(ipset) == ['10.0.0.2']
+
+
+def test_hash_ip_rejects_ipv6_networks(make_set):
+    ipset = make_set('six', set_family='inet6')
+    result = ipset.add_many(['2001:db8::1', '2001:db8::/126'],
+                            keep_going=True)
+    assert [failure.lineno for failure in result.failures] == [2]
+    assert elements(ipset) == ['2001:db8::1']
+
+
+def test_mirror_only_takes_applied_elements(make_set):
+    ipset = make_set('mirrored', ignore_existing=False, maxelem=2)
+    ipset.enable_mirror()
+    ipset.add_many(['10.0.0.1', 'bad', '10.0.0.2', '10.0.0.3'],
+                   keep_going=True)
+    assert not ipset.mirror.stale
+    assert len(ipset.mirror) == 2
+    assert not ipset.test('10.0.0.3')
+
+
+class FakeLib(object):
+    """A session that reports either a warning or an error."""
+
+    def __init__(self, warning=None, error=None):
+        self.warning = warning
+        self.error = error
+        self.resets = 0
+
+    def ipset_session_error(self, s):
+        return self.error
+
+    def ipset_session_warning(self, s):
+        return self.warning
+
+    def ipset_session_report_reset(self, s):
+        self.resets += 1
+        self.warning = self.error = None
+
+
+class FakeFFI(object):
+
+    NULL = None
+
+    @staticmethod
+    def string(text):
+        return text
+
+
+@pytest.fixture
+def libipset(monkeypatch):
+    pytest.importorskip('ipset.libipset.ipset')
+    from ipset.backends import libipset
+    monkeypatch.setattr(libipset, 'ffi', FakeFFI)
+    return libipset
+
+
+def test_libipset_test_only_misses_on_warning(libipset, monkeypatch):
+    fake = FakeLib(warning=b'10.0.0.1 is NOT in set blocked.')
+    monkeypatch.setattr(libipset, 'lib', fake)
+    assert libipset._tested(None, 0)
+    assert not libipset._tested(None, -1)
+    assert fake.resets == 1
+
+    fake = FakeLib(error=b'The set with the given name does not exist')
+    monkeypatch.setattr(libipset, 'lib', fake)
+    with pytest.raises(IPSetError) as excinfo:
+        libipset._tested(None, -1, 'blocked')
+    assert (excinfo.value.set_name, excinfo.value.command) == \
+        ('blocked', 'test')
+    assert 'does not exist' in excinfo.value.message
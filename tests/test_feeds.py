@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.feeds import load_feeds, normalize, parse_shard, shards
+
+FEED = b'''\
+# blocklist
+10.0.0.1
+10.0.0.0/8 ; comment
+bad
+10.0.0.1
+
+192.168.1.7/24
+'''
+
+
+@pytest.fixture
+def feed(tmp_path):
+    path = tmp_path / 'feed.txt'
+    path.write_bytes(FEED)
+    return str(path)
+
+
+def records(shard):
+    size = 5
+    return [shard.records[i:i + size]
+            for i in range(0, len(shard.records), size)]
+
+
+def test_parse_shard(feed):
+    shard = parse_shard((feed, 0, len(FEED)))
+    assert shard.lines == 7
+    assert (shard.duplicates, shard.invalid) == (1, 1)
+    assert records(shard) == [b'\x0a\x00\x00\x01\x20', b'\x0a\x00\x00\x00\x08',
+                              b'\xc0\xa8\x01\x00\x18']
+    assert shard.errors == [(4, 'bad', "'bad' is not a valid address")]
+
+
+def test_parse_shard_strict(feed):
+    shard = parse_shard((feed, 0, len(FEED)), strict=True)
+    assert shard.invalid == 2
+    assert [lineno for lineno, _, _ in shard.errors] == [4, 7]
+
+
+def test_parse_shard_max_errors(feed):
+    shard = parse_shard((feed, 0, len(FEED)), strict=True, max_errors=1)
+    assert shard.invalid == 2
+    assert len(shard.errors) == 1
+
+
+def test_shard_boundaries(tmp_path):
+    path = tmp_path / 'feed.txt'
+    path.write_bytes(b'10.0.0.1\n10.0.0.2\n10.0.0.3')
+    path = str(path)
+    # The second line starts in the first shard, so it is parsed there.
+    first = parse_shard((path, 0, 10))
+    second = parse_shard((path, 10, 20))
+    third = parse_shard((path, 20, 26))
+    assert (first.lines, second.lines, third.lines) == (2, 1, 0)
+    assert records(first) == [b'\x0a\x00\x00\x01\x20', b'\x0a\x00\x00\x02\x20']
+    assert records(second) == [b'\x0a\x00\x00\x03\x20']
+    assert (third.records, third.errors) == (b'', [])
+
+
+def test_shards(tmp_path, feed):
+    empty = tmp_path / 'empty.txt'
+    empty.write_bytes(b'')
+    assert list(shards([feed, str(empty)], shard_size=20)) == \
+        [(feed, 0, 20), (feed, 20, 40), (feed, 40, 60), (feed, 60, len(FEED))]
+
+
+def test_normalize_covers_every_line(feed):
+    parsed = list(normalize([feed], workers=0, shard_size=8))
+    assert sum(shard.lines for shard in parsed) == 7
+    assert [shard.start for shard in parsed] == \
+        list(range(0, len(FEED), 8))
+
+
+def test_load_feeds(make_set, tmp_path, feed):
+    other = tmp_path / 'other.txt'
+    other.write_bytes(b'10.0.0.1\nworse\n')
+    ipset = make_set('feeds', set_type='hash:net')
+    result = load_feeds(ipset, [feed, str(other)], workers=0, shard_size=8,
+                        dedupe=True)
+    assert result.lines == 9
+    assert (result.invalid, result.records) == (2, 3)
+    assert result.duplicates == 2
+    assert [error[:3] for error in result.errors] == \
+        [(feed, 4, 'bad'), (str(other), 2, 'worse')]
+    assert sorted(ipset.iter_elements()) == \
+        ['10.0.0.0/8', '10.0.0.1', '192.168.1.0/24']
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import xml.etree.ElementTree as ET
+import pytest
+from ipset.common import SetHeader
+
+
+def test_len_counts_entries(make_set):
+    ipset = make_set('counted')
+    assert len(ipset) == 0
+    assert ipset
+    ipset.add_many(['10.0.0.1', '10.0.0.2'])
+    assert len(ipset) == 2
+
+
+def test_len_without_numentries(make_set, monkeypatch):
+    ipset = make_set('counted')
+    ipset.add_many(['10.0.0.1', '10.0.0.2'])
+    header = SetHeader('counted', 'hash:ip', family='inet')
+    monkeypatch.setattr(ipset.backend, 'header', lambda ipset: header)
+    assert len(ipset) == 2
+
+
+def test_header_fields(make_set):
+    ipset = make_set('described', timeout=60, counters=True,
+                     hashsize=4096, maxelem=10)
+    header = ipset.header()
+    assert (header.name, header.type, header.family) == \
+        ('described', 'hash:ip', 'inet')
+    assert (ipset.hashsize, ipset.maxelem, ipset.timeout) == (4096, 10, 60)
+    assert header.counters and not header.comment and not header.forceadd
+    assert ipset.references == 0
+    memsize = ipset.memsize
+    ipset.add('10.0.0.1')
+    assert ipset.memsize > memsize
+
+
+def test_hash_options_need_a_hash_type(make_set):
+    with pytest.raises(ValueError):
+        make_set('bitmap', set_type='bitmap:port', hashsize=1024)
+    with pytest.raises(ValueError):
+        make_set('negative', timeout=-1)
+
+
+def test_header_from_xml():
+    node = ET.fromstring(
+        '<ipset name="parsed"><type>hash:net</type><revision>7</revision>'
+        '<header><family>inet6</family><hashsize>1024</hashsize>'
+        '<maxelem>65536</maxelem><memsize>1400</memsize>'
+        '<references>1</references><numentries>3</numentries>'
+        '<comment/></header></ipset>')
+    header = SetHeader.from_xml(node)
+    assert (header.name, header.type, header.revision, header.family) == \
+        ('parsed', 'hash:net', 7, 'inet6')
+    assert (header.entries, header.memsize, header.references) == (3, 1400, 1)
+    assert header.comment and not header.counters
+    assert header.timeout is None
+
+
+def test_header_from_xml_without_header():
+    header = SetHeader.from_xml(ET.fromstring(
+        '<ipset name="bare"><type>list:set</type></ipset>'))
+    assert header.family is None
+    assert header.entries is None
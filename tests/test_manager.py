@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.backends.memory import MemoryBackend
+from ipset.common import IPSetError
+from ipset.manager import IPSetManager
+
+
+class CountingBackend(MemoryBackend):
+    """Counts listings, and can list headers without a family."""
+
+    def __init__(self, family=True):
+        super(CountingBackend, self).__init__()
+        self.listings = 0
+        self.family = family
+
+    def headers(self):
+        self.listings += 1
+        headers = super(CountingBackend, self).headers()
+        if not self.family:
+            for header in headers:
+                header.family = None
+        return headers
+
+
+@pytest.fixture
+def manager():
+    return IPSetManager(backend=CountingBackend())
+
+
+def test_headers_are_cached(manager):
+    backend = manager.backend
+    manager.create('first')
+    manager.create('second', set_type='hash:net')
+    assert sorted(manager.names()) == ['first', 'second']
+    assert 'first' in manager and 'third' not in manager
+    assert len(manager) == 2
+    assert manager.header('second').type == 'hash:net'
+    assert backend.listings == 1
+    with pytest.raises(KeyError):
+        manager.header('third')
+
+    manager.invalidate()
+    assert sorted(manager) == ['first', 'second']
+    assert backend.listings == 2
+
+
+def test_create_adds_a_header(manager):
+    manager.refresh()
+    manager.create('timed', timeout=60, counters=True)
+    header = manager.header('timed')
+    assert (header.type, header.family, header.timeout) == \
+        ('hash:ip', 'inet', 60)
+    assert header.counters and header.entries == 0
+    assert manager.backend.listings == 1
+
+
+def test_get_carries_options(manager):
+    manager.create('timed', set_family='inet6', timeout=60, counters=True,
+                   maxelem=100)
+    manager.refresh()
+    ipset = manager.get('timed')
+    assert (ipset.type, ipset.family) == ('hash:ip', 'inet6')
+    assert ipset.create_options['timeout'] == 60
+    assert ipset.create_options['maxelem'] == 100
+    assert ipset.create_options['counters']
+    ipset.add('2001:db8::1')
+    assert manager.get('timed', ignore_existing=False).test('2001:db8::1')
+
+
+def test_get_defaults_the_family():
+    manager = IPSetManager(backend=CountingBackend(family=False))
+    manager.create('bare')
+    manager.refresh()
+    assert manager.header('bare').family is None
+    ipset = manager.get('bare')
+    assert ipset.family == 'inet'
+    ipset.add('10.0.0.1')
+    assert ipset.test('10.0.0.1')
+
+
+def test_rename_destroy_and_flush(manager):
+    manager.create('old').add('10.0.0.1')
+    manager.create('other')
+    manager.rename({'old': 'new'})
+    assert sorted(manager.names()) == ['new', 'other']
+    assert manager.header('new').name == 'new'
+
+    with pytest.raises(IPSetError):
+        manager.rename([('other', 'new')])
+    assert manager.stale
+
+    manager.flush(['new'])
+    assert manager.stale
+    assert manager.header('new').entries == 0
+
+    manager.destroy(['new', 'other'])
+    assert manager.names() == []
+    with pytest.raises(IPSetError):
+        manager.destroy(['new'])
+    assert manager.stale
+
+
+def test_max_age(monkeypatch):
+    from ipset import manager as manager_module
+    now = [100.0]
+    monkeypatch.setattr(manager_module.time, 'monotonic', lambda: now[0])
+    manager = IPSetManager(backend=CountingBackend(), max_age=10)
+    manager.names()
+    now[0] += 5
+    manager.names()
+    assert manager.backend.listings == 1
+    now[0] += 6
+    manager.names()
+    assert manager.backend.listings == 2
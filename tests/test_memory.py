@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.common import IPSetError
+from ipset.wrapper import IPSet
+
+
+def test_existing_elements(make_set):
+    strict = make_set('strict', ignore_existing=False)
+    strict.add('10.0.0.1')
+    with pytest.raises(IPSetError):
+        strict.add('10.0.0.1')
+    strict.remove('10.0.0.1')
+    with pytest.raises(IPSetError):
+        strict.remove('10.0.0.1')
+
+    lenient = make_set('lenient')
+    lenient.add('10.0.0.1')
+    lenient.add('10.0.0.1')
+    assert len(lenient) == 1
+
+
+def test_create_checks_parameters(make_set):
+    make_set('existing', hashsize=1024, timeout=60)
+    # The hashsize grows with the set, so it need not match.
+    make_set('existing', hashsize=4096, timeout=60)
+    with pytest.raises(IPSetError):
+        make_set('existing', timeout=30)
+    with pytest.raises(IPSetError):
+        make_set('existing', set_type='hash:net', timeout=60)
+    with pytest.raises(IPSetError):
+        make_set('existing', timeout=60, ignore_existing=False)
+
+
+def test_swap_needs_matching_types(make_set):
+    first = make_set('first')
+    first.add('10.0.0.1')
+    second = make_set('second')
+    IPSet.swap(first, second)
+    assert not first.test('10.0.0.1')
+    assert second.test('10.0.0.1')
+    with pytest.raises(IPSetError):
+        IPSet.swap(first, make_set('nets', set_type='hash:net'))
+
+
+def test_hash_ip_expands_ranges(make_set):
+    ipset = make_set('expanded')
+    ipset.add('10.0.0.0/30')
+    assert len(ipset) == 4
+    masked = make_set('masked', netmask=24)
+    masked.add_many(['10.0.0.1', '10.0.0.2'])
+    assert list(masked.iter_elements()) == ['10.0.0.0']
+    with pytest.raises(IPSetError):
+        make_set('expanded6', set_family='inet6').add('2001:db8::/126')
+
+
+def test_host_matches_networks(make_set):
+    ipset = make_set('networks', set_type='hash:net')
+    ipset.add_many(['10.0.0.0/8', '10.1.0.0/16'])
+    assert ipset.test('10.1.2.3')
+    ipset.remove('10.0.0.0/8')
+    assert ipset.test('10.1.2.3')
+    assert not ipset.test('10.2.0.1')
+
+
+def test_hash_full(make_set):
+    full = make_set('full', maxelem=2)
+    full.add_many(['10.0.0.1', '10.0.0.2'])
+    with pytest.raises(IPSetError):
+        full.add('10.0.0.3')
+
+    forced = make_set('forced', maxelem=2, forceadd=True)
+    forced.add_many(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+    assert len(forced) == 2
+    assert forced.test('10.0.0.3')
+
+
+def test_rename_and_destroy(backend, make_set):
+    ipset = make_set('old')
+    make_set('taken')
+    with pytest.raises(IPSetError):
+        ipset.rename('taken')
+    ipset.rename('new')
+    assert sorted(header.name for header in backend.headers()) == \
+        ['new', 'taken']
+    backend.destroy_sets(['new', 'taken'])
+    assert backend.headers() == []
+    with pytest.raises(IPSetError):
+        backend.destroy_sets(['new'])
+
+
+def test_flush_sets(backend, make_set):
+    ipset = make_set('flushed', set_type='hash:net')
+    ipset.add('10.0.0.0/8')
+    ipset.flush()
+    assert len(ipset) == 0
+    assert not ipset.test('10.0.0.1')
+
+
+def test_latency(monkeypatch):
+    from ipset.backends import memory
+    sleeps = []
+    monkeypatch.setattr(memory.time, 'sleep', sleeps.append)
+    backend = memory.MemoryBackend(latency=0.5)
+    ipset = IPSet('slow', backend=backend)
+    ipset.add_many(['10.0.0.{i}'.format(i=i) for i in range(5)],
+                   batch_size=2)
+    ipset.test('10.0.0.1')
+    # create, three batches and a test.
+    assert sleeps == [0.5] * 5
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+from ipset import metrics as metrics_module
+from ipset.metrics import BUCKETS, Histogram, Metrics
+
+
+def test_histogram():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    for value in (2e-6, 2e-6, 3e-3, 20.0):
+        histogram.observe(value)
+    assert histogram.count == 4
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == 2.5e-6
+    assert histogram.quantile(0.75) == 5e-3
+    assert histogram.quantile(1) == float('inf')
+
+
+def test_phase_only_times_when_enabled(monkeypatch):
+    metrics = Metrics()
+    with metrics.phase('blocked', 'cmd'):
+        pass
+    assert metrics.histogram('blocked', 'cmd') is None
+
+    ticks = iter([1.0, 1.25])
+    monkeypatch.setattr(metrics_module, 'clock', lambda: next(ticks))
+    metrics.enable()
+    with metrics.phase('blocked', 'cmd'):
+        pass
+    histogram = metrics.histogram('blocked', 'cmd')
+    assert (histogram.count, histogram.sum) == (1, 0.25)
+
+
+def test_prometheus():
+    metrics = Metrics()
+    assert metrics.prometheus() == ''
+
+    metrics.observe('blocked', 'cmd', 2e-6)
+    metrics.observe('blocked', 'cmd', 3e-3)
+    metrics.observe(None, 'session', 1e-6)
+    metrics.count('blocked', 'elements', 5, command='add')
+    metrics.count('blocked', 'elements', 2, command='add')
+    metrics.count('say "hi"', 'commands')
+    lines = metrics.prometheus().splitlines()
+
+    assert lines[:2] == [
+        '# HELP ipset_phase_seconds Time spent per command phase.',
+        '# TYPE ipset_phase_seconds histogram',
+    ]
+    cmd = [line for line in lines if 'phase="cmd"' in line]
+    assert len(cmd) == len(BUCKETS) + 3
+    assert 'ipset_phase_seconds_bucket{le="1e-06",phase="cmd",' \
+        'set="blocked"} 0' in cmd
+    assert 'ipset_phase_seconds_bucket{le="2.5e-06",phase="cmd",' \
+        'set="blocked"} 1' in cmd
+    assert 'ipset_phase_seconds_bucket{le="+Inf",phase="cmd",' \
+        'set="blocked"} 2' in cmd
+    assert 'ipset_phase_seconds_sum{phase="cmd",set="blocked"} ' + \
+        repr(2e-6 + 3e-3) in cmd
+    assert 'ipset_phase_seconds_count{phase="cmd",set="blocked"} 2' in cmd
+    assert 'ipset_phase_seconds_count{phase="session"} 1' in lines
+
+    assert lines.count('# TYPE ipset_elements_total counter') == 1
+    assert 'ipset_elements_total{command="add",set="blocked"} 7' in lines
+    assert 'ipset_commands_total{set="say \\"hi\\""} 1' in lines
+
+
+def test_reset():
+    metrics = Metrics()
+    metrics.observe('blocked', 'cmd', 1.0)
+    metrics.count('blocked', 'commands')
+    metrics.reset()
+    assert metrics.snapshot() == {'histograms': [], 'counters': []}
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.mirror import _MERGE_MIN, _Records
+
+
+def test_mirror_follows_bulk_updates(make_set):
+    ipset = make_set('mirrored')
+    ipset.add('10.0.0.1')
+    ipset.enable_mirror()
+    ipset.add_many(['10.0.0.2', 'bad', '10.0.1.0/30'], keep_going=True)
+    mirror = ipset.mirror
+    assert not mirror.stale
+    assert ipset.test('10.0.0.2')
+    assert ipset.test('10.0.1.3')
+    assert not ipset.test('10.0.0.9')
+
+    ipset.remove_many(['10.0.0.1', '10.0.0.9'], keep_going=True)
+    assert not mirror.stale
+    assert not ipset.test('10.0.0.1')
+    assert ipset.test('10.0.0.2')
+
+
+def test_mirror_matches_networks(make_set):
+    ipset = make_set('mirrored', set_type='hash:net')
+    ipset.add_many(['10.0.0.0/8', '192.168.1.0/24'])
+    ipset.enable_mirror()
+    assert ipset.test('10.20.30.40')
+    assert ipset.test('192.168.1.255')
+    assert not ipset.test('192.168.2.1')
+
+
+@pytest.mark.parametrize('query', ['10.0.0.0/30', '10.0.0.0/29',
+                                   '10.0.0.2', '10.0.0.9'])
+def test_mirror_answers_like_the_backend(make_set, query):
+    ipset = make_set('mirrored')
+    ipset.add_many(['10.0.0.0/30', '10.0.0.9'])
+    expected = ipset.test(query)
+    ipset.enable_mirror()
+    assert ipset.test(query) == expected
+
+
+def test_mirror_applies_netmask(make_set):
+    ipset = make_set('masked', netmask=24)
+    ipset.add('10.0.0.1')
+    ipset.enable_mirror()
+    assert ipset.test('10.0.0.200')
+    assert not ipset.test('10.0.1.1')
+
+
+def test_ipv6_tables_are_packed(make_set):
+    ipset = make_set('mirrored6', set_type='hash:net', set_family='inet6')
+    ipset.add_many(['2001:db8::/32', '2001:db8:1::1'])
+    ipset.enable_mirror()
+    tables = ipset.mirror._tables
+    assert all(isinstance(table, _Records) for table in tables.values())
+    assert ipset.test('2001:db8:ffff::1')
+    assert not ipset.test('2001:db9::1')
+    ipset.remove('2001:db8::/32')
+    assert not ipset.test('2001:db8:ffff::1')
+    assert ipset.test('2001:db8:1::1')
+
+
+def test_records():
+    records = _Records([1, 3])
+    records.insert(1, 2 ** 128 - 1)
+    assert list(records) == [1, 2 ** 128 - 1, 3]
+    del records[0]
+    assert len(records) == 2
+    assert records[1] == 3
+    with pytest.raises(IndexError):
+        records[2]
+
+
+@pytest.mark.parametrize('family, fmt', [('inet', '10.1.{hi}.{lo}'),
+                                         ('inet6', '2001:db8::{hi}:{lo}')])
+def test_large_merges(make_set, family, fmt):
+    ipset = make_set('merged', set_family=family)
+    ipset.add(fmt.format(hi=9, lo=9))
+    ipset.enable_mirror()
+    items = [fmt.format(hi=hi, lo=lo)
+             for hi in range(3) for lo in range(_MERGE_MIN)]
+    ipset.add_many(items)
+    assert len(ipset.mirror) == len(items) + 1
+    assert all(ipset.test(item) for item in items)
+    ipset.remove_many(items[::2])
+    assert len(ipset.mirror) == len(items) // 2 + 1
+    assert not ipset.test(items[0])
+    assert ipset.test(items[1])
+    assert ipset.test(fmt.format(hi=9, lo=9))
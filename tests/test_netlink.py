@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import struct
+import pytest
+
+pytest.importorskip('ipset.libipset.ipset')
+from ipset.backends import netlink
+from ipset.backends.netlink import _HEADER, _Template
+
+# nfgenmsg: family, version and resource id.
+_NFGEN_SIZE = 4
+
+
+def attributes(message, start, end):
+    """Yield (type, payload offset, payload length) for each attribute."""
+    while start < end:
+        length, attr_type = struct.unpack_from("=HH", message, start)
+        yield attr_type & 0x3fff, start + 4, length - 4
+        start += (length + 3) & ~3
+
+
+def find(message, start, end, attr_type):
+    for found, offset, length in attributes(message, start, end):
+        if found == attr_type:
+            return offset, length
+    raise AssertionError('attribute {t} not found'.format(t=attr_type))
+
+
+@pytest.mark.parametrize('family, size, addr_attr', [
+    ('inet', 4, netlink.IPSET_ATTR_IPADDR_IPV4),
+    ('inet6', 16, netlink.IPSET_ATTR_IPADDR_IPV6),
+])
+@pytest.mark.parametrize('cidr', [False, True])
+def test_template_offsets(family, size, addr_attr, cidr):
+    template = _Template(netlink.IPSET_CMD_ADD, netlink.NLM_F_REQUEST,
+                         family, 'blocked', size, cidr)
+    message = template.message
+    length, msg_type = struct.unpack_from("=IH", message)
+    assert length == len(message)
+    assert msg_type == netlink.NFNL_SUBSYS_IPSET << 8 | netlink.IPSET_CMD_ADD
+
+    start = _HEADER.size + _NFGEN_SIZE
+    name, _ = find(message, start, len(message), netlink.IPSET_ATTR_SETNAME)
+    assert message[name:name + 8] == b'blocked\0'
+    data, data_len = find(message, start, len(message),
+                          netlink.IPSET_ATTR_DATA)
+    ip, ip_len = find(message, data, data + data_len, netlink.IPSET_ATTR_IP)
+    addr, addr_len = find(message, ip, ip + ip_len, addr_attr)
+    assert (template.addr_offset, addr_len) == (addr, size)
+
+    if cidr:
+        offset, cidr_len = find(message, data, data + data_len,
+                                netlink.IPSET_ATTR_CIDR)
+        assert (template.cidr_offset, cidr_len) == (offset, 1)
+    else:
+        assert template.cidr_offset is None
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import threading
+import pytest
+
+pytest.importorskip('ipset.libipset.ipset')
+from ipset import pool as pool_module
+from ipset.common import IPSetError
+from ipset.pool import SessionPool
+
+
+class FakeLib(object):
+    """Just enough of libipset for the pool to open and close sessions."""
+
+    IPSET_LIST_NONE = 0
+    printf = None
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = []
+
+    def ipset_load_types(self):
+        pass
+
+    def ipset_session_init(self, outfn):
+        self.opened += 1
+        return object()
+
+    def ipset_session_fini(self, s):
+        self.closed.append(s)
+
+    def ipset_envopt_parse(self, s, flag, arg):
+        pass
+
+    def ipset_session_data(self, s):
+        return s
+
+    def ipset_data_reset(self, data):
+        pass
+
+    def ipset_session_report_reset(self, s):
+        pass
+
+    def ipset_session_output(self, s, mode):
+        pass
+
+    def ipset_session_outfn(self, s, outfn):
+        pass
+
+
+class FakeFFI(object):
+    NULL = None
+
+
+@pytest.fixture
+def lib(monkeypatch):
+    lib = FakeLib()
+    monkeypatch.setattr(pool_module, 'lib', lib)
+    monkeypatch.setattr(pool_module, 'ffi', FakeFFI())
+    return lib
+
+
+def test_reuses_sessions(lib):
+    pool = SessionPool()
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    assert first is second
+    assert lib.opened == 1
+
+
+def test_keeps_session_after_refused_command(lib):
+    pool = SessionPool()
+    with pytest.raises(IPSetError):
+        with pool.session() as first:
+            raise IPSetError('Element cannot be added')
+    with pool.session() as second:
+        pass
+    assert first is second
+    assert not lib.closed
+
+
+def test_discards_batched_and_broken_sessions(lib):
+    pool = SessionPool()
+    with pytest.raises(IPSetError):
+        with pool.session(batched=True) as batched:
+            raise IPSetError('Element cannot be added')
+    with pytest.raises(RuntimeError):
+        with pool.session() as broken:
+            raise RuntimeError()
+    assert lib.closed == [batched, broken]
+    with pool.session():
+        pass
+    assert lib.opened == 3
+
+
+def test_waits_at_max_open(lib):
+    pool = SessionPool(max_open=1)
+    first = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    pool.release(first)
+    waiter.join(1)
+    assert acquired == [first]
+    assert lib.opened == 1
+
+
+def test_evicts_idle_session_with_other_options(lib):
+    pool = SessionPool(max_open=1)
+    with pool.session(envopts=1) as first:
+        pass
+    with pool.session(envopts=0):
+        pass
+    assert lib.closed == [first]
+    assert lib.opened == 2
+
+
+def test_close_frees_open_slots(lib):
+    pool = SessionPool(max_open=1)
+    with pool.session():
+        pass
+    pool.close()
+    with pool.session():
+        pass
+    assert lib.opened == 2
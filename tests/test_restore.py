@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import pytest
+from ipset.manager import IPSetManager
+from ipset.restore import Restorer, RestoreError
+
+DUMP = '''\
+create blocked hash:net family inet hashsize 1024 maxelem 65536
+add blocked 10.0.0.0/8
+add blocked 192.168.1.0/24
+# a comment
+create ports hash:ip,port family inet
+add ports 10.0.0.1,tcp:80
+add ports 10.0.0.1,icmp:8/0
+'''
+
+
+@pytest.fixture
+def manager(backend):
+    return IPSetManager(backend=backend)
+
+
+def run(manager, text, **kwargs):
+    return Restorer(manager=manager, **kwargs).run(text.splitlines())
+
+
+def elements(manager, name):
+    return sorted(manager.get(name).iter_elements())
+
+
+def test_restore(manager):
+    restorer = run(manager, DUMP)
+    assert restorer.elements == 4
+    assert sorted(manager.names()) == ['blocked', 'ports']
+    assert elements(manager, 'blocked') == ['10.0.0.0/8', '192.168.1.0/24']
+    assert elements(manager, 'ports') == ['10.0.0.1,icmp:8/0',
+                                          '10.0.0.1,tcp:80']
+
+
+def test_restore_reports_line(manager):
+    with pytest.raises(RestoreError) as excinfo:
+        run(manager, 'create s hash:ip\nadd s 10.0.0.1\nadd s bad\n')
+    assert excinfo.value.lineno == 3
+
+
+def test_restore_keep_going(manager):
+    failures = []
+    restorer = run(manager, 'create s hash:ip\nadd s bad\nadd s 10.0.0.1\n',
+                   keep_going=True,
+                   on_failure=lambda *args: failures.append(args))
+    assert restorer.failed == 1
+    assert len(failures) == 1
+    assert elements(manager, 's') == ['10.0.0.1']
+
+
+def test_restore_element_options(manager):
+    text = 'create {n} hash:ip\nadd {n} 10.0.0.1 timeout 5\n'
+    with pytest.raises(RestoreError):
+        run(manager, text.format(n='strict'))
+    run(manager, text.format(n='ignored'), ignore_options=True)
+    assert elements(manager, 'ignored') == ['10.0.0.1']
+
+
+def test_restore_never_ignores_nomatch(manager):
+    text = 'create s hash:net\nadd s 10.0.0.0/8 nomatch\n'
+    with pytest.raises(RestoreError):
+        run(manager, text, ignore_options=True)
+
+
+def test_restore_ranges(manager):
+    run(manager, 'create s hash:ip\nadd s 10.0.0.1-10.0.0.3\n'
+                 'create n hash:net\nadd n 10.0.0.1-10.0.0.6\n')
+    assert elements(manager, 's') == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert elements(manager, 'n') == ['10.0.0.1', '10.0.0.2/31',
+                                      '10.0.0.4/31', '10.0.0.6']
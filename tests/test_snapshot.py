@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+from ipset.wrapper import IPSet
+
+
+def test_round_trip(make_set, backend, tmp_path):
+    path = str(tmp_path / 'set.snap')
+    source = make_set('source', set_type='hash:net', maxelem=4096)
+    source.add_many(['10.0.0.0/8', '192.168.1.0/24', '172.16.0.1'])
+    assert source.snapshot(path) == 3
+
+    restored = IPSet.restore(path, set_name='restored', backend=backend)
+    assert restored.type == 'hash:net'
+    assert restored.header().maxelem == 4096
+    assert sorted(restored.iter_elements()) == \
+        sorted(source.iter_elements())
+
+
+def test_round_trip_ipv6(make_set, backend, tmp_path):
+    path = str(tmp_path / 'set.snap')
+    source = make_set('source6', set_family='inet6')
+    source.add_many(['2001:db8::1', '::1'])
+    source.snapshot(path)
+
+    restored = IPSet.restore(path, set_name='restored6', backend=backend)
+    assert restored.family == 'inet6'
+    assert sorted(restored.iter_elements()) == ['2001:db8::1', '::1']
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+
+def elements(ipset):
+    return sorted(ipset.iter_elements())
+
+
+def test_sync_delta(make_set):
+    ipset = make_set('synced')
+    ipset.add_many('10.0.0.{}'.format(i) for i in range(1, 11))
+    wanted = ['10.0.0.{}'.format(i) for i in range(2, 12)]
+    result = ipset.sync(wanted)
+    assert not result.swapped
+    assert (result.added, result.removed, result.unchanged) == (1, 1, 9)
+    assert elements(ipset) == sorted(wanted)
+
+
+def test_sync_swap(make_set, backend):
+    ipset = make_set('synced', maxelem=1000)
+    ipset.add_many(['10.0.0.1', '10.0.0.2'])
+    wanted = ['10.1.0.{}'.format(i) for i in range(1, 6)]
+    result = ipset.sync(wanted)
+    assert result.swapped
+    assert (result.added, result.removed, result.unchanged) == (5, 2, 0)
+    assert elements(ipset) == sorted(wanted)
+    # The shadow set is gone and the create options carried over.
+    assert [header.name for header in backend.headers()] == ['synced']
+    assert ipset.header().maxelem == 1000
+
+
+def test_sync_swap_keeps_mirror(make_set):
+    ipset = make_set('synced')
+    ipset.add('10.0.0.1')
+    ipset.enable_mirror()
+    ipset.sync(['10.0.0.2', '10.0.0.3'])
+    assert ipset.test('10.0.0.2')
+    assert not ipset.test('10.0.0.1')
+
+
+def test_sync_swap_replaces_leftover_shadow(make_set, backend):
+    ipset = make_set('synced')
+    ipset.add('10.0.0.1')
+    make_set('synced-sync').add('192.168.0.1')
+    result = ipset.sync(['10.0.0.2', '10.0.0.3'])
+    assert result.swapped
+    assert elements(ipset) == ['10.0.0.2', '10.0.0.3']
+    assert [header.name for header in backend.headers()] == ['synced']
+
+
+def test_sync_swap_keeps_ignore_existing(make_set):
+    ipset = make_set('synced', counters=True)
+    ipset.add('10.0.0.1')
+    ipset.sync(['10.0.0.2', '10.0.0.3'])
+    assert ipset.ignore_existing
+    ipset.add('10.0.0.2')
+    assert ipset.header().counters